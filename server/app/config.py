@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -31,6 +31,66 @@ class Settings(BaseSettings):
     DEFAULT_LLM_API_URL: str = "https://api.deepseek.com/v1"
     DEFAULT_LLM_MODEL: str = "deepseek-chat"
     DEFAULT_LLM_API_KEY: str = ""  # 系统默认API Key，用于所有用户
+    LLM_CONTEXT_TOKEN_BUDGET: int = 2000  # 终端输出进入提示词前的压缩预算
+    LLM_HOST_FACTS_TTL: int = 3600  # 主机环境信息缓存时间（秒），连接时采集并注入系统提示词，0 表示关闭
+    LLM_AGENT_MAX_STEPS: int = 10  # 服务端 agent 循环单次任务最多调用 LLM 的轮数
+    LLM_AGENT_APPROVAL_TIMEOUT: float = 300.0  # 等待用户批准命令的时间（秒），超时视为拒绝
+
+    # 终端配置
+    TERMINAL_MAX_SESSIONS: int = 100  # 同时保持的终端会话上限，超出时淘汰最早的会话
+    TERMINAL_SCREEN_EMULATION: bool = True  # 每个会话维护服务端虚拟屏幕
+    TERMINAL_FAIR_SCHEDULING: bool = True  # 大块输出按会话轮转发送
+    TERMINAL_TEXT_OFFLOAD_THRESHOLD: int = 16384  # monitor 缓冲区超过该长度时放到执行器处理
+    TERMINAL_TEXT_WORKERS: int = 2  # 0 表示不卸载
+    TERMINAL_TEXT_EXECUTOR: str = "thread"  # thread / process（re 不释放 GIL，需要真正并行时用 process）
+    TERMINAL_MAX_VIEWERS: int = 20  # 单个共享会话的观看者上限
+    TERMINAL_VIEWER_QUEUE_SIZE: int = 256  # 每个观看者的发送队列长度（帧）
+    TERMINAL_SHARE_TOKEN_TTL: int = 3600  # 共享令牌有效期（秒）
+    TERMINAL_COMPLETION_TTL: int = 300  # 补全候选缓存时间（秒）
+    TERMINAL_COMPLETION_CACHE_SIZE: int = 256  # 补全缓存条目上限（主机 x 类别 x 目录），LRU 淘汰
+    TERMINAL_COMPLETION_HELP_COMMANDS: List[str] = [  # 选项补全时允许在远端执行 `--help` 的系统命令，其余命令不补全选项
+        "ls", "cp", "mv", "rm", "mkdir", "chmod", "chown", "ln", "cat", "head", "tail", "grep", "sort", "uniq",
+        "wc", "cut", "find", "du", "df", "ps", "tar", "curl", "wget", "ssh", "scp", "rsync", "systemctl", "journalctl",
+    ]
+    TERMINAL_TAIL_QUEUE_SIZE: int = 5000  # 日志跟踪待推送行数上限，超出丢弃并计数
+    TERMINAL_TRIGGER_COOLDOWN: float = 5.0  # 同一会话同一触发规则两次通知的最小间隔（秒）
+    TERMINAL_TRIGGER_WEBHOOK_URL: str = ""  # 触发规则命中时 POST 通知的地址，空为不发送
+    TERMINAL_COMMAND_TIMING_ENABLED: bool = True  # 记录每条被监视命令的耗时到 command_timings
+    TERMINAL_COMMAND_TIMING_FLUSH_INTERVAL: float = 5.0  # 耗时记录批量写库的间隔（秒）
+    TERMINAL_COMMAND_TIMING_BUFFER: int = 50000  # 未写库记录上限，数据库不可用时超出部分丢弃
+    TERMINAL_COMMAND_CACHE_TTL: int = 30  # 只读命令结果缓存时间（秒），0 表示关闭
+    TERMINAL_COMMAND_CACHE_SIZE: int = 1000  # 缓存条目上限（连接 x 命令），LRU 淘汰
+    TERMINAL_COMMAND_CACHE_ALLOWLIST: List[str] = [  # 可缓存的无副作用命令，按词前缀匹配
+        "df", "du", "free", "uptime", "uname", "hostname", "whoami", "id", "nproc", "lscpu", "lsblk",
+        "ps", "ls", "cat", "head", "tail -n", "grep", "wc", "stat", "which",
+        "systemctl status", "systemctl is-active", "systemctl is-enabled", "systemctl list-units",
+        "docker ps", "docker images", "ip addr show", "ip route show", "ss", "netstat",
+    ]
+    TERMINAL_PROBE_MAX_COMMANDS: int = 16  # 单批并行探测的命令数上限
+    TERMINAL_PROBE_PARALLEL: int = 8  # 同时打开的 exec 通道数（sshd 默认 MaxSessions 为 10）
+    TERMINAL_PROBE_TIMEOUT: float = 15.0  # 单条探测命令超时（秒）
+    TERMINAL_PROBE_OUTPUT_LIMIT: int = 65536  # 单条探测命令输出上限（字节），超出截断
+    TERMINAL_LOOP_LAG_INTERVAL: float = 0.5  # 事件循环调度延迟的采样间隔（秒），0 表示不采样
+    TERMINAL_REAP_INTERVAL: float = 30.0  # 空闲会话回收扫描间隔（秒），0 表示不回收
+    TERMINAL_REAP_WS_TIMEOUT: float = 120.0  # 超过该时间没有任何 WebSocket 消息（含心跳 ping）的会话视为已断开并回收，0 表示不检查
+    TERMINAL_REAP_IDLE_TIMEOUT: float = 0  # 超过该时间既无输入也无输出的会话回收（秒），0 表示不检查
+    TERMINAL_BROKER_SOCKETS: List[str] = []  # SSH broker 工作进程的 Unix socket 路径，空表示在 API 进程内直接建连
+    TERMINAL_BROKER_DETACH_TTL: float = 300.0  # API 断开后 broker 保留分离会话的时间（秒）
+    TERMINAL_OUTPUT_RATE_LIMITS: Dict[str, int] = {"admin": 0, "user": 0}  # 按角色的单会话输出上限（字节/秒，0 为不限）
+
+    # SSH 连接配置
+    SSH_DNS_CACHE_TTL: int = 60  # 主机名解析结果缓存时间（秒）
+    SSH_CONNECT_ATTEMPT_DELAY: float = 0.25  # 多地址竞速时相邻连接尝试的间隔（秒）
+    SSH_BASTION_IDLE_TTL: int = 60  # 跳板机连接在最后一个会话关闭后的保留时间（秒）
+    SSH_TRANSPORT_PROFILES: Dict[str, dict] = {}  # 追加/覆盖传输参数档案，字段同 asyncssh.connect 参数
+    SSH_WARM_POOL_TTL: int = 30  # 预热连接未被取用时的保留时间（秒），0 表示关闭预热
+    SSH_WARM_POOL_SIZE: int = 50  # 预热池最多停放的连接数
+
+    # 脱敏配置
+    REDACTION_ENABLED: bool = True  # 命令记录、命令输出、对话记录和 LLM 上下文在离开实时链路前脱敏
+    REDACTION_DETECTORS: List[str] = []  # 只启用列出的内置检测器，空表示全部
+    REDACTION_EXTRA_PATTERNS: Dict[str, str] = {}  # 追加检测器：名称 -> 正则，含 (?P<value>...) 时只掩码该部分
+    REDACTION_MIN_ENTROPY: float = 4.0  # 高熵令牌的最小香农熵（比特/字符）
 
     # 默认管理员配置
     DEFAULT_ADMIN_USERNAME: str = "admin"
@@ -42,6 +42,8 @@ async def init_db():
     from app.models.llm_config import LLMConfig, LLMProvider
     from app.models.audit_log import AuditLog
     from app.models.chat_session import ChatSession, ChatMessage
+    from app.models.trigger_rule import TriggerRule
+    from app.models.command_timing import CommandTiming
     from passlib.context import CryptContext
     from sqlalchemy import text  # 移到这里避免作用域问题
     
@@ -119,6 +121,29 @@ async def init_db():
                 pass
 
         await conn.run_sync(_ensure_sessionlog_columns)
+
+        # Ensure new columns exist in connections for existing DBs (SQLite)
+        def _ensure_connection_columns(sync_conn):
+            try:
+                res = sync_conn.execute(text("PRAGMA table_info('connections')"))
+                existing = [row[1] for row in res.fetchall()]
+            except Exception:
+                existing = []
+
+            expected = {
+                'encoding': "VARCHAR(16) DEFAULT 'utf-8'",
+                'jump_host_id': 'VARCHAR(36)',
+                'transport_profile': "VARCHAR(32) DEFAULT 'default'",
+            }
+
+            for col, coltype in expected.items():
+                if existing and col not in existing:
+                    try:
+                        sync_conn.execute(text(f'ALTER TABLE connections ADD COLUMN {col} {coltype}'))
+                    except Exception:
+                        pass
+
+        await conn.run_sync(_ensure_connection_columns)
         
         # 创建默认AI提供商
         def _create_default_providers(sync_conn):
@@ -10,8 +10,15 @@ from app.config import settings
 
 # 导入路由
 from app.routes import auth, connections, llm, sessions, users, chat
-from app.routes import chat_history
+from app.routes import chat_history, triggers, timings
 from app.ws import terminal
+from app.ws.textproc import text_pool
+from app.ws.warm_pool import warm_pool
+from app.ws.ssh_connect import bastion_pool
+from app.ws.command_timing import command_timings
+from app.ws.echo_latency import echo_latency
+from app.ws.tasks import session_reaper
+from app.ws.broker import ssh_broker
 
 # 创建限流器
 limiter = Limiter(key_func=get_remote_address)
@@ -23,6 +30,13 @@ async def lifespan(app: FastAPI):
     await init_db()
     yield
     # 关闭：清理资源
+    text_pool.shutdown()
+    warm_pool.shutdown()
+    bastion_pool.shutdown()
+    await command_timings.shutdown()
+    echo_latency.shutdown()
+    session_reaper.shutdown()
+    ssh_broker.shutdown()
     await engine.dispose()
 
 
@@ -54,6 +68,8 @@ app.include_router(llm.router, prefix="/api/llm", tags=["LLM"])
 app.include_router(sessions.router, prefix="/api/sessions", tags=["会话"])
 app.include_router(chat_history.router, prefix="/api", tags=["对话历史"])
 app.include_router(chat.router, tags=["Chat"])
+app.include_router(triggers.router, prefix="/api/triggers", tags=["触发规则"])
+app.include_router(timings.router, prefix="/api/command-timings", tags=["命令耗时"])
 app.include_router(terminal.router, prefix="/api/ws", tags=["终端"])
 
 
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Index
+import uuid
+from app.database import Base
+
+
+class CommandTiming(Base):
+    """单条命令的远端执行耗时；由终端层批量写入，量大，只追加不修改"""
+    __tablename__ = "command_timings"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    connection_id = Column(String(36), ForeignKey("connections.id", ondelete="CASCADE"), nullable=True)
+    host = Column(String(256), nullable=False)
+    # 命令族：程序名（带子命令的工具再加子命令），如 "apt update"、"systemctl restart"
+    family = Column(String(64), nullable=False)
+    command = Column(String(512), nullable=False)  # 已脱敏
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    first_output_ms = Column(Integer, nullable=True)  # 回车到第一块输出，没有输出为空
+    duration_ms = Column(Integer, nullable=False)  # 回车到 command_finished
+    bytes_out = Column(Integer, nullable=False, default=0)
+    detection = Column(String(16), nullable=False)  # prompt / idle_timeout / total_timeout / empty_timeout
+
+    __table_args__ = (
+        # 分位数查询按 (host, family) 分区、按耗时排序
+        Index("ix_command_timings_host_family", "host", "family", "duration_ms"),
+        Index("ix_command_timings_started_at", "started_at"),
+    )
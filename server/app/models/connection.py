@@ -19,6 +19,9 @@ class Connection(Base):
     password = Column(Text, nullable=True)  # 加密存储
     private_key = Column(Text, nullable=True)  # 加密存储
     passphrase = Column(Text, nullable=True)  # 加密存储
+    jump_host_id = Column(String(36), ForeignKey("connections.id", ondelete="SET NULL"), nullable=True)  # 跳板机（另一条连接记录，可链式）
+    transport_profile = Column(String(32), default="default")  # SSH 传输参数档案 default / lan / wan / high-latency / nat
+    encoding = Column(String(16), default="utf-8")  # 远端终端字符编码 utf-8 / gbk / gb18030 / latin-1
     description = Column(Text, nullable=True)
     tags = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey
+from sqlalchemy.sql import func
+import uuid
+from app.database import Base
+
+
+class TriggerRule(Base):
+    """终端输出触发规则；user_id 为空表示管理员定义的全局规则"""
+    __tablename__ = "trigger_rules"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    name = Column(String(64), nullable=False)
+    pattern = Column(String(256), nullable=False)
+    is_regex = Column(Boolean, default=False)
+    case_sensitive = Column(Boolean, default=False)
+    severity = Column(String(16), default="warning")  # info / warning / critical
+    enabled = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
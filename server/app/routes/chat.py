@@ -11,7 +11,9 @@ from app.models.user import User
 from app.models.chat_session import ChatSession, ChatMessage
 from app.routes.auth import get_current_active_user
 from app.routes.llm import generate_llm_response
-from app.schemas.llm import LLMRequest
+from app.services.context_compressor import compress_terminal_output
+from app.services.redaction import redact
+from app.schemas.llm import LLMRequest, CONTEXT_TOKEN_BUDGET_MIN, CONTEXT_TOKEN_BUDGET_MAX
 
 router = APIRouter(prefix="/api/chat", tags=["Chat"])
 
@@ -112,7 +114,7 @@ async def add_chat_message(
         session_id=session_id,
         sequence=session.message_count + 1,
         role=role,
-        content=content,
+        content=redact(content),
         message_type=message_type,
         timestamp=datetime.now(),
     )
@@ -149,11 +151,36 @@ async def chat_completions(
     messages = request_data.get("messages", [])
     if not messages:
         raise HTTPException(status_code=400, detail="messages 不能为空")
+    # 发往第三方 LLM 之前脱敏
+    messages = [{**m, "content": redact(m.get("content"))} for m in messages]
 
     # 获取 LLM 配置
-    from app.routes.llm import _get_active_config
+    from app.routes.llm import _get_active_config, _host_facts_for
     from app.config import settings
     
+    # 可选：终端输出按 token 预算压缩后再附加到对话末尾
+    compression = None
+    terminal_context = request_data.get("terminal_context")
+    if terminal_context:
+        try:
+            budget = int(request_data.get("context_token_budget") or settings.LLM_CONTEXT_TOKEN_BUDGET)
+        except (TypeError, ValueError, OverflowError):
+            budget = None
+        if budget is None or not CONTEXT_TOKEN_BUDGET_MIN <= budget <= CONTEXT_TOKEN_BUDGET_MAX:
+            raise HTTPException(
+                status_code=400,
+                detail=f"context_token_budget 必须是 {CONTEXT_TOKEN_BUDGET_MIN}-{CONTEXT_TOKEN_BUDGET_MAX} 之间的整数"
+            )
+        compression = compress_terminal_output(redact(terminal_context), budget)
+        messages = messages + [{
+            "role": "user",
+            "content": f"终端输出：\n```\n{compression['text']}\n```"
+        }]
+
+    facts = await _host_facts_for(db, current_user.id, request_data.get("connection_id"))
+    if facts:
+        messages = [{"role": "system", "content": facts}] + messages
+
     config = await _get_active_config(db, current_user.id)
     
     api_key = None
@@ -203,7 +230,10 @@ async def chat_completions(
                 detail=f"LLM API 错误: {response.text[:500]}"
             )
         
-        return response.json()
+        result = response.json()
+        if compression:
+            result["context_compression"] = {k: v for k, v in compression.items() if k != "text"}
+        return result
         
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="LLM API 请求超时")
@@ -14,6 +14,7 @@ from app.database import get_db
 from app.models.chat_session import ChatSession, ChatMessage
 from app.routes.auth import get_current_user
 from app.models.user import User
+from app.services.redaction import redact
 
 router = APIRouter(prefix="/chat-history", tags=["Chat History"])
 
@@ -282,9 +283,9 @@ async def add_message(
         session_id=session_id,
         sequence=next_seq,
         role=req.role,
-        content=req.content,
-        command=req.command,
-        command_output=req.command_output,
+        content=redact(req.content),
+        command=redact(req.command),
+        command_output=redact(req.command_output),
         command_status=req.command_status,
         ai_explanation=req.ai_explanation,
         ai_suggested_command=req.ai_suggested_command,
@@ -302,7 +303,7 @@ async def add_message(
     
     # 自动生成标题（取第一条用户消息）
     if next_seq == 1 and req.role == "user" and not session.title:
-        session.title = req.content[:100]
+        session.title = message.content[:100]
     
     await db.commit()
     await db.refresh(message)
@@ -339,9 +340,9 @@ async def add_messages_batch(
             session_id=session_id,
             sequence=next_seq + i,
             role=msg_req.role,
-            content=msg_req.content,
-            command=msg_req.command,
-            command_output=msg_req.command_output,
+            content=redact(msg_req.content),
+            command=redact(msg_req.command),
+            command_output=redact(msg_req.command_output),
             command_status=msg_req.command_status,
             ai_explanation=msg_req.ai_explanation,
             ai_suggested_command=msg_req.ai_suggested_command,
@@ -15,6 +15,9 @@ from app.schemas.connection import (
     ConnectionTestResponse
 )
 from app.routes.auth import get_current_active_user
+from app.ws.ssh_connect import MAX_JUMP_DEPTH
+from app.ws.transport_profiles import available_profiles
+from app.ws.host_facts import host_facts, FACTS_TIMEOUT
 from app.models.user import User
 
 router = APIRouter()
@@ -50,6 +53,9 @@ async def get_connections(
             auth_method=conn.auth_method or "password",
             protocol=conn.protocol or "ssh",
             group_name=conn.group_name or "default",
+            encoding=conn.encoding or "utf-8",
+            jump_host_id=conn.jump_host_id,
+            transport_profile=conn.transport_profile or "default",
             description=conn.description,
             tags=conn.tags,
             created_at=conn.created_at,
@@ -59,6 +65,14 @@ async def get_connections(
     ]
 
 
+@router.get("/transport-profiles")
+async def get_transport_profiles(
+    current_user: User = Depends(get_current_active_user)
+):
+    """可选的 SSH 传输参数档案"""
+    return available_profiles()
+
+
 @router.get("/{connection_id}", response_model=ConnectionSchema)
 async def get_connection(
     connection_id: str,
@@ -92,6 +106,9 @@ async def get_connection(
         auth_method=connection.auth_method or "password",
         protocol=connection.protocol or "ssh",
         group_name=connection.group_name or "default",
+        encoding=connection.encoding or "utf-8",
+        jump_host_id=connection.jump_host_id,
+        transport_profile=connection.transport_profile or "default",
         description=connection.description,
         tags=connection.tags,
         created_at=connection.created_at,
@@ -106,6 +123,35 @@ from typing import Any
 
 logger = logging.getLogger(__name__)
 
+
+def _validate_transport_profile(profile: str):
+    if profile not in available_profiles():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"未知的传输参数档案: {profile}")
+
+
+async def _validate_jump_host(db: AsyncSession, user_id: str, jump_host_id: str, connection_id: str = None):
+    """跳板机必须是当前用户的连接，且链上不能回到自身、不能超过最大层数"""
+    seen = {connection_id} if connection_id else set()
+    current_id = jump_host_id
+    depth = 0
+    while current_id:
+        if current_id in seen:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="跳板机配置存在循环")
+        depth += 1
+        if depth > MAX_JUMP_DEPTH:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"跳板机链超过 {MAX_JUMP_DEPTH} 层")
+        seen.add(current_id)
+        result = await db.execute(
+            select(Connection)
+            .where(Connection.id == current_id)
+            .where(Connection.user_id == user_id)
+        )
+        jump = result.scalars().one_or_none()
+        if not jump:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="跳板机连接不存在")
+        current_id = jump.jump_host_id
+
+
 @router.post("", status_code=201)
 async def create_connection(
     connection_create: ConnectionCreate,
@@ -146,6 +192,9 @@ async def create_connection(
             "password": connection_create.password,
             "private_key": connection_create.private_key,
             "auth_method": connection_create.auth_method,
+            "encoding": connection_create.encoding,
+            "jump_host_id": connection_create.jump_host_id or None,
+            "transport_profile": connection_create.transport_profile,
             "description": connection_create.description,
             "tags": connection_create.tags,
             "user_id": current_user.id
@@ -158,6 +207,10 @@ async def create_connection(
     if not (1 <= payload["port"] <= 65535):
         raise HTTPException(status_code=400, detail="Port must be between 1 and 65535")
 
+    _validate_transport_profile(payload["transport_profile"])
+    if payload["jump_host_id"]:
+        await _validate_jump_host(db, current_user.id, payload["jump_host_id"])
+
     # tags处理
     tags_val = payload.get("tags")
     if isinstance(tags_val, (list, tuple)):
@@ -175,6 +228,9 @@ async def create_connection(
             password=payload.get("password"),
             private_key=payload.get("private_key"),
             auth_method=payload.get("auth_method"),
+            encoding=payload.get("encoding"),
+            jump_host_id=payload.get("jump_host_id"),
+            transport_profile=payload.get("transport_profile"),
             description=payload.get("description"),
             tags=payload.get("tags"),
             user_id=payload.get("user_id")
@@ -197,6 +253,9 @@ async def create_connection(
         "port": new_connection.port,
         "username": new_connection.username,
         "auth_method": new_connection.auth_method,
+        "encoding": new_connection.encoding,
+        "jump_host_id": new_connection.jump_host_id,
+        "transport_profile": new_connection.transport_profile,
         "description": new_connection.description,
         "tags": new_connection.tags,
         "created_at": new_connection.created_at.isoformat() if new_connection.created_at else None,
@@ -204,6 +263,40 @@ async def create_connection(
     })
 
 
+@router.get("/{connection_id}/facts")
+async def get_connection_facts(
+    connection_id: str,
+    refresh: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """主机环境信息（连接终端时自动采集）；refresh=true 时在在线会话上重新采集"""
+    if not connection_id or len(connection_id) > 36:
+        raise HTTPException(status_code=400, detail="Invalid connection_id")
+
+    result = await db.execute(
+        select(Connection.id)
+        .where(Connection.id == connection_id)
+        .where(Connection.user_id == current_user.id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Connection not found"
+        )
+
+    if refresh:
+        host_facts.invalidate(connection_id)
+    entry = await host_facts.get(connection_id, wait=FACTS_TIMEOUT)
+    if entry is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="尚未采集主机环境信息，请先打开该连接的终端"
+        )
+    age, facts = entry
+    return {"age": round(age, 1), "facts": facts}
+
+
 @router.put("/{connection_id}", response_model=ConnectionSchema)
 async def update_connection(
     connection_id: str,
@@ -229,6 +322,8 @@ async def update_connection(
         )
 
     update_data = connection_update.model_dump(exclude_unset=True)
+    # 可能改了主机地址，缓存的环境信息作废
+    host_facts.invalidate(connection_id)
     
     # 安全过滤：不允许通过update修改user_id
     update_data.pop('user_id', None)
@@ -239,6 +334,16 @@ async def update_connection(
         if not (1 <= port <= 65535):
             raise HTTPException(status_code=400, detail="Port must be between 1 and 65535")
     
+    if update_data.get('transport_profile') is not None:
+        _validate_transport_profile(update_data['transport_profile'])
+    else:
+        update_data.pop('transport_profile', None)
+
+    if 'jump_host_id' in update_data:
+        update_data['jump_host_id'] = update_data['jump_host_id'] or None
+        if update_data['jump_host_id']:
+            await _validate_jump_host(db, current_user.id, update_data['jump_host_id'], connection.id)
+
     for field, value in update_data.items():
         if hasattr(connection, field):
             setattr(connection, field, value)
@@ -263,6 +368,9 @@ async def update_connection(
         auth_method=connection.auth_method or "password",
         protocol=connection.protocol or "ssh",
         group_name=connection.group_name or "default",
+        encoding=connection.encoding or "utf-8",
+        jump_host_id=connection.jump_host_id,
+        transport_profile=connection.transport_profile or "default",
         description=connection.description,
         tags=connection.tags,
         created_at=connection.created_at,
@@ -293,6 +401,7 @@ async def delete_connection(
             detail="Connection not found"
         )
 
+    host_facts.invalidate(connection_id)
     try:
         await db.delete(connection)
         await db.commit()
@@ -10,8 +10,15 @@ import logging
 from app.database import get_db
 from app.models.user import User
 from app.models.llm_config import LLMConfig, LLMProvider
-from app.schemas.llm import LLMRequest, LLMResponse, LLMConfigUpdate
+from app.models.connection import Connection
+from app.schemas.llm import (
+    LLMRequest, LLMResponse, LLMConfigUpdate,
+    ContextCompressRequest, ContextCompressResponse
+)
 from app.routes.auth import get_current_active_user
+from app.services.context_compressor import compress_terminal_output
+from app.services.redaction import redact
+from app.ws.host_facts import host_facts
 from app.config import settings
 
 router = APIRouter()
@@ -148,6 +155,38 @@ async def _get_active_config(db: AsyncSession, user_id: str) -> Optional[LLMConf
     return None
 
 
+async def resolve_llm_config(db: AsyncSession, user_id: str, temperature: Optional[float] = None) -> Dict[str, Any]:
+    """用户激活的配置（没有则用系统默认）转换为 generate_llm_response / complete_llm 使用的字典"""
+    config = await _get_active_config(db, user_id)
+    
+    # 构建LLM配置
+    api_key = None
+    if config and config.api_key:
+        api_key = config.api_key
+    elif hasattr(settings, 'DEFAULT_LLM_API_KEY') and settings.DEFAULT_LLM_API_KEY:
+        api_key = settings.DEFAULT_LLM_API_KEY
+    
+    return {
+        "provider": config.provider if config else settings.DEFAULT_LLM_PROVIDER,
+        "model": config.model if config else settings.DEFAULT_LLM_MODEL,
+        "api_key": api_key,
+        "base_url": (getattr(config, "api_url", "") if config else "") or getattr(settings, 'DEFAULT_LLM_API_URL', ''),
+        "temperature": (config.temperature if config else None) or temperature or 0.7
+    }
+
+
+async def _host_facts_for(db: AsyncSession, user_id: str, connection_id: Optional[str]) -> str:
+    """connection_id 属于该用户时返回缓存的主机环境摘要，否则为空"""
+    if not connection_id:
+        return ""
+    result = await db.execute(
+        select(Connection.id).where(Connection.id == connection_id, Connection.user_id == user_id)
+    )
+    if result.scalar_one_or_none() is None:
+        return ""
+    return await host_facts.prompt_section(connection_id)
+
+
 # ========== 配置 API ==========
 
 @router.get("/config", response_model=Dict[str, Any])
@@ -369,12 +408,105 @@ async def activate_llm_config(
 
 # ========== LLM 调用 ==========
 
+# 默认系统提示（AI 助手的 JSON 回复格式）
+DEFAULT_SYSTEM_PROMPT = """你是一个专业的Linux服务器运维AI助手。
+
+你的回复必须严格遵循以下JSON格式：
+{
+  "explanation": "你的自然语言解释，说明你要做什么以及为什么",
+  "command": "要执行的shell命令（如果不需要执行命令则为空字符串）",
+  "probes": [],
+  "needs_more_info": false
+}
+
+规则：
+1. 如果用户的请求需要多个步骤，每次只返回一个步骤的命令
+2. explanation 中用中文解释你的思路
+3. 如果用户只是打招呼或闲聊，command 设为空字符串
+4. 始终返回有效的JSON
+5. 排查问题需要先收集信息时，可以在 probes 中一次列出最多 MAX_PROBES 条只读诊断命令
+   （如 systemctl status nginx、df -h、free -m、ss -lntp），它们会被并行执行并把全部结果在下一轮一起发给你；
+   probes 只能放无副作用的命令，任何会修改系统的命令只能放在 command 中""".replace(
+    "MAX_PROBES", str(settings.TERMINAL_PROBE_MAX_COMMANDS)
+)
+
+
+def build_llm_request(
+    provider: str,
+    model: str,
+    api_key: str,
+    base_url: Optional[str],
+    temperature: float,
+    messages: List[Dict[str, str]],
+    stream: bool
+) -> tuple:
+    """按提供商生成 (url, headers, payload)；自定义提供商未配置 URL 时抛 ValueError"""
+    if provider == "ollama":
+        url = base_url or "http://localhost:11434/api/chat"
+        headers = {"Content-Type": "application/json"}
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": stream,
+            "options": {"temperature": temperature}
+        }
+        return url, headers, payload
+
+    # DeepSeek / OpenAI，以及默认按 OpenAI 兼容格式处理的自定义提供商
+    if base_url and base_url.strip():
+        if base_url.rstrip('/').endswith('/v1'):
+            url = base_url.rstrip('/') + '/chat/completions'
+        elif '/chat/completions' not in base_url:
+            url = base_url.rstrip('/') + '/chat/completions'
+        else:
+            url = base_url
+    elif provider == "openai":
+        url = "https://api.openai.com/v1/chat/completions"
+    elif provider == "deepseek":
+        url = "https://api.deepseek.com/v1/chat/completions"
+    else:
+        raise ValueError(f"自定义提供商 {provider} 需要配置 API URL")
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": stream
+    }
+    return url, headers, payload
+
+
+async def complete_llm(config: Dict[str, Any], messages: List[Dict[str, str]], timeout: float = 60.0) -> str:
+    """非流式调用，返回完整回复文本；失败抛 RuntimeError（服务端 agent 循环使用）"""
+    url, headers, payload = build_llm_request(
+        config.get("provider", "deepseek"), config.get("model", "deepseek-chat"), config.get("api_key"),
+        config.get("base_url"), config.get("temperature", 0.7), messages, stream=False
+    )
+    try:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.post(url, headers=headers, json=payload)
+    except httpx.HTTPError as e:
+        raise RuntimeError(f"HTTP请求失败: {e}")
+    if response.status_code != 200:
+        raise RuntimeError(f"LLM API错误 ({response.status_code}): {response.text[:500]}")
+    data = response.json()
+    if "choices" in data and data["choices"]:
+        return data["choices"][0].get("message", {}).get("content") or ""
+    # Ollama
+    return (data.get("message") or {}).get("content") or ""
+
+
 async def generate_llm_response(
     prompt: str,
     config: Dict[str, Any],
     system_prompt: str = None,
     conversation_history: List[Dict[str, str]] = None,
-    terminal_context: str = ""
+    terminal_context: str = "",
+    context_token_budget: Optional[int] = None,
+    host_facts: str = ""
 ) -> StreamingResponse:
     """生成LLM响应（流式）"""
     provider = config.get("provider", "deepseek")
@@ -389,24 +521,18 @@ async def generate_llm_response(
             detail="LLM API key is required"
         )
     
-    # 构建默认系统提示
-    default_system = """你是一个专业的Linux服务器运维AI助手。
-
-你的回复必须严格遵循以下JSON格式：
-{
-  "explanation": "你的自然语言解释，说明你要做什么以及为什么",
-  "command": "要执行的shell命令（如果不需要执行命令则为空字符串）",
-  "needs_more_info": false
-}
-
-规则：
-1. 如果用户的请求需要多个步骤，每次只返回一个步骤的命令
-2. explanation 中用中文解释你的思路
-3. 如果用户只是打招呼或闲聊，command 设为空字符串
-4. 始终返回有效的JSON"""
-
     # 使用传入的系统提示或默认
-    final_system = system_prompt if system_prompt else default_system
+    final_system = system_prompt if system_prompt else DEFAULT_SYSTEM_PROMPT
+    # 连接时采集的主机环境，省去 AI 先执行命令探测系统的几轮对话
+    if host_facts:
+        final_system = f"{final_system}\n\n{host_facts}"
+
+    # 终端输出先按 token 预算压缩再进入提示词
+    compression = None
+    if terminal_context:
+        compression = compress_terminal_output(
+            redact(terminal_context), context_token_budget or settings.LLM_CONTEXT_TOKEN_BUDGET
+        )
     
     async def stream_response():
         try:
@@ -418,83 +544,32 @@ async def generate_llm_response(
             # 构建消息列表
             messages = []
             messages.append({"role": "system", "content": final_system})
+            if compression:
+                messages.append({
+                    "role": "system",
+                    "content": f"当前终端输出：\n```\n{compression['text']}\n```"
+                })
+                stats = {k: v for k, v in compression.items() if k != "text"}
+                yield f"data: {json.dumps({'compression': stats})}\n\n"
             
             # 添加对话历史
             if conversation_history:
                 for msg in conversation_history:
                     messages.append({
                         "role": msg.get("role", "user"),
-                        "content": msg.get("content", "")
+                        "content": redact(msg.get("content", ""))
                     })
             
             # 添加当前用户输入（只添加一次）
-            messages.append({"role": "user", "content": prompt})
-            
-            # 构建请求payload
-            if provider in ("deepseek", "openai"):
-                # DeepSeek / OpenAI API - 统一处理
-                if base_url and base_url.strip():
-                    if base_url.rstrip('/').endswith('/v1'):
-                        url = base_url.rstrip('/') + '/chat/completions'
-                    elif '/chat/completions' not in base_url:
-                        url = base_url.rstrip('/') + '/chat/completions'
-                    else:
-                        url = base_url
-                else:
-                    if provider == "openai":
-                        url = "https://api.openai.com/v1/chat/completions"
-                    else:
-                        url = "https://api.deepseek.com/v1/chat/completions"
-                
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                }
-                payload = {
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "stream": True
-                }
+            messages.append({"role": "user", "content": redact(prompt)})
             
-            elif provider == "ollama":
-                # Ollama API
-                url = base_url or "http://localhost:11434/api/chat"
-                headers = {
-                    "Content-Type": "application/json"
-                }
-                payload = {
-                    "model": model,
-                    "messages": messages,
-                    "stream": True,
-                    "options": {
-                        "temperature": temperature
-                    }
-                }
-            
-            else:
-                # 对于自定义提供商，默认使用 OpenAI 兼容格式
-                if base_url and base_url.strip():
-                    if base_url.rstrip('/').endswith('/v1'):
-                        url = base_url.rstrip('/') + '/chat/completions'
-                    elif '/chat/completions' not in base_url:
-                        url = base_url.rstrip('/') + '/chat/completions'
-                    else:
-                        url = base_url
-                else:
-                    yield f"data: {json.dumps({'error': f'自定义提供商 {provider} 需要配置 API URL'})}\n\n"
-                    return
-                
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                }
-                payload = {
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "stream": True
-                }
+            try:
+                url, headers, payload = build_llm_request(
+                    provider, model, api_key, base_url, temperature, messages, stream=True
+                )
+            except ValueError as e:
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                return
             
             try:
                 async with httpx.AsyncClient() as client:
@@ -561,24 +636,7 @@ async def chat_with_llm(
     current_user: User = Depends(get_current_active_user)
 ):
     """与LLM助手聊天（SSE流式响应）- 始终使用激活的配置"""
-    # 获取用户激活的LLM配置
-    config = await _get_active_config(db, current_user.id)
-    
-    # 构建LLM配置
-    api_key = None
-    if config and config.api_key:
-        api_key = config.api_key
-    elif hasattr(settings, 'DEFAULT_LLM_API_KEY') and settings.DEFAULT_LLM_API_KEY:
-        api_key = settings.DEFAULT_LLM_API_KEY
-    
-    llm_config = {
-        "provider": config.provider if config else settings.DEFAULT_LLM_PROVIDER,
-        "model": config.model if config else settings.DEFAULT_LLM_MODEL,
-        "api_key": api_key,
-        "base_url": (getattr(config, "api_url", "") if config else "") or getattr(settings, 'DEFAULT_LLM_API_URL', ''),
-        "temperature": (config.temperature if config else None) or request.temperature or 0.7
-    }
-    
+    llm_config = await resolve_llm_config(db, current_user.id, request.temperature)
     if not llm_config["api_key"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -600,7 +658,20 @@ async def chat_with_llm(
         config=llm_config,
         system_prompt=request.system_prompt,
         conversation_history=conversation_history,
-        terminal_context=request.terminal_context or ""
+        terminal_context=request.terminal_context or "",
+        context_token_budget=request.context_token_budget,
+        host_facts=await _host_facts_for(db, current_user.id, request.connection_id)
+    )
+
+
+@router.post("/compress-context", response_model=ContextCompressResponse)
+async def compress_context(
+    request: ContextCompressRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """按 token 预算压缩终端输出，返回压缩文本和压缩率"""
+    return compress_terminal_output(
+        request.text, request.token_budget or settings.LLM_CONTEXT_TOKEN_BUDGET
     )
 
 
@@ -0,0 +1,174 @@
+"""
+命令耗时查询
+分位数在 SQL 里算：窗口函数按 (host, family) 分区、按耗时排序编号，
+再用最近秩法取第 ceil(n*p/100) 行，数据库只返回聚合后的每组一行。
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case, or_
+from typing import List, Optional
+from datetime import datetime
+
+from app.database import get_db
+from app.models.user import User
+from app.models.command_timing import CommandTiming
+from app.schemas.command_timing import CommandTimingOut, CommandTimingStat
+from app.routes.auth import get_current_active_user
+
+router = APIRouter()
+
+MAX_PERCENTILES = 8
+
+
+def _filters(
+    current_user: User,
+    user_id: Optional[str],
+    host: Optional[str],
+    family: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> list:
+    """普通用户只能看自己的记录；管理员默认看全部，可按 user_id 过滤"""
+    if current_user.role == "admin":
+        owner = user_id
+    elif user_id and user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    else:
+        owner = current_user.id
+    filters = []
+    if owner:
+        filters.append(CommandTiming.user_id == owner)
+    if host:
+        filters.append(CommandTiming.host == host)
+    if family:
+        # "apt" 同时匹配 "apt update"、"apt install" 等子命令族
+        filters.append(or_(CommandTiming.family == family, CommandTiming.family.like(f"{family} %")))
+    if since:
+        filters.append(CommandTiming.started_at >= since)
+    if until:
+        filters.append(CommandTiming.started_at < until)
+    return filters
+
+
+def _parse_percentiles(value: str) -> List[int]:
+    try:
+        percentiles = sorted({int(p) for p in value.split(",") if p.strip()})
+    except ValueError:
+        percentiles = []
+    if not percentiles or len(percentiles) > MAX_PERCENTILES or not all(1 <= p <= 100 for p in percentiles):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"percentiles 须为 1-100 的整数，逗号分隔，最多 {MAX_PERCENTILES} 个"
+        )
+    return percentiles
+
+
+@router.get("/stats", response_model=List[CommandTimingStat])
+async def get_command_timing_stats(
+    host: Optional[str] = None,
+    family: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    percentiles: str = "50,90,99",
+    min_count: int = Query(1, ge=1),
+    sort: str = Query("slowest", pattern="^(slowest|count)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """按主机和命令族聚合的耗时分位数；sort=slowest 按最高分位数降序，count 按次数降序"""
+    points = _parse_percentiles(percentiles)
+    filters = _filters(current_user, user_id, host, family, since, until)
+
+    partition = (CommandTiming.host, CommandTiming.family)
+    ranked = (
+        select(
+            CommandTiming.host,
+            CommandTiming.family,
+            CommandTiming.duration_ms,
+            CommandTiming.first_output_ms,
+            CommandTiming.bytes_out,
+            func.row_number().over(partition_by=partition, order_by=CommandTiming.duration_ms).label("rn"),
+            func.count().over(partition_by=partition).label("n"),
+        )
+        .where(*filters)
+        .subquery()
+    )
+    count = func.count().label("count")
+    percentile_columns = [
+        # 最近秩法：第 ceil(n*p/100) 行，整数运算写成 (n*p + 99) // 100
+        func.max(case((ranked.c.rn == (ranked.c.n * p + 99) // 100, ranked.c.duration_ms))).label(f"p{p}")
+        for p in points
+    ]
+    query = (
+        select(
+            ranked.c.host,
+            ranked.c.family,
+            count,
+            func.avg(ranked.c.duration_ms).label("avg_ms"),
+            func.max(ranked.c.duration_ms).label("max_ms"),
+            func.avg(ranked.c.first_output_ms).label("avg_first_output_ms"),
+            func.sum(ranked.c.bytes_out).label("total_bytes_out"),
+            *percentile_columns,
+        )
+        .group_by(ranked.c.host, ranked.c.family)
+        .having(count >= min_count)
+        .order_by(count.desc() if sort == "count" else percentile_columns[-1].desc())
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [
+        CommandTimingStat(
+            host=row.host,
+            family=row.family,
+            count=row.count,
+            avg_ms=round(float(row.avg_ms), 1),
+            max_ms=row.max_ms,
+            avg_first_output_ms=round(float(row.avg_first_output_ms), 1) if row.avg_first_output_ms is not None else None,
+            total_bytes_out=row.total_bytes_out or 0,
+            percentiles={f"p{p}": getattr(row, f"p{p}") for p in points},
+        )
+        for row in result
+    ]
+
+
+@router.get("", response_model=List[CommandTimingOut])
+async def list_command_timings(
+    host: Optional[str] = None,
+    family: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    min_duration_ms: int = Query(0, ge=0),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """单条命令的耗时记录，按开始时间倒序"""
+    filters = _filters(current_user, user_id, host, family, since, until)
+    if min_duration_ms:
+        filters.append(CommandTiming.duration_ms >= min_duration_ms)
+    query = (
+        select(CommandTiming)
+        .where(*filters)
+        .order_by(CommandTiming.started_at.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [
+        CommandTimingOut(
+            id=t.id,
+            host=t.host,
+            family=t.family,
+            command=t.command,
+            started_at=t.started_at,
+            first_output_ms=t.first_output_ms,
+            duration_ms=t.duration_ms,
+            bytes_out=t.bytes_out,
+            detection=t.detection,
+        )
+        for t in result.scalars().all()
+    ]
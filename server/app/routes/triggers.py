@@ -0,0 +1,121 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_
+from typing import List
+
+from app.database import get_db
+from app.models.trigger_rule import TriggerRule
+from app.models.user import User
+from app.schemas.trigger import TriggerRuleCreate, TriggerRuleUpdate, TriggerRuleOut
+from app.routes.auth import get_current_active_user
+from app.ws.triggers import trigger_registry, validate_pattern
+
+router = APIRouter()
+
+
+def _to_out(rule: TriggerRule) -> TriggerRuleOut:
+    return TriggerRuleOut(
+        id=rule.id,
+        name=rule.name,
+        pattern=rule.pattern,
+        is_regex=bool(rule.is_regex),
+        case_sensitive=bool(rule.case_sensitive),
+        severity=rule.severity or "warning",
+        enabled=bool(rule.enabled),
+        scope="global" if rule.user_id is None else "user",
+        created_at=rule.created_at,
+    )
+
+
+def _check_pattern(pattern: str, is_regex: bool):
+    error = validate_pattern(pattern, is_regex)
+    if error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+
+
+async def _get_editable_rule(db: AsyncSession, rule_id: str, current_user: User) -> TriggerRule:
+    """自己的规则可以修改；全局规则只有管理员可以修改"""
+    result = await db.execute(select(TriggerRule).where(TriggerRule.id == rule_id))
+    rule = result.scalars().one_or_none()
+    if not rule or (rule.user_id is not None and rule.user_id != current_user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trigger rule not found")
+    if rule.user_id is None and current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return rule
+
+
+@router.get("", response_model=List[TriggerRuleOut])
+async def list_trigger_rules(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """当前用户的触发规则及全局规则"""
+    result = await db.execute(
+        select(TriggerRule)
+        .where(or_(TriggerRule.user_id == current_user.id, TriggerRule.user_id.is_(None)))
+        .order_by(TriggerRule.created_at)
+    )
+    return [_to_out(rule) for rule in result.scalars().all()]
+
+
+@router.post("", response_model=TriggerRuleOut, status_code=201)
+async def create_trigger_rule(
+    rule_in: TriggerRuleCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """创建触发规则（全局规则需要管理员权限）"""
+    if rule_in.scope == "global" and current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    _check_pattern(rule_in.pattern, rule_in.is_regex)
+
+    rule = TriggerRule(
+        user_id=None if rule_in.scope == "global" else current_user.id,
+        name=rule_in.name,
+        pattern=rule_in.pattern,
+        is_regex=rule_in.is_regex,
+        case_sensitive=rule_in.case_sensitive,
+        severity=rule_in.severity,
+        enabled=rule_in.enabled,
+    )
+    db.add(rule)
+    await db.commit()
+    await db.refresh(rule)
+    await trigger_registry.reload(db, rule.user_id)
+    return _to_out(rule)
+
+
+@router.put("/{rule_id}", response_model=TriggerRuleOut)
+async def update_trigger_rule(
+    rule_id: str,
+    rule_update: TriggerRuleUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """修改触发规则，已连接的会话立即使用新规则"""
+    rule = await _get_editable_rule(db, rule_id, current_user)
+    update_data = rule_update.model_dump(exclude_unset=True)
+    pattern = update_data.get("pattern", rule.pattern)
+    is_regex = update_data.get("is_regex", bool(rule.is_regex))
+    _check_pattern(pattern, is_regex)
+
+    for field, value in update_data.items():
+        setattr(rule, field, value)
+    await db.commit()
+    await db.refresh(rule)
+    await trigger_registry.reload(db, rule.user_id)
+    return _to_out(rule)
+
+
+@router.delete("/{rule_id}", status_code=204)
+async def delete_trigger_rule(
+    rule_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """删除触发规则"""
+    rule = await _get_editable_rule(db, rule_id, current_user)
+    user_id = rule.user_id
+    await db.delete(rule)
+    await db.commit()
+    await trigger_registry.reload(db, user_id)
@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Dict, Optional
+
+
+class CommandTimingOut(BaseModel):
+    id: str
+    host: str
+    family: str
+    command: str
+    started_at: datetime
+    first_output_ms: Optional[int] = None
+    duration_ms: int
+    bytes_out: int
+    detection: str
+
+
+class CommandTimingStat(BaseModel):
+    """按 (主机, 命令族) 聚合的耗时分布"""
+    host: str
+    family: str
+    count: int
+    avg_ms: float
+    max_ms: int
+    avg_first_output_ms: Optional[float] = None
+    total_bytes_out: int
+    percentiles: Dict[str, int]  # "p50" -> 毫秒（最近秩法）
@@ -3,6 +3,8 @@ from uuid import UUID
 from datetime import datetime
 from typing import Optional
 
+ENCODING_PATTERN = "^(utf-8|gbk|gb18030|latin-1)$"
+
 
 class ConnectionCreate(BaseModel):
     name: str = Field(..., max_length=128)
@@ -15,6 +17,9 @@ class ConnectionCreate(BaseModel):
     password: Optional[str] = None
     private_key: Optional[str] = None
     passphrase: Optional[str] = None
+    encoding: str = Field(default="utf-8", pattern=ENCODING_PATTERN)
+    jump_host_id: Optional[str] = Field(None, max_length=36)
+    transport_profile: str = Field(default="default", max_length=32)
     description: Optional[str] = None
     tags: Optional[str] = None
 
@@ -28,6 +33,9 @@ class ConnectionOut(BaseModel):
     protocol: str
     auth_method: str
     username: str
+    encoding: str = "utf-8"
+    jump_host_id: Optional[str] = None
+    transport_profile: str = "default"
     description: Optional[str] = None
     tags: Optional[str] = None
     created_at: datetime
@@ -47,6 +55,9 @@ class ConnectionUpdate(BaseModel):
     password: Optional[str] = None
     private_key: Optional[str] = None
     passphrase: Optional[str] = None
+    encoding: Optional[str] = Field(None, pattern=ENCODING_PATTERN)
+    jump_host_id: Optional[str] = Field(None, max_length=36)
+    transport_profile: Optional[str] = Field(None, max_length=32)
     description: Optional[str] = None
     tags: Optional[str] = None
 
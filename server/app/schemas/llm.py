@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 
 
@@ -8,6 +8,11 @@ class ChatMessage(BaseModel):
     content: str
 
 
+# 终端输出压缩的 token 预算范围（LLMRequest 与 /api/chat/completions 共用）
+CONTEXT_TOKEN_BUDGET_MIN = 50
+CONTEXT_TOKEN_BUDGET_MAX = 100000
+
+
 class LLMRequest(BaseModel):
     """LLM请求模型"""
     prompt: str
@@ -15,6 +20,8 @@ class LLMRequest(BaseModel):
     system_prompt: Optional[str] = None
     conversation_history: Optional[List[ChatMessage]] = []
     terminal_context: Optional[str] = ""
+    context_token_budget: Optional[int] = Field(None, ge=CONTEXT_TOKEN_BUDGET_MIN, le=CONTEXT_TOKEN_BUDGET_MAX)
+    connection_id: Optional[str] = None  # 当前终端对应的连接，用于注入主机环境信息
 
 
 class LLMResponse(BaseModel):
@@ -32,3 +39,20 @@ class LLMConfigUpdate(BaseModel):
     temperature: Optional[float] = 0.7
     name: Optional[str] = None
     is_active: Optional[bool] = False
+
+
+class ContextCompressRequest(BaseModel):
+    """终端输出压缩请求"""
+    text: str
+    token_budget: Optional[int] = Field(None, ge=50, le=100000)
+
+
+class ContextCompressResponse(BaseModel):
+    """终端输出压缩结果"""
+    text: str
+    original_chars: int
+    compressed_chars: int
+    original_tokens: int
+    compressed_tokens: int
+    ratio: float
+    elided_lines: int
@@ -0,0 +1,31 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class TerminalShareRequest(BaseModel):
+    """终端共享请求"""
+    access: str = Field(default="ro", pattern="^(ro|rw)$")
+    ttl_seconds: Optional[int] = Field(None, ge=60, le=86400)
+
+
+class TerminalShareResponse(BaseModel):
+    """终端共享令牌"""
+    session_id: str
+    share_token: str
+    access: str
+    expires_in: int
+
+
+class LogTailSource(BaseModel):
+    """一条连接上要跟踪的日志文件"""
+    connection_id: str
+    files: List[str] = Field(..., min_length=1, max_length=20)
+
+
+class LogTailRequest(BaseModel):
+    """日志跟踪请求"""
+    sources: List[LogTailSource] = Field(..., min_length=1, max_length=10)
+    include: List[str] = Field(default=[], max_length=50)
+    exclude: List[str] = Field(default=[], max_length=50)
+    max_lines_per_second: int = Field(default=200, ge=0, le=10000)
+    backlog_lines: int = Field(default=0, ge=0, le=1000)
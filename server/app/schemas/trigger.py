@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional
+
+SEVERITY_PATTERN = "^(info|warning|critical)$"
+
+
+class TriggerRuleCreate(BaseModel):
+    """触发规则创建；scope=global 需要管理员权限"""
+    name: str = Field(..., max_length=64)
+    pattern: str = Field(..., min_length=1, max_length=256)
+    is_regex: bool = False
+    case_sensitive: bool = False
+    severity: str = Field(default="warning", pattern=SEVERITY_PATTERN)
+    enabled: bool = True
+    scope: str = Field(default="user", pattern="^(user|global)$")
+
+
+class TriggerRuleUpdate(BaseModel):
+    name: Optional[str] = Field(None, max_length=64)
+    pattern: Optional[str] = Field(None, min_length=1, max_length=256)
+    is_regex: Optional[bool] = None
+    case_sensitive: Optional[bool] = None
+    severity: Optional[str] = Field(None, pattern=SEVERITY_PATTERN)
+    enabled: Optional[bool] = None
+
+
+class TriggerRuleOut(BaseModel):
+    id: str
+    name: str
+    pattern: str
+    is_regex: bool
+    case_sensitive: bool
+    severity: str
+    enabled: bool
+    scope: str
+    created_at: Optional[datetime] = None
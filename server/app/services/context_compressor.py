@@ -0,0 +1,147 @@
+"""
+终端输出上下文压缩
+在命令输出进入 LLM 提示词之前，按 token 预算压缩：
+1. 折叠 \\r 重绘（进度条）为最终状态
+2. 连续重复行做游程编码
+3. 超出预算时保留头尾，中间用省略标记替代，但保留形似错误的行
+"""
+import re
+from typing import List, Tuple
+
+DEFAULT_TOKEN_BUDGET = 2000
+# 连续重复达到该次数才折叠（两行相同时标记反而更长）
+MIN_REPEAT_RUN = 3
+HEAD_RATIO = 0.3
+ERROR_RATIO = 0.2
+
+# 与 strip_ansi 不同，这里保留 \r 以便还原重绘
+_ANSI_RE = re.compile(
+    r'\x1b\[[0-9;?]*[a-zA-Z]'
+    r'|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)'
+    r'|\x1b[()][AB012]'
+    r'|\x1b[>=<]'
+)
+ERROR_LINE_RE = re.compile(
+    r'error|fail|fatal|exception|traceback|denied|refused|not found|no such|'
+    r'unable|cannot|can\'t|panic|segfault|killed|timed? ?out|^E: |错误|失败|异常',
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 字符/token，CJK 等约 1 字符/token"""
+    if not text:
+        return 0
+    ascii_len = len(text.encode('ascii', 'ignore'))
+    return (ascii_len + 3) // 4 + (len(text) - ascii_len)
+
+
+def collapse_carriage_returns(line: str) -> str:
+    """按终端覆盖语义还原一行中多次 \\r 重绘后的最终内容"""
+    if '\r' not in line:
+        return line
+    result = ''
+    for segment in line.split('\r'):
+        result = segment + result[len(segment):]
+    return result
+
+
+def run_length_encode(lines: List[str]) -> List[str]:
+    out = []
+    i, n = 0, len(lines)
+    while i < n:
+        j = i + 1
+        while j < n and lines[j] == lines[i]:
+            j += 1
+        run = j - i
+        if run >= MIN_REPEAT_RUN and lines[i].strip():
+            out.append(lines[i])
+            out.append(f'[上一行重复 {run - 1} 次]')
+        else:
+            out.extend(lines[i:j])
+        i = j
+    return out
+
+
+def _truncate_line(line: str, max_tokens: int) -> Tuple[str, int]:
+    tokens = estimate_tokens(line)
+    if tokens <= max_tokens:
+        return line, tokens
+    keep = max(max_tokens, 1) * len(line) // tokens
+    line = line[:keep] + '…'
+    return line, estimate_tokens(line)
+
+
+def _elide(lines: List[str], budget: int) -> Tuple[List[str], int]:
+    """保留头尾和中间的错误行，返回 (结果行, 省略行数)"""
+    max_line = max(budget // 4, 16)
+    costs = []
+    for idx, line in enumerate(lines):
+        lines[idx], cost = _truncate_line(line, max_line)
+        costs.append(cost + 1)
+
+    head_budget = int(budget * HEAD_RATIO)
+    error_budget = int(budget * ERROR_RATIO)
+    tail_budget = budget - head_budget - error_budget
+
+    head_end, used = 0, 0
+    while head_end < len(lines) and used + costs[head_end] <= head_budget:
+        used += costs[head_end]
+        head_end += 1
+    tail_budget += head_budget - used
+
+    tail_start, used = len(lines), 0
+    while tail_start > head_end and used + costs[tail_start - 1] <= tail_budget:
+        tail_start -= 1
+        used += costs[tail_start]
+    error_budget += tail_budget - used
+
+    kept = set(range(head_end)) | set(range(tail_start, len(lines)))
+    used = 0
+    for idx in range(head_end, tail_start):
+        if ERROR_LINE_RE.search(lines[idx]) and used + costs[idx] <= error_budget:
+            kept.add(idx)
+            used += costs[idx]
+
+    out, gap, elided = [], 0, 0
+    for idx, line in enumerate(lines):
+        if idx in kept:
+            if gap:
+                out.append(f'... [省略 {gap} 行] ...')
+                elided += gap
+                gap = 0
+            out.append(line)
+        else:
+            gap += 1
+    if gap:
+        out.append(f'... [省略 {gap} 行] ...')
+        elided += gap
+    return out, elided
+
+
+def compress_terminal_output(text: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> dict:
+    """
+    压缩命令输出，返回压缩文本及压缩统计
+    """
+    original_tokens = estimate_tokens(text)
+    cleaned = _ANSI_RE.sub('', text or '')
+    lines = [collapse_carriage_returns(l).rstrip() for l in cleaned.split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    lines = run_length_encode(lines)
+
+    elided = 0
+    if estimate_tokens('\n'.join(lines)) > token_budget:
+        lines, elided = _elide(lines, token_budget)
+
+    result = '\n'.join(lines)
+    compressed_tokens = estimate_tokens(result)
+    return {
+        "text": result,
+        "original_chars": len(text or ''),
+        "compressed_chars": len(result),
+        "original_tokens": original_tokens,
+        "compressed_tokens": compressed_tokens,
+        "ratio": round(compressed_tokens / original_tokens, 3) if original_tokens else 1.0,
+        "elided_lines": elided,
+    }
@@ -0,0 +1,242 @@
+"""
+敏感信息脱敏
+命令行、命令输出、对话记录在持久化或发送给第三方 LLM 之前统一经过这里。
+检测器：私钥块、password= 赋值、URL 中的口令、mysql -p 口令、云厂商密钥格式、高熵令牌。
+1. 每个检测器带若干必含的字面量锚点，先对小写化文本做 `in` 检查（C 层子串搜索），
+   得到本段文本里可能出现的检测器集合；
+2. 这些检测器展开成一个扁平的多分支正则（按集合缓存编译结果），对文本做 sub 扫描，
+   回调只在候选位置执行（确认检测器、熵校验）；
+3. 带校验器的通用规则（高熵令牌）单独再扫一轮：它的候选会吞掉整段令牌字符，
+   若与具体格式同轮扫描，校验失败时整段原样保留，段内/紧随其后的口令赋值就漏掉了。
+每个分支都以字面量开头（高熵令牌除外），sre 按首字符直接跳过不可能的分支；
+分支内不含嵌套量词，扫描对输入长度是线性的。
+"""
+import math
+import re
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+MASK = "[REDACTED:{}]"
+# 高熵令牌的字符集不含 /，避免把长路径当成令牌
+TOKEN_CHARS = "A-Za-z0-9+_\\-"
+# 赋值右侧的值：引号内整体（可含空格）或到空白为止，不跨行
+SECRET_VALUE = r"""(?P<value>"[^"\n]{1,256}"|'[^'\n]{1,256}'|[^\s'"]{3,})"""
+ASSIGNMENT_KEYS = (
+    "password", "passwd", "secret", "token", "api_key", "api-key", "apikey",
+    "access_key", "access-key", "accesskey", "account_key", "account-key", "accountkey",
+    "private_key", "private-key", "credential",
+)
+
+
+def shannon_entropy(value: str) -> float:
+    """每字符的香农熵（比特）"""
+    length = len(value)
+    return -sum(n / length * math.log2(n / length) for n in Counter(value).values())
+
+
+def _case_insensitive(words) -> Tuple[str, ...]:
+    """
+    不用 (?i)：按首字母大小写各展开一个以字面量开头的前缀，其余字母用字符类，
+    按首字母分组后同一前缀下的多个词合成一个分支
+    """
+    groups: Dict[str, List[str]] = {}
+    for word in words:
+        groups.setdefault(word[0].lower(), []).append(word[1:])
+    prefixes = []
+    for first, rests in groups.items():
+        body = "|".join(
+            "".join(f"[{c.upper()}{c.lower()}]" if c.isalpha() else re.escape(c) for c in rest)
+            for rest in rests
+        )
+        for c in dict.fromkeys((first.lower(), first.upper())):
+            prefixes.append(f"{re.escape(c)}(?:{body})")
+    return tuple(prefixes)
+
+
+class Detector:
+    """
+    name: 检测器名称，也出现在掩码里
+    prefixes: 若干以字面量开头的正则前缀，body: 前缀之后的部分；
+              完整正则为 (?:前缀1|前缀2...)body，扫描时展开为 前缀1body|前缀2body...
+    body 含 (?P<value>...) 时只掩码该部分（保留键名等上下文），否则掩码整个匹配
+    anchors: 匹配时必然出现的小写字面量，文本里一个都没有就跳过该检测器；为空表示总是参与扫描
+    boundary: 前缀前要求单词边界（只在确认时检查，扫描正则里去掉以保留首字符快速跳过）
+    validator: 候选的二次校验（如熵），返回 False 时原样保留
+    """
+    __slots__ = ('name', 'prefixes', 'body', 'anchors', 'boundary', 'validator', 'regex')
+
+    def __init__(
+        self,
+        name: str,
+        prefixes: Tuple[str, ...],
+        body: str = "",
+        anchors: tuple = (),
+        boundary: bool = False,
+        validator: Optional[Callable[[str], bool]] = None
+    ):
+        self.name = name
+        self.prefixes = prefixes
+        self.body = body
+        self.anchors = anchors
+        self.boundary = boundary
+        self.validator = validator
+        self.regex = re.compile(
+            (r"\b" if boundary else "") + "(?:" + "|".join(prefixes) + ")" + body
+        )
+
+    def scan_pattern(self) -> str:
+        # 合并后的扫描正则里不能有重名分组，value 分组只在确认时用
+        return "|".join(prefix + self.body for prefix in self.prefixes).replace("(?P<value>", "(?:")
+
+
+def _high_entropy(value: str) -> bool:
+    # 同时含大写、小写和数字才算令牌：排除长标识符、十六进制哈希和 UUID
+    if not (any(c.isdigit() for c in value) and any(c.islower() for c in value) and any(c.isupper() for c in value)):
+        return False
+    return shannon_entropy(value) >= settings.REDACTION_MIN_ENTROPY
+
+
+# 顺序即优先级：同一位置先匹配到的检测器生效，具体格式排在通用规则之前
+BUILTIN_DETECTORS: List[Detector] = [
+    Detector(
+        "private_key", ("-----BEGIN",),
+        r"[A-Z ]{0,30} PRIVATE KEY(?: BLOCK)?-----[\s\S]*?(?:-----END[A-Z ]{0,30} PRIVATE KEY(?: BLOCK)?-----|\Z)",
+        anchors=("private key",)
+    ),
+    Detector("aws_access_key", ("AKIA", "ASIA"), r"[0-9A-Z]{16}\b", anchors=("akia", "asia"), boundary=True),
+    Detector(
+        "github_token", ("gh[pousr]_[A-Za-z0-9]{36,255}", "github_pat_[A-Za-z0-9_]{22,255}"),
+        anchors=("ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_"), boundary=True
+    ),
+    Detector("slack_token", ("xox",), r"[abposr]-[A-Za-z0-9-]{10,250}", anchors=("xox",), boundary=True),
+    Detector("google_api_key", ("AIza",), r"[0-9A-Za-z_\-]{35}", anchors=("aiza",), boundary=True),
+    Detector("openai_key", ("sk-",), r"(?:proj-|ant-)?[A-Za-z0-9_\-]{20,250}", anchors=("sk-",), boundary=True),
+    # 后顾断言只让令牌字符串的开头成为候选：否则 "eyJ" 反复出现时每个位置都要扫到串尾再失败
+    Detector(
+        "jwt", ("eyJ",), r"(?<![A-Za-z0-9_\-]eyJ)[A-Za-z0-9_\-]{8,}\.eyJ[A-Za-z0-9_\-]{8,}\.[A-Za-z0-9_\-]{8,}",
+        anchors=("eyj",), boundary=True
+    ),
+    Detector(
+        "bearer", ("Bearer", "bearer"), r"[ \t]+(?P<value>[A-Za-z0-9._~+/=\-]{16,})",
+        anchors=("bearer",), boundary=True
+    ),
+    # user:password@host
+    Detector("url_password", ("://",), r"[^\s:/@]{1,128}:(?P<value>[^\s@/]{1,256})@", anchors=("://",)),
+    # mysql -u root -pS3cret：-p 与口令之间没有空格；只认 mysql 系客户端，ssh -p2222、mkdir -p 不受影响
+    Detector(
+        "mysql_password", ("mysql", "mariadb"),
+        rf"(?:dump|admin|import|show|check|slap)?[ \t](?:[^\n]{{0,200}}?[ \t])?-p{SECRET_VALUE}",
+        anchors=("mysql", "mariadb"), boundary=True
+    ),
+    # --password xxx / --token=xxx
+    Detector(
+        "cli_flag", ("--",), rf"(?:password|passwd|pass|token|secret|api-key)(?:=|[ \t]+){SECRET_VALUE}",
+        anchors=("--",)
+    ),
+    # password=xxx、"api_key": "xxx"、SECRET_ACCESS_KEY=xxx；值不跨行
+    Detector(
+        "assignment", _case_insensitive(ASSIGNMENT_KEYS),
+        rf"(?:[_\-][A-Za-z0-9_\-]{{0,40}})?['\"]?[ \t]*[=:][ \t]*{SECRET_VALUE}",
+        anchors=("passw", "secret", "token", "key", "credential")
+    ),
+    Detector(
+        "high_entropy", (f"[{TOKEN_CHARS}]",), rf"[{TOKEN_CHARS}]{{23,}}={{0,2}}",
+        validator=_high_entropy
+    ),
+]
+
+
+class Redactor:
+    def __init__(self, detectors: List[Detector]):
+        self.detectors = detectors
+        self._compiled: Dict[int, tuple] = {}
+        self.calls = 0
+        self.chars = 0
+        self.seconds = 0.0
+        self.counts: Counter = Counter()
+
+    def _scanner_for(self, text: str) -> List[tuple]:
+        """按锚点筛出本段文本可能命中的检测器，返回各轮的 (扫描正则, 检测器列表)，按位掩码缓存"""
+        folded = text.lower()
+        mask = 0
+        for i, detector in enumerate(self.detectors):
+            if not detector.anchors or any(anchor in folded for anchor in detector.anchors):
+                mask |= 1 << i
+        entry = self._compiled.get(mask)
+        if entry is None:
+            active = [d for i, d in enumerate(self.detectors) if mask >> i & 1]
+            entry = []
+            # 先扫具体格式，再单独扫带校验器的通用规则
+            for group in ([d for d in active if d.validator is None], [d for d in active if d.validator is not None]):
+                if group:
+                    entry.append((re.compile("|".join(d.scan_pattern() for d in group)), group))
+            self._compiled[mask] = entry
+        return entry
+
+    def _replacer(self, active: List[Detector]):
+        def replace(m: re.Match) -> str:
+            text = m.string
+            pos, end = m.span()
+            # 扫描正则只给出候选位置，按优先级用各检测器的完整正则确认
+            for detector in active:
+                dm = detector.regex.match(text, pos)
+                if dm is None or dm.end() > end:
+                    continue
+                has_value = "value" in detector.regex.groupindex
+                value = dm.group("value") if has_value else dm.group()
+                if detector.validator is not None and not detector.validator(value):
+                    continue
+                self.counts[detector.name] += 1
+                mask = MASK.format(detector.name)
+                if has_value:
+                    value_start, value_end = dm.span("value")
+                    return text[pos:value_start] + mask + text[value_end:end]
+                return mask + text[dm.end():end]
+            return m.group()
+        return replace
+
+    def redact(self, text: Optional[str]) -> Optional[str]:
+        if not text:
+            return text
+        start = time.perf_counter()
+        result = text
+        for regex, active in self._scanner_for(text):
+            result = regex.sub(self._replacer(active), result)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        self.chars += len(text)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.REDACTION_ENABLED,
+            "detectors": [d.name for d in self.detectors],
+            "calls": self.calls,
+            "scanned_mb": round(self.chars / 1e6, 2),
+            "mb_per_second": round(self.chars / 1e6 / self.seconds, 1) if self.seconds else 0.0,
+            "redactions": dict(self.counts),
+        }
+
+
+def build_detectors() -> List[Detector]:
+    """内置检测器（REDACTION_DETECTORS 非空时只启用其中列出的）+ REDACTION_EXTRA_PATTERNS"""
+    enabled = set(settings.REDACTION_DETECTORS)
+    detectors = [d for d in BUILTIN_DETECTORS if not enabled or d.name in enabled]
+    extra = [Detector(name, (pattern,)) for name, pattern in settings.REDACTION_EXTRA_PATTERNS.items()]
+    # 自定义规则通常更具体，排在通用的赋值/高熵规则之前
+    generic = [d for d in detectors if d.name in ("assignment", "high_entropy")]
+    specific = [d for d in detectors if d.name not in ("assignment", "high_entropy")]
+    return specific + extra + generic
+
+
+redactor = Redactor(build_detectors())
+
+
+def redact(text: Optional[str]) -> Optional[str]:
+    """脱敏入口；REDACTION_ENABLED 关闭时原样返回"""
+    if not settings.REDACTION_ENABLED:
+        return text
+    return redactor.redact(text)
@@ -0,0 +1,376 @@
+"""
+服务端 AI agent 循环
+原先由浏览器编排：调 /api/llm/chat、解析 JSON、经终端 WebSocket 发命令、等 command_finished、
+再把输出 POST 到 /api/chat-history 并再次调用 LLM，每一步都要经过客户端往返两次。
+现在循环绑定在终端会话（client_id）上，在后端完成 LLM → 审批 → 执行 → 读取输出 → LLM，
+只把进度事件推给客户端；对话记录在服务端统一写入 chat_sessions / chat_messages。
+
+事件（均经由终端 WebSocket 发送）：
+agent_started / agent_step / agent_message / agent_probes / agent_approval /
+agent_command / agent_output / agent_done / agent_error
+manual 模式下 AI 给出的只读探测批次同样要经过 agent_approval（带 probes 字段，只能批准或拒绝）。
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.chat_session import ChatMessage, ChatSession
+from app.routes.llm import DEFAULT_SYSTEM_PROMPT, complete_llm, resolve_llm_config
+from app.services.context_compressor import compress_terminal_output
+from app.services.redaction import redact
+from app.ws.command_cache import command_cache
+from app.ws.host_facts import host_facts
+from app.ws.probes import probe_runner
+from app.ws.session import TerminalSession
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+# manual：每条命令都要用户批准；read_only：白名单内的只读命令自动执行；auto：全部自动执行
+APPROVAL_MODES = ("manual", "read_only", "auto")
+LLM_TIMEOUT = 120.0
+# 续接已有会话时带入 LLM 的历史消息条数
+MAX_HISTORY_MESSAGES = 20
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+SendFunc = Callable[[dict], Awaitable[None]]
+ExecuteFunc = Callable[[TerminalSession, str, bool], Awaitable[Tuple[str, str]]]
+
+
+def parse_reply(text: str) -> dict:
+    """解析 LLM 的 JSON 回复；不是合法 JSON 时整段作为 explanation、不执行命令"""
+    body = _FENCE_RE.sub("", (text or "").strip())
+    start, end = body.find("{"), body.rfind("}")
+    data = None
+    if start != -1 and end > start:
+        try:
+            data = json.loads(body[start:end + 1])
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        return {"explanation": (text or "").strip(), "command": "", "probes": []}
+    probes = data.get("probes")
+    return {
+        "explanation": str(data.get("explanation") or ""),
+        "command": str(data.get("command") or "").strip(),
+        "probes": [str(p) for p in probes if p] if isinstance(probes, list) else [],
+    }
+
+
+class AgentRun:
+    """一次 agent 任务；task 完成即结束"""
+
+    def __init__(
+        self,
+        session: TerminalSession,
+        send: SendFunc,
+        execute: ExecuteFunc,
+        approval: str,
+        max_steps: int,
+        stats: dict
+    ):
+        self.session = session
+        self.send = send
+        self.execute = execute
+        self.approval = approval
+        self.max_steps = max_steps
+        self.stats = stats
+        self.chat_session_id: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self._approval_waiter: Optional[asyncio.Future] = None
+        self._sequence = 0
+
+    # ---------- 审批 ----------
+
+    def approve(self, approved: bool, command: Optional[str] = None) -> bool:
+        waiter = self._approval_waiter
+        if waiter is None or waiter.done():
+            return False
+        waiter.set_result((approved, (command or "").strip()))
+        return True
+
+    async def _wait_approval(self, event: dict) -> Optional[Tuple[bool, str]]:
+        """推送审批请求并等待 agent_approve；超时返回 None"""
+        self._approval_waiter = asyncio.get_running_loop().create_future()
+        timeout = settings.LLM_AGENT_APPROVAL_TIMEOUT
+        self.stats["approvals"] += 1
+        await self.send({"type": "agent_approval", **event, "timeout": timeout})
+        try:
+            return await asyncio.wait_for(self._approval_waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._approval_waiter = None
+
+    async def _gate(self, step: int, command: str) -> Tuple[Optional[str], str]:
+        """返回 (要执行的命令, command_status)；命令为 None 表示未批准"""
+        if self.approval == "auto":
+            return command, "executed"
+        if self.approval == "read_only" and command_cache.allow_list.normalize(command) is not None:
+            return command, "executed"
+        decision = await self._wait_approval({"step": step, "command": command})
+        if decision is None:
+            return None, "timeout"
+        approved, edited = decision
+        if not approved:
+            return None, "rejected"
+        if edited and edited != command:
+            return edited, "modified"
+        return command, "executed"
+
+    async def _gate_probes(self, step: int, probes: List[str]) -> str:
+        """
+        探测批次的审批，返回 executed / rejected / timeout。
+        manual 模式下整批需要用户批准（只能批准或拒绝，不能修改）；
+        其余模式由探测执行器的只读白名单把关
+        """
+        if self.approval != "manual":
+            return "executed"
+        decision = await self._wait_approval({"step": step, "probes": probes})
+        if decision is None:
+            return "timeout"
+        return "executed" if decision[0] else "rejected"
+
+    # ---------- 持久化 ----------
+
+    async def _open_chat_session(self, chat_session_id: Optional[str], prompt: str) -> List[Dict[str, str]]:
+        """续接属于本用户的会话（返回其历史）或新建会话"""
+        ci = self.session
+        async with AsyncSessionLocal() as db:
+            chat = None
+            if chat_session_id:
+                result = await db.execute(
+                    select(ChatSession).where(ChatSession.id == chat_session_id, ChatSession.user_id == ci.user_id)
+                )
+                chat = result.scalars().one_or_none()
+            if chat is None:
+                now = datetime.now()
+                chat = ChatSession(
+                    user_id=ci.user_id, connection_id=ci.connection_id, host=ci.host, username=ci.username,
+                    title=redact(prompt)[:100], status="active",
+                    start_time=now, created_at=now, updated_at=now,
+                )
+                db.add(chat)
+                await db.commit()
+                self.chat_session_id = chat.id
+                return []
+            self.chat_session_id = chat.id
+            seq_result = await db.execute(
+                select(func.coalesce(func.max(ChatMessage.sequence), 0)).where(ChatMessage.session_id == chat.id)
+            )
+            self._sequence = seq_result.scalar() or 0
+            result = await db.execute(
+                select(ChatMessage.role, ChatMessage.content, ChatMessage.command, ChatMessage.command_output)
+                .where(ChatMessage.session_id == chat.id)
+                .order_by(ChatMessage.sequence.desc())
+                .limit(MAX_HISTORY_MESSAGES)
+            )
+            history = []
+            for role, content, command, output in reversed(result.all()):
+                if role in ("user", "assistant") and content:
+                    history.append({"role": role, "content": content})
+                elif role in ("command", "output") and (output or content):
+                    label = f"命令 {command} 的输出" if command else "命令输出"
+                    history.append({"role": "user", "content": f"{label}：\n{output or content}"})
+            return history
+
+    async def _persist(self, role: str, content: str, command_status: Optional[str] = None, **fields):
+        self._sequence += 1
+        async with AsyncSessionLocal() as db:
+            db.add(ChatMessage(
+                session_id=self.chat_session_id,
+                sequence=self._sequence,
+                role=role,
+                content=redact(content),
+                command=redact(fields.pop("command", None)),
+                command_output=redact(fields.pop("command_output", None)),
+                command_status=command_status,
+                timestamp=datetime.now(),
+                **fields
+            ))
+            chat = await db.get(ChatSession, self.chat_session_id)
+            if chat is not None:
+                chat.message_count = self._sequence
+                if command_status in ("executed", "modified"):
+                    chat.command_count = (chat.command_count or 0) + 1
+                chat.updated_at = datetime.now()
+            await db.commit()
+
+    # ---------- 主循环 ----------
+
+    async def run(self, prompt: str, chat_session_id: Optional[str]):
+        ci = self.session
+        reason = "max_steps"
+        try:
+            async with AsyncSessionLocal() as db:
+                config = await resolve_llm_config(db, ci.user_id)
+            if not config["api_key"]:
+                await self.send({"type": "agent_error", "content": "请先在设置页面配置AI模型的API Key并激活"})
+                return
+
+            history = await self._open_chat_session(chat_session_id, prompt)
+            system = DEFAULT_SYSTEM_PROMPT
+            facts = await host_facts.prompt_section(ci.connection_id)
+            if facts:
+                system = f"{system}\n\n{facts}"
+            messages = [{"role": "system", "content": system}, *history, {"role": "user", "content": redact(prompt)}]
+            await self._persist("user", prompt)
+            await self.send({"type": "agent_started", "chat_session_id": self.chat_session_id, "approval": self.approval})
+
+            for step in range(1, self.max_steps + 1):
+                self.stats["steps"] += 1
+                await self.send({"type": "agent_step", "step": step})
+                start = time.perf_counter()
+                reply = await complete_llm(config, messages, LLM_TIMEOUT)
+                self.stats["llm_seconds"] += time.perf_counter() - start
+                messages.append({"role": "assistant", "content": reply})
+                parsed = parse_reply(reply)
+                command = parsed["command"]
+                await self._persist(
+                    "assistant", parsed["explanation"],
+                    ai_explanation=parsed["explanation"], ai_suggested_command=command or None,
+                    message_type="command_suggest" if command else "text",
+                )
+                await self.send({"type": "agent_message", "step": step, **parsed})
+
+                if parsed["probes"]:
+                    probes_status = await self._gate_probes(step, parsed["probes"])
+                    if probes_status != "executed":
+                        self.stats["rejected"] += 1
+                        await self._persist(
+                            "command", "", command_status="rejected", message_type="command_reject",
+                            extra_data={"reason": probes_status, "probes": parsed["probes"]},
+                        )
+                        reason = probes_status
+                        break
+                    batch = await probe_runner.run(ci.ssh_conn, parsed["probes"], ci.encoding)
+                    self.stats["probes"] += len(batch["results"])
+                    await self.send({"type": "agent_probes", "step": step, **batch})
+                    await self._persist(
+                        "output", batch["context"], message_type="output",
+                        extra_data={"probes": [r["command"] for r in batch["results"]]},
+                    )
+                    messages.append({"role": "user", "content": f"只读探测结果：\n{batch['context']}"})
+                    if not command:
+                        continue
+
+                if not command:
+                    reason = "answered"
+                    break
+
+                approved, command_status = await self._gate(step, command)
+                if approved is None:
+                    self.stats["rejected"] += 1
+                    await self._persist(
+                        "command", "", command_status="rejected", command=command, message_type="command_reject",
+                        extra_data={"reason": command_status},
+                    )
+                    reason = command_status
+                    break
+
+                await self.send({"type": "agent_command", "step": step, "command": approved, "status": command_status})
+                start = time.perf_counter()
+                output, detection = await self.execute(ci, approved, self.approval != "manual")
+                self.stats["commands"] += 1
+                self.stats["command_seconds"] += time.perf_counter() - start
+                compressed = compress_terminal_output(output, settings.LLM_CONTEXT_TOKEN_BUDGET)["text"]
+                await self.send({
+                    "type": "agent_output", "step": step, "command": approved,
+                    "output": compressed, "detection": detection
+                })
+                await self._persist(
+                    "command", compressed, command_status=command_status, command=approved,
+                    command_output=output, message_type="command_execute", extra_data={"detection": detection},
+                )
+                messages.append({
+                    "role": "user",
+                    "content": f"命令 {approved} 已执行（{detection}），输出：\n{redact(compressed) or '(无输出)'}"
+                })
+        except asyncio.CancelledError:
+            reason = "stopped"
+        except Exception as e:
+            logger.warning(f"[{ci.client_id}] Agent failed: {e}")
+            self.stats["errors"] += 1
+            await self.send({"type": "agent_error", "content": str(e), "chat_session_id": self.chat_session_id})
+            return
+        await self.send({"type": "agent_done", "reason": reason, "chat_session_id": self.chat_session_id})
+
+
+class AgentRunner:
+    """client_id -> 正在运行的 AgentRun；每个终端会话同时只运行一个"""
+
+    def __init__(self, max_steps: int):
+        self.max_steps = max_steps
+        self._runs: Dict[str, AgentRun] = {}
+        self.counters = {
+            "runs": 0, "steps": 0, "commands": 0, "probes": 0, "approvals": 0, "rejected": 0, "errors": 0,
+            "llm_seconds": 0.0, "command_seconds": 0.0,
+        }
+
+    def start(
+        self,
+        session: TerminalSession,
+        send: SendFunc,
+        execute: ExecuteFunc,
+        prompt: str,
+        chat_session_id: Optional[str] = None,
+        approval: str = "manual",
+        max_steps: int = 0
+    ) -> AgentRun:
+        if self.get(session.client_id) is not None:
+            raise ValueError("该终端已有正在运行的 AI 任务")
+        if approval not in APPROVAL_MODES:
+            raise ValueError(f"approval 只能是 {'/'.join(APPROVAL_MODES)}")
+        max_steps = min(max_steps or self.max_steps, self.max_steps)
+        run = AgentRun(session, send, execute, approval, max_steps, self.counters)
+        run.task = terminal_tasks.spawn(run.run(prompt, chat_session_id), "agent", session.client_id)
+        self._runs[session.client_id] = run
+        run.task.add_done_callback(lambda _: self._discard(session.client_id, run))
+        self.counters["runs"] += 1
+        return run
+
+    def _discard(self, client_id: str, run: AgentRun):
+        if self._runs.get(client_id) is run:
+            del self._runs[client_id]
+
+    def get(self, client_id: str) -> Optional[AgentRun]:
+        run = self._runs.get(client_id)
+        if run is not None and run.task.done():
+            return None
+        return run
+
+    def approve(self, client_id: str, approved: bool, command: Optional[str] = None) -> bool:
+        run = self.get(client_id)
+        return run is not None and run.approve(approved, command)
+
+    async def stop(self, client_id: str):
+        run = self._runs.pop(client_id, None)
+        if run is None or run.task.done():
+            return
+        run.task.cancel()
+        try:
+            await run.task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> dict:
+        c = self.counters
+        return {
+            "active": sum(1 for run in self._runs.values() if not run.task.done()),
+            "max_steps": self.max_steps,
+            **{k: v for k, v in c.items() if not k.endswith("_seconds")},
+            "avg_llm_ms": round(c["llm_seconds"] * 1000 / c["steps"], 1) if c["steps"] else 0.0,
+            "avg_command_ms": round(c["command_seconds"] * 1000 / c["commands"], 1) if c["commands"] else 0.0,
+        }
+
+
+agent_runner = AgentRunner(max_steps=settings.LLM_AGENT_MAX_STEPS)
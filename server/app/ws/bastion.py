@@ -0,0 +1,146 @@
+"""
+跳板机连接共享
+经同一跳板机的所有会话共用一条已认证的跳板机 SSH 连接（按建连参数指纹区分），引用计数管理：
+新标签页只需在隧道内完成目标主机的握手；最后一个会话关闭后跳板机连接再保留 idle_ttl 秒，
+期间打开的新会话仍可直接复用。跳板机本身也可以经过上一级跳板机（链式）。
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+import asyncssh
+
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+
+class BastionEntry:
+    __slots__ = ('host', 'task', 'refs', 'idle_handle', 'opened_at', 'tunneled')
+
+    def __init__(self, host: str, task: asyncio.Task):
+        self.host = host
+        self.task = task
+        self.refs = 0
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+        self.opened_at = time.monotonic()
+        # 经此跳板机建立过的目标连接数
+        self.tunneled = 0
+
+    def usable(self) -> bool:
+        if not self.task.done():
+            return True
+        if self.task.cancelled() or self.task.exception() is not None:
+            return False
+        return not self.task.result().is_closed()
+
+
+class BastionPool:
+    def __init__(
+        self,
+        opener: Callable[[dict], Awaitable[asyncssh.SSHClientConnection]],
+        key_func: Callable[[dict], str],
+        idle_ttl: int
+    ):
+        self._opener = opener
+        self._key_func = key_func
+        self.idle_ttl = idle_ttl
+        self._entries: Dict[str, BastionEntry] = {}
+        self._watchers: Set[asyncio.Task] = set()
+        self.handshakes = 0
+        self.reuses = 0
+        self.failures = 0
+
+    async def acquire(self, params: dict) -> tuple:
+        """取得（必要时建立）跳板机连接并增加引用，返回 (key, connection)"""
+        key = self._key_func(params)
+        entry = self._entries.get(key)
+        if entry is not None and not entry.usable():
+            self._discard(key, entry)
+            entry = None
+        if entry is None:
+            entry = BastionEntry(params["host"], terminal_tasks.spawn(self._opener(params), "bastion_connect"))
+            self._entries[key] = entry
+            self.handshakes += 1
+        else:
+            self.reuses += 1
+
+        entry.refs += 1
+        if entry.idle_handle:
+            entry.idle_handle.cancel()
+            entry.idle_handle = None
+        try:
+            # shield：一个等待者被取消不影响其他会话共用的握手
+            conn = await asyncio.shield(entry.task)
+        except BaseException:
+            if entry.task.done() and not entry.usable():
+                self.failures += 1
+                self._discard(key, entry)
+            else:
+                self.release(key)
+            raise
+        entry.tunneled += 1
+        return key, conn
+
+    def release(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.refs -= 1
+        if entry.refs <= 0:
+            entry.refs = 0
+            loop = asyncio.get_running_loop()
+            entry.idle_handle = loop.call_later(self.idle_ttl, self._close_idle, key, entry)
+
+    def hold_until_closed(self, key: str, conn: asyncssh.SSHClientConnection):
+        """目标连接关闭时释放其对跳板机的引用"""
+        async def _watch():
+            try:
+                await conn.wait_closed()
+            finally:
+                self.release(key)
+
+        task = terminal_tasks.spawn(_watch(), "bastion_watch")
+        self._watchers.add(task)
+        task.add_done_callback(self._watchers.discard)
+
+    def _close_idle(self, key: str, entry: BastionEntry):
+        if self._entries.get(key) is entry and entry.refs == 0:
+            logger.info(f"Closing idle bastion connection to {entry.host}")
+            self._discard(key, entry)
+
+    def _discard(self, key: str, entry: BastionEntry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        if entry.idle_handle:
+            entry.idle_handle.cancel()
+        if not entry.task.done():
+            entry.task.cancel()
+        elif entry.usable():
+            entry.task.result().close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "idle_ttl": self.idle_ttl,
+            "handshakes": self.handshakes,
+            "reuses": self.reuses,
+            "failures": self.failures,
+            "bastions": [
+                {
+                    "host": entry.host,
+                    "state": "connecting" if not entry.task.done() else ("open" if entry.usable() else "closed"),
+                    "refs": entry.refs,
+                    "tunneled": entry.tunneled,
+                    "age_seconds": round(now - entry.opened_at, 1),
+                }
+                for entry in self._entries.values()
+            ],
+        }
+
+    def shutdown(self):
+        for key, entry in list(self._entries.items()):
+            self._discard(key, entry)
+        for task in list(self._watchers):
+            task.cancel()
@@ -0,0 +1,687 @@
+"""
+进程外 SSH 会话代理（broker）
+SSH 连接和通道（加解密、PTY 读写）放到独立的 broker 工作进程里，每个进程一个 Unix socket，
+会话按 key 哈希分布到 N 个进程，用满多核；API 进程只处理 WebSocket、屏幕模拟、监视和 AI。
+API 重启（或 WebSocket 以 1006/1012 断开）时 broker 里的会话转为分离状态并继续缓冲输出，
+同一 key 在 TTL 内 attach 回来即恢复，期间的输出补发。
+终端通道每次绑定（开通道或 attach）的通道 id 即该次接入的代号，DETACH/CLOSE 带上它：
+旧 WebSocket 的清理晚于新连接的 attach 到达时，broker 认出是已被取代的接入，直接忽略。
+
+API 侧的 BrokerConnection / BrokerProcess 提供终端代码用到的 asyncssh 接口子集
+（create_process、run、stdout.read、stdin.write、change_terminal_size、close），调用方不用区分。
+
+帧格式：9 字节头 "!BII"（类型, 通道/请求 id, 负载长度）+ 负载；
+DATA 负载为原始字节，RESIZE 为 "!HH"，其余控制帧为 JSON。
+
+启动工作进程：python -m app.ws.broker --socket /run/ai-terminal/broker-{}.sock --workers 4
+并在 TERMINAL_BROKER_SOCKETS 中列出同样的路径（未配置时终端在 API 进程内直接建连）。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import struct
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import asyncssh
+
+from app.config import settings
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("!BII")
+RESIZE = struct.Struct("!HH")
+READ_SIZE = 65536
+# 分离期间每个终端保留的输出（字节），attach 时补发
+DETACHED_BACKLOG = 256 * 1024
+SWEEP_INTERVAL = 10.0
+REQUEST_TIMEOUT = 60.0
+
+# 帧类型
+F_OPEN = 1        # API→broker 建立 SSH 连接 {key, params}
+F_ATTACH = 2      # API→broker 接回分离会话的终端通道 {key}
+F_DETACH = 3      # API→broker 会话转为分离 {key, attachment}
+F_CLOSE = 4       # API→broker 关闭会话 {key, attachment}
+F_PROCESS = 5     # API→broker 在会话上开通道 {key, command, term_type, term_size, merge_stderr}
+F_DATA = 6        # 双向：通道数据
+F_RESIZE = 7      # API→broker 调整终端大小
+F_CLOSE_CHANNEL = 8
+F_EXIT = 9        # broker→API 通道结束 {exit_status}
+F_STATS = 10
+F_OK = 11
+F_ERROR = 12
+
+
+def _json(body) -> bytes:
+    return json.dumps(body, separators=(",", ":")).encode()
+
+
+class BrokerError(OSError):
+    pass
+
+
+def _error_from(body: dict) -> BaseException:
+    kind, message = body.get("kind"), body.get("message", "")
+    if kind == "value":
+        return ValueError(message)
+    if kind == "timeout":
+        return asyncio.TimeoutError()
+    if kind == "auth":
+        return asyncssh.PermissionDenied(message)
+    return BrokerError(message)
+
+
+def _error_body(e: BaseException) -> dict:
+    if isinstance(e, ValueError):
+        kind = "value"
+    elif isinstance(e, asyncio.TimeoutError):
+        kind = "timeout"
+    elif isinstance(e, asyncssh.PermissionDenied):
+        kind = "auth"
+    else:
+        kind = "ssh"
+    return {"kind": kind, "message": str(e)}
+
+
+# ==================== API 侧 ====================
+
+class _ChannelReader:
+    """BrokerProcess.stdout：与 asyncssh 的 read(n) 语义一致，EOF 返回 b''"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event = asyncio.Event()
+        self._eof = False
+
+    def feed(self, data: bytes):
+        self._buffer += data
+        self._event.set()
+
+    def feed_eof(self):
+        self._eof = True
+        self._event.set()
+
+    async def read(self, n: int = -1) -> bytes:
+        while not self._buffer and not self._eof:
+            self._event.clear()
+            await self._event.wait()
+        if n < 0 or n >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:n])
+            del self._buffer[:n]
+        return data
+
+
+class _ChannelWriter:
+    def __init__(self, process: "BrokerProcess"):
+        self._process = process
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._process.link.write(F_DATA, self._process.channel_id, data)
+
+
+class BrokerProcess:
+    def __init__(self, link: "BrokerLink", channel_id: int):
+        self.link = link
+        self.channel_id = channel_id
+        self.stdout = _ChannelReader()
+        self.stdin = _ChannelWriter(self)
+        self.exit_status: Optional[int] = None
+        self._closed = asyncio.Event()
+
+    def on_exit(self, exit_status: Optional[int]):
+        self.exit_status = exit_status
+        self.stdout.feed_eof()
+        self._closed.set()
+
+    def change_terminal_size(self, cols: int, rows: int):
+        self.link.write(F_RESIZE, self.channel_id, RESIZE.pack(int(cols), int(rows)))
+
+    def close(self):
+        if not self._closed.is_set():
+            self.link.write(F_CLOSE_CHANNEL, self.channel_id)
+            self.link.channels.pop(self.channel_id, None)
+            self.on_exit(self.exit_status)
+
+    async def wait_closed(self):
+        await self._closed.wait()
+
+
+class BrokerConnection:
+    """broker 里的一条 SSH 连接（按 key 标识）"""
+
+    def __init__(self, link: "BrokerLink", key: str, attachment: Optional[int] = None):
+        self.link = link
+        self.key = key
+        # 本连接接入的终端通道 id；没有终端通道的连接为 None，DETACH/CLOSE 不做接入校验
+        self.attachment = attachment
+
+    async def create_process(
+        self,
+        command: Optional[str] = None,
+        *,
+        term_type: Optional[str] = None,
+        term_size=None,
+        encoding=None,
+        stderr=None
+    ) -> BrokerProcess:
+        process = self.link.new_process()
+        try:
+            await self.link.request(F_PROCESS, {
+                "key": self.key,
+                "command": command,
+                "term_type": term_type,
+                "term_size": list(term_size) if term_size else None,
+                "merge_stderr": stderr is asyncssh.STDOUT,
+            }, process.channel_id)
+        except BaseException:
+            self.link.channels.pop(process.channel_id, None)
+            raise
+        if term_type:
+            self.attachment = process.channel_id
+        return process
+
+    async def run(self, command: str, timeout: Optional[float] = None, encoding: Optional[str] = "utf-8", errors: str = "strict"):
+        """只收集 stdout（与终端代码的用法一致）"""
+        async def collect():
+            process = await self.create_process(command)
+            chunks = []
+            try:
+                while True:
+                    chunk = await process.stdout.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                await process.wait_closed()
+            finally:
+                process.close()
+            output = b"".join(chunks)
+            return SimpleNamespace(
+                stdout=output.decode(encoding, errors) if encoding else output,
+                exit_status=process.exit_status
+            )
+
+        return await asyncio.wait_for(collect(), timeout)
+
+    def detach(self):
+        self.link.write(F_DETACH, 0, _json({"key": self.key, "attachment": self.attachment}))
+
+    def close(self):
+        self.link.write(F_CLOSE, 0, _json({"key": self.key, "attachment": self.attachment}))
+
+
+class BrokerLink:
+    """到一个 broker 工作进程的 Unix socket 连接，所有会话和通道在上面复用"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.channels: Dict[int, BrokerProcess] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connecting: Optional[asyncio.Lock] = None
+        self._next_id = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def ensure_connected(self):
+        if self.connected:
+            return
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self.connected:
+                return
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            self._writer = writer
+            self.reconnects += 1
+            terminal_tasks.spawn(self._read_loop(reader, writer), "broker_link")
+
+    def _allocate(self) -> int:
+        self._next_id = self._next_id % 0xFFFFFFFF + 1
+        return self._next_id
+
+    def new_process(self) -> BrokerProcess:
+        process = BrokerProcess(self, self._allocate())
+        self.channels[process.channel_id] = process
+        return process
+
+    def write(self, ftype: int, channel: int, payload: bytes = b""):
+        writer = self._writer
+        if writer is None or writer.is_closing():
+            return
+        writer.write(HEADER.pack(ftype, channel, len(payload)) + payload)
+        self.frames_out += 1
+        self.bytes_out += len(payload)
+
+    async def request(self, ftype: int, body: dict, request_id: int = 0) -> dict:
+        await self.ensure_connected()
+        request_id = request_id or self._allocate()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        self.write(ftype, request_id, _json(body))
+        try:
+            return await asyncio.wait_for(future, REQUEST_TIMEOUT)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                ftype, channel, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length) if length else b""
+                self.frames_in += 1
+                self.bytes_in += length
+                if ftype == F_DATA:
+                    process = self.channels.get(channel)
+                    if process is not None:
+                        process.stdout.feed(payload)
+                elif ftype == F_EXIT:
+                    process = self.channels.pop(channel, None)
+                    if process is not None:
+                        process.on_exit(json.loads(payload).get("exit_status"))
+                elif ftype in (F_OK, F_ERROR):
+                    future = self._pending.get(channel)
+                    if future is not None and not future.done():
+                        body = json.loads(payload) if payload else {}
+                        if ftype == F_OK:
+                            future.set_result(body)
+                        else:
+                            future.set_exception(_error_from(body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            logger.warning(f"Broker link {self.path} closed")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(BrokerError("broker 连接已断开"))
+            channels, self.channels = self.channels, {}
+            for process in channels.values():
+                process.on_exit(None)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "connected": self.connected,
+            "channels": len(self.channels),
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "reconnects": self.reconnects,
+        }
+
+
+class SSHBroker:
+    def __init__(self, sockets: List[str]):
+        self.links = [BrokerLink(path) for path in sockets]
+        self.opened = 0
+        self.attached = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.links)
+
+    def _link_for(self, key: str) -> BrokerLink:
+        # 固定映射：API 重启后同一 key 仍找到原来的工作进程
+        return self.links[zlib.crc32(key.encode()) % len(self.links)]
+
+    async def open_connection(self, key: str, params: dict) -> BrokerConnection:
+        link = self._link_for(key)
+        await link.request(F_OPEN, {"key": key, "params": params})
+        self.opened += 1
+        return BrokerConnection(link, key)
+
+    async def attach(self, key: str) -> Optional[tuple]:
+        """接回分离的会话，返回 (BrokerConnection, BrokerProcess)；不存在时返回 None"""
+        link = self._link_for(key)
+        try:
+            await link.ensure_connected()
+        except OSError:
+            return None
+        process = link.new_process()
+        try:
+            await link.request(F_ATTACH, {"key": key}, process.channel_id)
+        except BrokerError:
+            link.channels.pop(process.channel_id, None)
+            return None
+        self.attached += 1
+        return BrokerConnection(link, key, process.channel_id), process
+
+    async def stats(self) -> dict:
+        workers = []
+        for link in self.links:
+            try:
+                worker = await link.request(F_STATS, {})
+            except (OSError, asyncio.TimeoutError) as e:
+                worker = {"error": str(e)}
+            workers.append({**link.stats(), "worker": worker})
+        return {"enabled": self.enabled, "opened": self.opened, "attached": self.attached, "workers": workers}
+
+    def shutdown(self):
+        """只断开 socket：broker 把会话转为分离，API 重启后可接回"""
+        for link in self.links:
+            link.close()
+
+
+ssh_broker = SSHBroker(settings.TERMINAL_BROKER_SOCKETS)
+
+
+# ==================== broker 工作进程 ====================
+
+class _WorkerLink:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.closed = False
+        self.channels: Dict[int, "_WorkerChannel"] = {}
+
+    def write(self, ftype: int, channel: int, payload: bytes = b""):
+        if not self.closed:
+            self.writer.write(HEADER.pack(ftype, channel, len(payload)) + payload)
+
+    async def send(self, ftype: int, channel: int, payload: bytes = b""):
+        self.write(ftype, channel, payload)
+        if not self.closed:
+            try:
+                # 对端读得慢时在这里等待，进而暂停读取 SSH 通道
+                await self.writer.drain()
+            except ConnectionError:
+                self.closed = True
+
+
+class _WorkerChannel:
+    def __init__(self, session: "_WorkerSession", process: asyncssh.SSHClientProcess, pty: bool):
+        self.session = session
+        self.process = process
+        self.pty = pty
+        self.link: Optional[_WorkerLink] = None
+        self.channel_id = 0
+        self.backlog = bytearray()
+
+    def bind(self, link: _WorkerLink, channel_id: int):
+        self.link = link
+        self.channel_id = channel_id
+        link.channels[channel_id] = self
+
+    def unbind(self):
+        if self.link is not None:
+            self.link.channels.pop(self.channel_id, None)
+        self.link = None
+
+    async def pump(self):
+        try:
+            while True:
+                chunk = await self.process.stdout.read(READ_SIZE)
+                if not chunk:
+                    break
+                link = self.link
+                if link is not None and not link.closed:
+                    await link.send(F_DATA, self.channel_id, chunk)
+                elif self.pty:
+                    self.backlog += chunk
+                    if len(self.backlog) > DETACHED_BACKLOG:
+                        del self.backlog[:len(self.backlog) - DETACHED_BACKLOG]
+            await self.process.wait_closed()
+        except (asyncssh.Error, OSError):
+            pass
+        finally:
+            if self.link is not None:
+                self.link.write(F_EXIT, self.channel_id, _json({"exit_status": self.process.exit_status}))
+            self.unbind()
+            self.session.channels.discard(self)
+            if self.session.terminal is self:
+                self.session.terminal = None
+
+
+class _WorkerSession:
+    def __init__(self, key: str, conn: asyncssh.SSHClientConnection):
+        self.key = key
+        self.conn = conn
+        self.channels = set()
+        # 终端（PTY）通道：分离后保留，attach 时接回
+        self.terminal: Optional[_WorkerChannel] = None
+        # 终端最近一次接入的 (link, 通道 id)
+        self.attachment: Optional[tuple] = None
+        self.detached_at: Optional[float] = None
+
+    def superseded(self, link: "_WorkerLink", attachment: Optional[int]) -> bool:
+        """DETACH/CLOSE 来自已被新 attach 取代的接入"""
+        return attachment is not None and self.attachment is not None and self.attachment != (link, attachment)
+
+    def detach(self):
+        for channel in list(self.channels):
+            if channel.pty:
+                channel.unbind()
+            else:
+                channel.process.close()
+        self.detached_at = time.monotonic()
+
+    def close(self):
+        for channel in list(self.channels):
+            channel.process.close()
+        self.conn.close()
+
+
+class BrokerWorker:
+    def __init__(self, detach_ttl: float):
+        self.detach_ttl = detach_ttl
+        self.sessions: Dict[str, _WorkerSession] = {}
+        self.links = 0
+        self.expired = 0
+        self.superseded = 0
+
+    async def serve(self, path: str):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self._handle_link, path)
+        os.chmod(path, 0o600)
+        logger.info(f"SSH broker {os.getpid()} listening on {path}")
+        terminal_tasks.spawn(self._sweep(), "broker_sweep")
+        async with server:
+            await server.serve_forever()
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            now = time.monotonic()
+            for key, session in list(self.sessions.items()):
+                if session.detached_at is not None and now - session.detached_at >= self.detach_ttl:
+                    logger.info(f"Closing detached session {key}")
+                    self.sessions.pop(key, None)
+                    session.close()
+                    self.expired += 1
+
+    async def _handle_link(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        link = _WorkerLink(writer)
+        self.links += 1
+        try:
+            while True:
+                ftype, channel, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length) if length else b""
+                if ftype == F_DATA:
+                    target = link.channels.get(channel)
+                    if target is not None:
+                        target.process.stdin.write(payload)
+                elif ftype == F_RESIZE:
+                    target = link.channels.get(channel)
+                    if target is not None:
+                        try:
+                            target.process.change_terminal_size(*RESIZE.unpack(payload))
+                        except (asyncssh.Error, OSError):
+                            pass
+                elif ftype == F_CLOSE_CHANNEL:
+                    target = link.channels.pop(channel, None)
+                    if target is not None:
+                        target.link = None
+                        target.process.close()
+                elif ftype in (F_DETACH, F_CLOSE):
+                    body = json.loads(payload)
+                    session = self.sessions.get(body["key"])
+                    if session is not None and session.superseded(link, body.get("attachment")):
+                        self.superseded += 1
+                    elif session is not None:
+                        if ftype == F_DETACH:
+                            session.detach()
+                        else:
+                            del self.sessions[session.key]
+                            session.close()
+                elif ftype == F_ATTACH:
+                    self._attach(link, channel, json.loads(payload))
+                else:
+                    # 建连/开通道可能耗时数秒，不阻塞本 link 上其他会话的数据
+                    terminal_tasks.spawn(self._request(link, ftype, channel, payload), "broker_request")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            link.closed = True
+            for session in {c.session for c in link.channels.values()}:
+                # 终端已经接到别的 link 上时不能分离它
+                if session.attachment is None or session.attachment[0] is link:
+                    session.detach()
+            for channel in list(link.channels.values()):
+                if not channel.pty:
+                    channel.process.close()
+            writer.close()
+
+    def _attach(self, link: _WorkerLink, channel_id: int, body: dict):
+        session = self.sessions.get(body["key"])
+        terminal = session.terminal if session is not None else None
+        if terminal is None:
+            link.write(F_ERROR, channel_id, _json({"kind": "not_found", "message": "会话不存在或已结束"}))
+            return
+        terminal.unbind()
+        # 先回 OK 和分离期间的输出，再接上实时输出（同步写入，中间不让出事件循环）
+        link.write(F_OK, channel_id, b"{}")
+        if terminal.backlog:
+            link.write(F_DATA, channel_id, bytes(terminal.backlog))
+            terminal.backlog.clear()
+        terminal.bind(link, channel_id)
+        session.attachment = (link, channel_id)
+        session.detached_at = None
+
+    async def _request(self, link: _WorkerLink, ftype: int, request_id: int, payload: bytes):
+        try:
+            body = json.loads(payload) if payload else {}
+            if ftype == F_OPEN:
+                result = await self._open(body)
+            elif ftype == F_PROCESS:
+                result = await self._process(link, request_id, body)
+            elif ftype == F_STATS:
+                result = self.stats()
+            else:
+                raise BrokerError(f"unknown frame type {ftype}")
+            link.write(F_OK, request_id, _json(result))
+        except Exception as e:
+            link.write(F_ERROR, request_id, _json(_error_body(e)))
+
+    async def _open(self, body: dict) -> dict:
+        from app.ws.ssh_connect import open_ssh_connection
+
+        key = body["key"]
+        old = self.sessions.pop(key, None)
+        if old is not None:
+            old.close()
+        conn = await open_ssh_connection(body["params"])
+        self.sessions[key] = _WorkerSession(key, conn)
+        return {}
+
+    async def _process(self, link: _WorkerLink, channel_id: int, body: dict) -> dict:
+        session = self.sessions.get(body["key"])
+        if session is None:
+            raise BrokerError("会话不存在或已结束")
+        pty = bool(body.get("term_type"))
+        options = {"encoding": None}
+        if pty:
+            options["term_type"] = body["term_type"]
+            options["term_size"] = tuple(body["term_size"]) if body.get("term_size") else None
+        else:
+            options["stderr"] = asyncssh.STDOUT if body.get("merge_stderr") else asyncssh.DEVNULL
+        process = await session.conn.create_process(body.get("command"), **options)
+        channel = _WorkerChannel(session, process, pty)
+        channel.bind(link, channel_id)
+        session.channels.add(channel)
+        if pty:
+            session.terminal = channel
+            session.attachment = (link, channel_id)
+        terminal_tasks.spawn(channel.pump(), "broker_pump")
+        return {}
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "sessions": len(self.sessions),
+            "detached": sum(1 for s in self.sessions.values() if s.detached_at is not None),
+            "channels": sum(len(s.channels) for s in self.sessions.values()),
+            "links": self.links,
+            "expired": self.expired,
+            "superseded": self.superseded,
+        }
+
+
+def run_worker(path: str, detach_ttl: float):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s broker[%(process)d] %(levelname)s %(message)s")
+    try:
+        asyncio.run(BrokerWorker(detach_ttl).serve(path))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSH 会话 broker 工作进程")
+    parser.add_argument("--socket", required=True, help="socket 路径；--workers > 1 时用 {} 占位进程序号")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--detach-ttl", type=float, default=settings.TERMINAL_BROKER_DETACH_TTL)
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        run_worker(args.socket.format(0), args.detach_ttl)
+        return
+    if "{}" not in args.socket:
+        parser.error("--workers > 1 时 --socket 需要包含 {} 占位符")
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.socket.format(i), args.detach_ttl), daemon=False)
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    # 子进程启动后再安装，停止主进程时连带停止各工作进程
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    # app.ws 包初始化时已导入本模块，用包内那份（多进程 spawn 时 run_worker 才能按名称找到）
+    from app.ws.broker import main as _main
+    _main()
@@ -0,0 +1,177 @@
+"""
+只读命令结果缓存
+AI 会话里同样的探测命令（systemctl status、df -h、free -m）几分钟内反复执行，
+每次都要经过 PTY 往返和空闲检测。白名单内的无副作用命令以 (连接, 规范化命令) 为键缓存输出，
+TTL 很短；同一主机上输入任何不在白名单内的命令（视为可能有副作用）就清空该主机的缓存。
+只在 run_command 显式带 cache=true 时读缓存（opt-in）；写缓存在命令以提示符检测正常结束时进行。
+"""
+import shlex
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.config import settings
+
+MAX_CACHED_OUTPUT = 256 * 1024
+MAX_INPUT_LINE = 4096
+SEPARATORS = frozenset(("|", "&&", "||", ";"))
+PREFIX_COMMANDS = frozenset(("sudo", "command", "nice", "time"))
+# 允许的重定向：>& 1/2（合并 stderr），> /dev/null
+SAFE_REDIRECTS = {">&": ("1", "2"), ">": ("/dev/null",)}
+
+
+def _tokens(command: str) -> Optional[List[str]]:
+    if "$(" in command or "`" in command:
+        return None
+    # shlex 把换行当普通空白，而 shell 会把下一行当作另一条命令执行；控制字符（含 \n \r \t）一律拒绝
+    if any(ord(c) < 0x20 or ord(c) == 0x7f for c in command):
+        return None
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        return list(lexer)
+    except ValueError:
+        return None
+
+
+class CommandAllowList:
+    """白名单项按词前缀匹配：'systemctl status' 匹配 'systemctl status nginx'，不匹配 'systemctl restart'"""
+
+    def __init__(self, entries: List[str]):
+        self.entries = [tuple(entry.split()) for entry in entries if entry.strip()]
+
+    def _segment_allowed(self, words: List[str]) -> bool:
+        while words and words[0] in PREFIX_COMMANDS:
+            words = words[1:]
+        if not words:
+            return False
+        return any(tuple(words[:len(entry)]) == entry for entry in self.entries)
+
+    def normalize(self, command: str) -> Optional[str]:
+        """
+        命令的每一段（管道、&&、;）都在白名单内且没有写文件的重定向、命令替换、后台执行时，
+        返回规范化后的命令（统一空白和引号），否则返回 None
+        """
+        tokens = _tokens(command)
+        if not tokens:
+            return None
+        segment: List[str] = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in SEPARATORS:
+                if not self._segment_allowed(segment):
+                    return None
+                segment = []
+            elif token in SAFE_REDIRECTS:
+                if i + 1 >= len(tokens) or tokens[i + 1] not in SAFE_REDIRECTS[token]:
+                    return None
+                i += 1
+            elif token[0] in "<>&();":
+                return None
+            else:
+                segment.append(token)
+            i += 1
+        if not self._segment_allowed(segment):
+            return None
+        return " ".join(t if t in SEPARATORS or t in SAFE_REDIRECTS else shlex.quote(t) for t in tokens)
+
+
+class CommandResultCache:
+    def __init__(self, ttl: int, max_entries: int, allow_list: CommandAllowList):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.allow_list = allow_list
+        # (connection_id, 规范化命令) -> (写入时间, 主机, 输出)
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def lookup(self, session, command: str) -> Optional[Tuple[float, str]]:
+        """命中时返回 (缓存时长秒, 输出)"""
+        if self.ttl <= 0:
+            return None
+        key = self.allow_list.normalize(command)
+        entry = self._entries.get((session.connection_id, key)) if key else None
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end((session.connection_id, key))
+        return time.monotonic() - entry[0], entry[2]
+
+    def observe(self, session, command: str):
+        """会话里每提交一行命令调用一次：不在白名单内的命令可能改了主机状态，清空该主机的缓存"""
+        if self._entries and self.allow_list.normalize(command) is None:
+            self.invalidate_host(session.host)
+
+    def observe_input(self, session, data: str):
+        """
+        终端输入逐键到达，回车通常单独一帧：按会话拼出当前行，回车时对整行调用 observe。
+        行内出现方向键、Tab 补全、Ctrl 组合键等无法还原的编辑时，该行按未知命令处理（清空该主机的缓存）
+        """
+        if self.ttl <= 0:
+            return
+        line = session.input_line
+        for ch in data:
+            if ch == '\r' or ch == '\n':
+                if line is None:
+                    if self._entries:
+                        self.invalidate_host(session.host)
+                elif line.strip():
+                    self.observe(session, line)
+                line = ""
+            elif ch == '\x7f' or ch == '\b':
+                if line:
+                    line = line[:-1]
+            elif ch == '\x03' or ch == '\x15':
+                # Ctrl-C / Ctrl-U 丢弃当前行
+                line = ""
+            elif line is not None and ch >= ' ':
+                line += ch
+            else:
+                line = None
+        session.input_line = line if line is None or len(line) <= MAX_INPUT_LINE else None
+
+    def store(self, session, output: str):
+        """被监视的命令以提示符检测结束时调用；命令取自会话上正在计时的 PendingCommand"""
+        pending = session.timing
+        if self.ttl <= 0 or pending is None or len(output) > MAX_CACHED_OUTPUT:
+            return
+        key = self.allow_list.normalize(pending.command)
+        if key is None:
+            return
+        self._entries[(session.connection_id, key)] = (time.monotonic(), session.host, output)
+        self._entries.move_to_end((session.connection_id, key))
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_host(self, host: str):
+        stale = [key for key, entry in self._entries.items() if entry[1] == host]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "entries": len(self._entries),
+            "allow_list": [" ".join(entry) for entry in self.allow_list.entries],
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+        }
+
+
+command_cache = CommandResultCache(
+    ttl=settings.TERMINAL_COMMAND_CACHE_TTL,
+    max_entries=settings.TERMINAL_COMMAND_CACHE_SIZE,
+    allow_list=CommandAllowList(settings.TERMINAL_COMMAND_CACHE_ALLOWLIST),
+)
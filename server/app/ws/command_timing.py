@@ -0,0 +1,202 @@
+"""
+命令耗时采集
+被监视的命令在回车时开始计时，读循环记录第一块输出时间和输出字节数，
+command_finished 时生成一条记录放进内存缓冲，由后台任务按间隔批量写入 command_timings。
+读循环里只做几次赋值和加法，不碰数据库。
+"""
+import asyncio
+import logging
+import shlex
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.command_timing import CommandTiming
+from app.services.redaction import redact
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+MAX_FAMILY_LENGTH = 64
+MAX_COMMAND_LENGTH = 512
+# 命令族里要带上子命令的工具（"apt update" 和 "apt install" 耗时差别很大）
+SUBCOMMAND_TOOLS = frozenset((
+    "apt", "apt-get", "yum", "dnf", "zypper", "apk", "brew", "snap",
+    "git", "docker", "podman", "kubectl", "helm", "systemctl", "service", "journalctl",
+    "npm", "yarn", "pnpm", "pip", "pip3", "cargo", "go", "make", "terraform", "ansible-playbook",
+))
+PREFIX_COMMANDS = frozenset(("sudo", "time", "nice", "nohup", "env", "exec", "command", "doas"))
+# 带参数的选项：跳过选项时连同下一个词一起跳过（sudo -u postgres psql 归为 psql）
+OPTION_ARGUMENTS = {
+    "sudo": frozenset(("-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t", "-U")),
+    "doas": frozenset(("-u", "-C")),
+    "env": frozenset(("-u", "-C", "-S")),
+    "nice": frozenset(("-n",)),
+    "time": frozenset(("-f", "-o")),
+    "git": frozenset(("-C", "-c", "--git-dir", "--work-tree", "--namespace")),
+    "docker": frozenset(("-H", "--host", "-c", "--context", "--config", "-l", "--log-level")),
+    "podman": frozenset(("-c", "--connection", "--url", "--root")),
+    "kubectl": frozenset(("-n", "--namespace", "--context", "--kubeconfig", "-s", "--server")),
+    "helm": frozenset(("-n", "--namespace", "--kube-context", "--kubeconfig")),
+    "make": frozenset(("-C", "-f", "-I")),
+    "terraform": frozenset(("-chdir",)),
+}
+
+
+def command_family(command: str) -> str:
+    """
+    归并命令族：去掉 sudo/env 等前缀和 VAR=value 赋值，取程序名（去路径）；
+    SUBCOMMAND_TOOLS 里的工具再带第一个非选项参数
+    """
+    try:
+        words = shlex.split(command, comments=True)
+    except ValueError:
+        words = command.split()
+    # 只看管道/命令列表里的第一段
+    for i, word in enumerate(words):
+        if word in ("|", "||", "&&", ";", "&"):
+            words = words[:i]
+            break
+    i = 0
+    option_arguments = frozenset()
+    while i < len(words):
+        word = words[i]
+        if word in PREFIX_COMMANDS:
+            option_arguments = OPTION_ARGUMENTS.get(word, frozenset())
+        elif word in option_arguments:
+            i += 1
+        elif not word.startswith("-") and "=" not in word:
+            break
+        i += 1
+    if i >= len(words):
+        return (command.split() or ["?"])[0][:MAX_FAMILY_LENGTH]
+    program = words[i].rsplit("/", 1)[-1]
+    family = program
+    if program in SUBCOMMAND_TOOLS:
+        option_arguments = OPTION_ARGUMENTS.get(program, frozenset())
+        rest = iter(words[i + 1:])
+        for word in rest:
+            if word in option_arguments:
+                next(rest, None)
+            elif not word.startswith("-"):
+                family = f"{program} {word}"
+                break
+    return family[:MAX_FAMILY_LENGTH]
+
+
+class PendingCommand:
+    """正在执行的命令（挂在 TerminalSession.timing 上）"""
+
+    __slots__ = ('command', 'started', 'started_wall', 'first_output', 'bytes_out')
+
+    def __init__(self, command: str):
+        self.command = command
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+        self.first_output = 0.0
+        self.bytes_out = 0
+
+    def on_output(self, nbytes: int):
+        if not self.first_output:
+            self.first_output = time.monotonic()
+        self.bytes_out += nbytes
+
+
+class CommandTimingRecorder:
+    def __init__(self, flush_interval: float, max_buffer: int):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+
+    def finish(self, session, detection: str):
+        """command_finished 时调用：把会话上的 PendingCommand 转成一条记录"""
+        pending = session.timing
+        session.timing = None
+        if pending is None or not settings.TERMINAL_COMMAND_TIMING_ENABLED:
+            return
+        now = time.monotonic()
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        command = redact(pending.command)
+        self._buffer.append({
+            "user_id": session.user_id,
+            "connection_id": session.connection_id,
+            "host": session.host,
+            "family": command_family(command),
+            "command": command[:MAX_COMMAND_LENGTH],
+            "started_at": datetime.fromtimestamp(pending.started_wall, timezone.utc),
+            "first_output_ms": int((pending.first_output - pending.started) * 1000) if pending.first_output else None,
+            "duration_ms": int((now - pending.started) * 1000),
+            "bytes_out": pending.bytes_out,
+            "detection": detection,
+        })
+        self.recorded += 1
+        self._ensure_running()
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = terminal_tasks.spawn(self._run(), "timing_flush")
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        """一个 executemany 写入全部缓冲记录；失败时放回缓冲，下一轮重试"""
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        start = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(CommandTiming), rows)
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Command timing flush failed ({len(rows)} rows): {e}")
+            room = self.max_buffer - len(self._buffer)
+            self.dropped += max(0, len(rows) - room)
+            self._buffer = rows[:max(0, room)] + self._buffer
+            return
+        self.written += len(rows)
+        self.flushes += 1
+        self.flush_seconds += time.perf_counter() - start
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "pending": len(self._buffer),
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "avg_flush_ms": round(self.flush_seconds / self.flushes * 1000, 2) if self.flushes else 0.0,
+        }
+
+
+command_timings = CommandTimingRecorder(
+    flush_interval=settings.TERMINAL_COMMAND_TIMING_FLUSH_INTERVAL,
+    max_buffer=settings.TERMINAL_COMMAND_TIMING_BUFFER,
+)
@@ -0,0 +1,248 @@
+"""
+服务端补全
+在会话已有的 SSH 连接上另开 exec 通道运行 compgen（命令、路径）或 `<cmd> --help`（选项），
+结果按 (主机, 类别, 目录/命令) 建成前缀树缓存，TTL + LRU 淘汰；
+同一主机同一目录只拉取一次，之后的补全直接查树，不经过远端。
+选项补全只对 TERMINAL_COMPLETION_HELP_COMMANDS 里的系统命令执行 `--help`（在 / 下、按默认 PATH 查找），
+不会替用户运行任意程序。
+"""
+import asyncio
+import logging
+import re
+import shlex
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import asyncssh
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = 10
+MAX_WORDS = 20000
+OPTION_RE = re.compile(r'(?<![\w-])(--?[A-Za-z0-9][\w-]*)')
+# 管道、命令分隔符之后重新开始一个命令
+SEGMENT_RE = re.compile(r'\|\|?|&&|;|\$\(|`')
+
+
+class PrefixTrie:
+    """
+    字典嵌套的前缀树；构建时先排序再插入，
+    每层子节点字典的插入顺序即字典序，查询时无需再排序
+    """
+    __slots__ = ('_root', 'size')
+
+    def __init__(self, words=()):
+        self._root: dict = {}
+        self.size = 0
+        for word in sorted(set(words)):
+            self.insert(word)
+
+    def insert(self, word: str):
+        node = self._root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        if '' not in node:
+            # 空串键标记单词结尾
+            node[''] = True
+            self.size += 1
+
+    def complete(self, prefix: str, limit: int = 50) -> List[str]:
+        node = self._root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        results: List[str] = []
+        # 按字典序深度优先，收集到 limit 个即停止
+        stack = [(prefix, node)]
+        while stack and len(results) < limit:
+            word, node = stack.pop()
+            if '' in node:
+                results.append(word)
+            for ch in reversed(node):
+                if ch:
+                    stack.append((word + ch, node[ch]))
+        return results
+
+
+def parse_completion_line(line: str) -> Tuple[str, str, Optional[str]]:
+    """
+    拆出待补全的词及其类别
+    返回 (kind, word, command)：kind 为 command / option / path，command 为当前命令名（选项补全用）
+    """
+    segment = SEGMENT_RE.split(line)[-1].lstrip()
+    if not segment or segment[-1].isspace():
+        tokens = segment.split()
+        word = ""
+    else:
+        tokens = segment.split()
+        word = tokens.pop() if tokens else ""
+    command = tokens[0] if tokens else None
+
+    if command is None and '/' not in word:
+        return "command", word, None
+    if word.startswith('-') and command:
+        return "option", word, command
+    return "path", word, command
+
+
+class CompletionCache:
+    def __init__(self, ttl: int, max_entries: int, help_commands=()):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.help_commands = frozenset(help_commands)
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.fetch_failures = 0
+        self.fetch_seconds = 0.0
+        self.lookup_seconds = 0.0
+        self.lookups = 0
+
+    def _get(self, key: tuple) -> Optional[PrefixTrie]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, trie = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return trie
+
+    def _put(self, key: tuple, trie: PrefixTrie):
+        self._entries[key] = (time.monotonic() + self.ttl, trie)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, ssh_conn: asyncssh.SSHClientConnection, script: str, encoding: str) -> List[str]:
+        start = time.perf_counter()
+        try:
+            result = await ssh_conn.run(
+                f"bash --norc --noprofile -c {shlex.quote(script)}",
+                timeout=FETCH_TIMEOUT, encoding=encoding, errors="replace"
+            )
+        finally:
+            self.fetch_seconds += time.perf_counter() - start
+        words = (result.stdout or "").splitlines()
+        return words[:MAX_WORDS]
+
+    async def _trie_for(self, key: tuple, ssh_conn, script: str, encoding: str, parse=None) -> Tuple[PrefixTrie, bool]:
+        trie = self._get(key)
+        if trie is not None:
+            self.hits += 1
+            return trie, True
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending), True
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            output = await self._fetch(ssh_conn, script, encoding)
+            words = parse(output) if parse else output
+            trie = PrefixTrie(w for w in words if w)
+            self._put(key, trie)
+            future.set_result(trie)
+            return trie, False
+        except BaseException as e:
+            self.fetch_failures += 1
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def complete(
+        self,
+        host_key: str,
+        ssh_conn: asyncssh.SSHClientConnection,
+        line: str,
+        cwd: str = "~",
+        encoding: str = "utf-8",
+        limit: int = 50
+    ) -> dict:
+        kind, word, command = parse_completion_line(line)
+
+        if kind == "command":
+            key = (host_key, "command")
+            script = "compgen -c -A function -A alias -A builtin | sort -u"
+            trie, cached = await self._trie_for(key, ssh_conn, script, encoding)
+            prefix = word
+        elif kind == "option":
+            if command not in self.help_commands:
+                return {"kind": kind, "word": word, "completions": [], "cached": False, "lookup_us": 0.0}
+            key = (host_key, "option", command)
+            # command -p 按默认 PATH 找系统命令，不走别名、函数和用户目录里的同名程序
+            script = f"cd / && command -p {shlex.quote(command)} --help 2>&1 | head -n 500"
+            trie, cached = await self._trie_for(
+                key, ssh_conn, script, encoding,
+                parse=lambda lines: sorted({m for l in lines for m in OPTION_RE.findall(l)})
+            )
+            prefix = word
+        else:
+            directory, _, prefix = word.rpartition('/')
+            if word.startswith('/'):
+                directory = directory or '/'
+            target = directory if directory.startswith(('/', '~')) else f"{cwd.rstrip('/')}/{directory}" if directory else cwd
+            key = (host_key, "path", target)
+            # 目录带 / 后缀，文件名原样；~ 需要 shell 展开，不加引号
+            quoted = target if target == '~' else (
+                '~/' + shlex.quote(target[2:]) if target.startswith('~/') else shlex.quote(target)
+            )
+            script = f"cd {quoted} 2>/dev/null && {{ compgen -d -S / -- ''; compgen -f -- ''; }}"
+            trie, cached = await self._trie_for(key, ssh_conn, script, encoding)
+
+        start = time.perf_counter()
+        matches = trie.complete(prefix, limit)
+        if kind == "path":
+            # compgen -f 也会列出目录，已有 "名字/" 时去掉不带 / 的重复项
+            names = set(matches)
+            matches = [m for m in matches if m + '/' not in names]
+            base = word[:len(word) - len(prefix)]
+            matches = [base + m for m in matches]
+        elapsed = time.perf_counter() - start
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+
+        return {
+            "kind": kind,
+            "word": word,
+            "completions": matches,
+            "cached": cached,
+            "lookup_us": round(elapsed * 1e6, 1),
+        }
+
+    def invalidate(self, host_key: str):
+        for key in [k for k in self._entries if k[0] == host_key]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "entries": len(self._entries),
+            "words": sum(trie.size for _, trie in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "fetch_failures": self.fetch_failures,
+            "avg_fetch_ms": round(self.fetch_seconds * 1000 / self.misses, 2) if self.misses else 0.0,
+            "avg_lookup_us": round(self.lookup_seconds * 1e6 / self.lookups, 2) if self.lookups else 0.0,
+        }
+
+
+completion_cache = CompletionCache(
+    ttl=settings.TERMINAL_COMPLETION_TTL,
+    max_entries=settings.TERMINAL_COMPLETION_CACHE_SIZE,
+    help_commands=settings.TERMINAL_COMPLETION_HELP_COMMANDS,
+)
@@ -0,0 +1,180 @@
+"""
+按键回显延迟
+客户端给 data/input 消息带上 seq 时，服务端记录写入 stdin 的时间，读循环收到其后第一块输出时：
+- server_echo：stdin 写入 → 第一块输出（SSH 链路 + 远端主机）
+- forward：读到该输出块 → 发到 WebSocket（本服务的调度/编码/发送）
+并回一条 {"type": "echo", "seq", "server_ms"}；客户端用 latency_report 上报端到端延迟（client_e2e）。
+loop_lag 由后台任务定时采样事件循环的调度延迟。
+各项按主机和会话分别维护固定桶直方图，管理员接口查看。
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from app.config import settings
+from app.ws.tasks import terminal_tasks
+
+# 桶上界（毫秒），最后一个桶收所有更大的值
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+KINDS = ("server_echo", "forward", "client_e2e", "loop_lag")
+MAX_HOSTS = 1000
+MAX_REPORT_SAMPLES = 100
+MAX_SAMPLE_MS = 60000.0
+
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p: float) -> float:
+        """取所在桶的上界，不超过观测到的最大值"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(self.count * p / 100 + 0.999999))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return round(min(BUCKETS_MS[i], self.max) if i < len(BUCKETS_MS) else self.max, 1)
+        return round(self.max, 1)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": round(self.max, 1),
+            "buckets": {
+                (f"le_{b}" if i < len(BUCKETS_MS) else "inf"): n
+                for i, (b, n) in enumerate(zip(BUCKETS_MS + (None,), self.counts))
+            },
+        }
+
+
+def _new_group() -> Dict[str, LatencyHistogram]:
+    return {kind: LatencyHistogram() for kind in KINDS}
+
+
+class EchoLatencyTracker:
+    def __init__(self, loop_lag_interval: float):
+        self.loop_lag_interval = loop_lag_interval
+        self.overall = _new_group()
+        self._hosts: OrderedDict = OrderedDict()
+        self._sessions: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+
+    def _groups(self, session) -> tuple:
+        host = self._hosts.get(session.host)
+        if host is None:
+            host = self._hosts[session.host] = _new_group()
+            while len(self._hosts) > MAX_HOSTS:
+                self._hosts.popitem(last=False)
+        else:
+            self._hosts.move_to_end(session.host)
+        own = self._sessions.get(session.client_id)
+        if own is None:
+            own = self._sessions[session.client_id] = _new_group()
+        return self.overall, host, own
+
+    def _observe(self, session, kind: str, ms: float):
+        for group in self._groups(session):
+            group[kind].observe(ms)
+
+    def on_input(self, session, seq):
+        """带 seq 的输入写入 stdin 后调用；上一条还没等到输出时不覆盖（只测最早那次按键）"""
+        if session.echo_pending is None:
+            session.echo_pending = (seq, time.monotonic())
+        self._ensure_running()
+
+    def on_output(self, session) -> tuple:
+        """读循环收到输出块时调用（echo_pending 不为空时），返回 (seq, 读到的时间, server_echo 毫秒)"""
+        seq, written = session.echo_pending
+        session.echo_pending = None
+        now = time.monotonic()
+        server_ms = (now - written) * 1000
+        self._observe(session, "server_echo", server_ms)
+        return seq, now, server_ms
+
+    def on_forwarded(self, session, read_at: float):
+        self._observe(session, "forward", (time.monotonic() - read_at) * 1000)
+
+    def on_report(self, session, samples: Iterable) -> int:
+        """客户端上报的端到端延迟（毫秒）；返回接受的样本数"""
+        accepted = 0
+        for value in list(samples)[:MAX_REPORT_SAMPLES]:
+            try:
+                ms = float(value)
+            except (TypeError, ValueError, OverflowError):
+                continue
+            if 0 <= ms <= MAX_SAMPLE_MS:
+                self._observe(session, "client_e2e", ms)
+                accepted += 1
+        return accepted
+
+    def release(self, client_id: str):
+        """会话结束时丢弃会话级直方图（主机级保留）"""
+        self._sessions.pop(client_id, None)
+
+    # ---------- 事件循环延迟采样 ----------
+
+    def _ensure_running(self):
+        if self.loop_lag_interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = terminal_tasks.spawn(self._sample_loop_lag(), "loop_lag")
+
+    async def _sample_loop_lag(self):
+        interval = self.loop_lag_interval
+        histogram = self.overall["loop_lag"]
+        try:
+            while True:
+                start = time.monotonic()
+                await asyncio.sleep(interval)
+                histogram.observe(max(0.0, (time.monotonic() - start - interval) * 1000))
+        except asyncio.CancelledError:
+            pass
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self, host: Optional[str] = None, client_id: Optional[str] = None) -> dict:
+        def dump(group) -> dict:
+            return {kind: h.snapshot() for kind, h in group.items() if h.count}
+
+        result = {"overall": dump(self.overall)}
+        if client_id is not None:
+            group = self._sessions.get(client_id)
+            result["session"] = dump(group) if group else {}
+        elif host is not None:
+            group = self._hosts.get(host)
+            result["host"] = dump(group) if group else {}
+        else:
+            result["hosts"] = {name: dump(group) for name, group in self._hosts.items()}
+            result["sessions"] = len(self._sessions)
+        return result
+
+
+echo_latency = EchoLatencyTracker(loop_lag_interval=settings.TERMINAL_LOOP_LAG_INTERVAL)
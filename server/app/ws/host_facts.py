@@ -0,0 +1,222 @@
+"""
+主机环境信息（facts）
+连接建立后在同一条 SSH 连接上另开一个 exec 通道，运行一次批量脚本采集
+系统、内核、CPU、内存、磁盘、包管理器、init、shell 等信息，按 Connection 缓存（TTL）。
+AI 对话时直接把缓存的摘要放进系统提示词，省掉先跑 uname/df/nproc 探测环境的几轮对话。
+"""
+import asyncio
+import logging
+import shlex
+import time
+from typing import Dict, Optional, Tuple
+
+import asyncssh
+
+from app.config import settings
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+FACTS_TIMEOUT = 10
+MAX_DISKS = 8
+MAX_VALUE_LENGTH = 200
+
+# POSIX sh，逐项输出 key=value；缺的命令静默跳过。disk/tool 可以出现多次
+FACTS_SCRIPT = r"""
+if [ -r /etc/os-release ]; then . /etc/os-release; echo "os=${PRETTY_NAME:-$NAME $VERSION_ID}"; echo "os_id=$ID"; fi
+echo "kernel=$(uname -srm)"
+echo "hostname=$(hostname 2>/dev/null || uname -n)"
+echo "cpus=$(nproc 2>/dev/null || getconf _NPROCESSORS_ONLN 2>/dev/null)"
+echo "cpu_model=$(grep -m1 'model name' /proc/cpuinfo 2>/dev/null | cut -d: -f2- | sed 's/^ *//')"
+awk '/^MemTotal:/{print "mem_total_kb="$2} /^MemAvailable:/{print "mem_available_kb="$2}' /proc/meminfo 2>/dev/null
+for pm in apt-get dnf yum zypper apk pacman brew; do
+    if command -v $pm >/dev/null 2>&1; then echo "package_manager=$pm"; break; fi
+done
+echo "init=$(ps -p 1 -o comm= 2>/dev/null)"
+echo "shell=${SHELL}"
+echo "user=$(id -un 2>/dev/null)"
+echo "uid=$(id -u 2>/dev/null)"
+for t in systemctl docker podman kubectl git python3 sudo; do
+    if command -v $t >/dev/null 2>&1; then echo "tool=$t"; fi
+done
+df -hP -x tmpfs -x devtmpfs -x overlay -x squashfs 2>/dev/null | awk 'NR>1{print "disk="$6" "$2" "$5}'
+"""
+
+
+def parse_facts(output: str) -> dict:
+    facts: dict = {"disks": [], "tools": []}
+    for line in output.splitlines():
+        key, sep, value = line.partition("=")
+        value = value.strip()[:MAX_VALUE_LENGTH]
+        if not sep or not value:
+            continue
+        if key == "disk":
+            if len(facts["disks"]) < MAX_DISKS:
+                facts["disks"].append(value)
+        elif key == "tool":
+            facts["tools"].append(value)
+        else:
+            facts[key] = value
+    return facts
+
+
+def _gib(kb: Optional[str]) -> Optional[str]:
+    try:
+        return f"{int(kb) / 1048576:.1f} GiB"
+    except (TypeError, ValueError):
+        return None
+
+
+def format_facts(facts: dict, age: float = 0.0) -> str:
+    """生成放进系统提示词的摘要"""
+    lines = [f"目标主机环境（{int(age // 60)} 分钟前自动采集，无需再执行 uname、df、nproc 等命令探测）："]
+    system = facts.get("os") or ""
+    if facts.get("kernel"):
+        system = f"{system}（{facts['kernel']}）" if system else facts["kernel"]
+    if system:
+        lines.append(f"- 系统：{system}")
+    if facts.get("hostname"):
+        lines.append(f"- 主机名：{facts['hostname']}")
+    if facts.get("cpus"):
+        cpu = f"{facts['cpus']} 核"
+        if facts.get("cpu_model"):
+            cpu += f"（{facts['cpu_model']}）"
+        lines.append(f"- CPU：{cpu}")
+    total, available = _gib(facts.get("mem_total_kb")), _gib(facts.get("mem_available_kb"))
+    if total:
+        lines.append(f"- 内存：共 {total}" + (f"，可用 {available}" if available else ""))
+    if facts.get("disks"):
+        lines.append("- 磁盘（挂载点 容量 已用）：" + "；".join(facts["disks"]))
+    env = []
+    for key, label in (("package_manager", "包管理器"), ("init", "init"), ("shell", "shell")):
+        if facts.get(key):
+            env.append(f"{label} {facts[key]}")
+    if facts.get("user"):
+        root = facts.get("uid") == "0" and facts["user"] != "root"
+        env.append(f"当前用户 {facts['user']}" + ("（uid 0）" if root else ""))
+    if env:
+        lines.append("- " + "，".join(env))
+    if facts.get("tools"):
+        lines.append("- 已安装：" + ", ".join(facts["tools"]))
+    return "\n".join(lines)
+
+
+class HostFactsCache:
+    """
+    connection_id -> (采集时间, facts)；
+    _sources 记录每个 Connection 当前在线的一条 SSH 连接，过期后首次 AI 调用时用它重新采集
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, dict]] = {}
+        self._sources: Dict[str, Tuple[asyncssh.SSHClientConnection, str]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.gathers = 0
+        self.failures = 0
+        self.gather_seconds = 0.0
+
+    def _fresh(self, connection_id: str) -> Optional[Tuple[float, dict]]:
+        entry = self._entries.get(connection_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._entries[connection_id]
+            return None
+        return entry
+
+    def attach(self, connection_id: str, ssh_conn: asyncssh.SSHClientConnection, encoding: str):
+        """会话连接建立后调用：登记采集来源，缓存不新鲜时在后台采集（不阻塞连接流程）"""
+        if self.ttl <= 0:
+            return
+        self._sources[connection_id] = (ssh_conn, encoding)
+        if self._fresh(connection_id) is None:
+            self._start(connection_id)
+
+    def detach(self, connection_id: str, ssh_conn: asyncssh.SSHClientConnection):
+        source = self._sources.get(connection_id)
+        if source is not None and source[0] is ssh_conn:
+            del self._sources[connection_id]
+
+    def _start(self, connection_id: str) -> Optional[asyncio.Task]:
+        task = self._inflight.get(connection_id)
+        if task is not None:
+            return task
+        source = self._sources.get(connection_id)
+        if source is None:
+            return None
+        task = terminal_tasks.spawn(self._gather(connection_id, *source), "host_facts")
+        self._inflight[connection_id] = task
+        return task
+
+    async def _gather(self, connection_id: str, ssh_conn: asyncssh.SSHClientConnection, encoding: str) -> Optional[dict]:
+        start = time.perf_counter()
+        self.gathers += 1
+        try:
+            result = await ssh_conn.run(
+                f"sh -c {shlex.quote(FACTS_SCRIPT)}",
+                timeout=FACTS_TIMEOUT, encoding=encoding, errors="replace"
+            )
+            facts = parse_facts(result.stdout or "")
+            self._entries[connection_id] = (time.monotonic(), facts)
+            return facts
+        except Exception as e:
+            self.failures += 1
+            logger.info(f"Host facts for {connection_id} failed: {e}")
+            return None
+        finally:
+            self.gather_seconds += time.perf_counter() - start
+            self._inflight.pop(connection_id, None)
+
+    async def get(self, connection_id: str, wait: float = 3.0) -> Optional[Tuple[float, dict]]:
+        """
+        返回 (已过去秒数, facts)；缓存过期且有在线连接时重新采集，最多等待 wait 秒，
+        超时则本次不带环境信息（采集继续在后台完成，下次命中）
+        """
+        entry = self._fresh(connection_id)
+        if entry is None:
+            self.misses += 1
+            task = self._start(connection_id)
+            if task is None:
+                return None
+            try:
+                await asyncio.wait_for(asyncio.shield(task), wait)
+            except asyncio.TimeoutError:
+                return None
+            entry = self._fresh(connection_id)
+            if entry is None:
+                return None
+        else:
+            self.hits += 1
+        return time.monotonic() - entry[0], entry[1]
+
+    async def prompt_section(self, connection_id: Optional[str]) -> str:
+        if not connection_id or self.ttl <= 0:
+            return ""
+        entry = await self.get(connection_id)
+        if entry is None:
+            return ""
+        age, facts = entry
+        return format_facts(facts, age)
+
+    def invalidate(self, connection_id: str):
+        self._entries.pop(connection_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "entries": len(self._entries),
+            "sources": len(self._sources),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "gathers": self.gathers,
+            "failures": self.failures,
+            "avg_gather_ms": round(self.gather_seconds * 1000 / self.gathers, 2) if self.gathers else 0.0,
+        }
+
+
+host_facts = HostFactsCache(ttl=settings.LLM_HOST_FACTS_TTL)
@@ -0,0 +1,264 @@
+"""
+远程日志跟踪
+每个文件一个 exec 通道运行 `tail -F`（同一连接上的多个文件共用一条 SSH 连接），
+在服务端做 include/exclude 正则过滤和行数限速，只把命中的行（带主机、文件标记）批量推给前端。
+带宽和浏览器负载随命中行数增长，与原始日志量无关。
+"""
+import asyncio
+import codecs
+import logging
+import re
+import shlex
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import asyncssh
+
+from app.ws.ssh_connect import open_ssh_connection
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 65536
+MAX_LINE_LENGTH = 4096
+ERROR_LINES_PER_FILE = 20
+# 开头的全局标志如 (?i)，合并后不在表达式开头会编译失败，改写成只作用于本分支的 (?i:...)
+GLOBAL_FLAGS_RE = re.compile(r'\(\?([aiLmsux]+)\)')
+
+
+def _scoped(pattern: str) -> str:
+    flags = ""
+    m = GLOBAL_FLAGS_RE.match(pattern)
+    while m:
+        flags += m.group(1)
+        pattern = pattern[m.end():]
+        m = GLOBAL_FLAGS_RE.match(pattern)
+    if not flags:
+        return f'(?:{pattern})'
+    # 冗长模式下行尾注释会吞掉右括号，换行后再闭合
+    return f'(?{flags}:{pattern}\n)' if 'x' in flags else f'(?{flags}:{pattern})'
+
+
+def _combine(patterns: List[str]) -> Optional[re.Pattern]:
+    if not patterns:
+        return None
+    # 整块扫描时 ^/$ 要匹配每一行的行首行尾
+    return re.compile('|'.join(_scoped(p) for p in patterns), re.MULTILINE)
+
+
+class LineFilter:
+    """include 任一命中且 exclude 均不命中的行才保留；没有 include 时全部保留"""
+
+    def __init__(self, include: List[str], exclude: List[str]):
+        self.include = _combine(include)
+        self.exclude = _combine(exclude)
+
+    def filter_block(self, text: str) -> List[str]:
+        """text 由完整行组成（以换行结尾），返回命中的行"""
+        include, exclude = self.include, self.exclude
+        # 去掉 CRLF 里的 \r，`timeout$` 这类行尾匹配才能命中
+        text = text.replace('\r\n', '\n')
+        if include is None:
+            lines = text.splitlines()
+        else:
+            # 先在整块上 finditer（C 层扫描），只对命中位置所在的行做逐行确认，
+            # 未命中的行不进入 Python 循环
+            lines = []
+            last_end = -1
+            for m in include.finditer(text):
+                start = text.rfind('\n', 0, m.start()) + 1
+                if start <= last_end:
+                    continue
+                end = text.find('\n', m.start())
+                if end < 0:
+                    end = len(text)
+                last_end = end
+                line = text[start:end]
+                if include.search(line):
+                    lines.append(line)
+        if exclude is not None:
+            lines = [line for line in lines if not exclude.search(line)]
+        return lines
+
+
+class LineRateLimiter:
+    """令牌桶：每秒最多放行 rate 行，允许 1 秒的突发"""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.last = time.monotonic()
+
+    def take(self, count: int) -> int:
+        if self.rate <= 0:
+            return count
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.last) * self.rate, float(self.rate))
+        self.last = now
+        allowed = min(count, int(self.tokens))
+        self.tokens -= allowed
+        return allowed
+
+
+class TailSource:
+    """一条连接上要跟踪的文件"""
+
+    __slots__ = ('label', 'params', 'encoding', 'files')
+
+    def __init__(self, label: str, params: dict, encoding: str, files: List[str]):
+        self.label = label
+        self.params = params
+        self.encoding = encoding
+        self.files = files
+
+
+class LogTail:
+    def __init__(
+        self,
+        sources: List[TailSource],
+        line_filter: LineFilter,
+        max_lines_per_second: int = 200,
+        backlog_lines: int = 0,
+        queue_size: int = 5000
+    ):
+        self.sources = sources
+        self.filter = line_filter
+        self.limiter = LineRateLimiter(max_lines_per_second)
+        self.backlog_lines = backlog_lines
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._conns: List[asyncssh.SSHClientConnection] = []
+        self._running = 0
+        self.raw_bytes = 0
+        self.raw_lines = 0
+        self.matched_lines = 0
+        self.sent_lines = 0
+        self.dropped_lines = 0
+
+    async def start(self):
+        """建立连接并为每个文件打开 tail 通道；任一连接失败则整体失败"""
+        try:
+            for source in self.sources:
+                conn = await open_ssh_connection(source.params)
+                self._conns.append(conn)
+                for path in source.files:
+                    command = f"tail -n {int(self.backlog_lines)} -F -- {shlex.quote(path)}"
+                    process = await conn.create_process(command, encoding=None)
+                    self._running += 1
+                    self._tasks.append(terminal_tasks.spawn(self._follow(source, path, process), "tail_follow"))
+        except BaseException:
+            await self.stop()
+            raise
+
+    def _emit(self, event: dict) -> bool:
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _follow(self, source: TailSource, path: str, process: asyncssh.SSHClientProcess):
+        decoder = codecs.getincrementaldecoder(source.encoding)(errors="replace")
+        stderr_task = terminal_tasks.spawn(self._follow_errors(source, path, process), "tail_stderr")
+        pending = ""
+        try:
+            while True:
+                raw = await process.stdout.read(READ_SIZE)
+                if not raw:
+                    break
+                self.raw_bytes += len(raw)
+                text = pending + decoder.decode(raw)
+                cut = text.rfind('\n') + 1
+                if cut == 0:
+                    # 超长无换行的内容截断，避免缓冲无限增长
+                    pending = text[-MAX_LINE_LENGTH:]
+                    continue
+                block, pending = text[:cut], text[cut:]
+                self.raw_lines += block.count('\n')
+                lines = self.filter.filter_block(block)
+                if not lines:
+                    continue
+                self.matched_lines += len(lines)
+                allowed = self.limiter.take(len(lines))
+                self.dropped_lines += len(lines) - allowed
+                now = time.time()
+                for line in lines[:allowed]:
+                    event = {"host": source.label, "file": path, "line": line[:MAX_LINE_LENGTH], "ts": now}
+                    if not self._emit(event):
+                        self.dropped_lines += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Tail {source.label}:{path} ended: {e}")
+        finally:
+            stderr_task.cancel()
+            self._running -= 1
+            self._emit({"host": source.label, "file": path, "closed": True})
+
+    async def _follow_errors(self, source: TailSource, path: str, process: asyncssh.SSHClientProcess):
+        """tail 的报错（文件不存在、无权限等）原样转发，不参与过滤"""
+        try:
+            for _ in range(ERROR_LINES_PER_FILE):
+                line = await process.stderr.readline()
+                if not line:
+                    return
+                self._emit({
+                    "host": source.label, "file": path,
+                    "error": line.decode(source.encoding, errors="replace").rstrip()
+                })
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "files_following": self._running,
+            "raw_bytes": self.raw_bytes,
+            "raw_lines": self.raw_lines,
+            "matched_lines": self.matched_lines,
+            "sent_lines": self.sent_lines,
+            "dropped_lines": self.dropped_lines,
+        }
+
+    async def batches(self, flush_interval: float = 0.2, max_batch: int = 500) -> AsyncIterator[dict]:
+        """
+        按 flush_interval 聚合事件：
+        {"type": "tail_lines", "lines": [...]}、{"type": "tail_error", ...}、{"type": "tail_closed", ...}，
+        以及每批附带的 {"type": "tail_stats"}；所有文件结束后停止
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            lines: List[dict] = []
+            others: List[dict] = []
+            deadline = loop.time() + flush_interval
+            while len(lines) < max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if "line" in event:
+                    lines.append(event)
+                elif "error" in event:
+                    others.append({"type": "tail_error", **event})
+                else:
+                    others.append({"type": "tail_closed", "host": event["host"], "file": event["file"]})
+            for event in others:
+                yield event
+            if lines:
+                self.sent_lines += len(lines)
+                yield {"type": "tail_lines", "lines": lines, "stats": self.stats()}
+            if self._running <= 0 and self._queue.empty():
+                yield {"type": "tail_end", "stats": self.stats()}
+                return
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        for conn in self._conns:
+            conn.close()
+        self._conns.clear()
@@ -0,0 +1,167 @@
+"""
+并行只读探测
+AI 诊断问题时一次给出一批只读命令，服务端在会话已有的 SSH 连接上各开一个 exec 通道并发执行
+（不经过 PTY，不需要提示符/空闲检测），每条命令独立超时和输出上限，结果一次性返回给下一轮对话。
+总耗时从各命令耗时之和降到其中最慢的一条。
+只执行只读命令白名单（与结果缓存共用）内的命令，其余直接拒绝。
+"""
+import asyncio
+import logging
+import time
+from typing import List
+
+import asyncssh
+
+from app.config import settings
+from app.services.redaction import redact
+from app.ws.command_cache import CommandAllowList, command_cache
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 16384
+
+
+async def _read_capped(process: asyncssh.SSHClientProcess, buf: bytearray, limit: int) -> bool:
+    """读到 EOF 或 limit 字节；返回是否截断。读到的内容直接写进 buf，超时时部分输出仍可用"""
+    while True:
+        chunk = await process.stdout.read(READ_SIZE)
+        if not chunk:
+            return False
+        room = limit - len(buf)
+        if len(chunk) >= room:
+            buf += chunk[:room]
+            return True
+        buf += chunk
+
+
+class ProbeRunner:
+    def __init__(self, allow_list: CommandAllowList, parallel: int, timeout: float, output_limit: int, max_commands: int):
+        self.allow_list = allow_list
+        self.parallel = parallel
+        self.timeout = timeout
+        self.output_limit = output_limit
+        self.max_commands = max_commands
+        self.batches = 0
+        self.commands = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wall_seconds = 0.0
+        self.sum_seconds = 0.0
+
+    async def _run_one(
+        self,
+        ssh_conn: asyncssh.SSHClientConnection,
+        semaphore: asyncio.Semaphore,
+        command: str,
+        encoding: str,
+        timeout: float
+    ) -> dict:
+        result = {"command": command, "status": "ok", "exit_status": None, "output": "", "truncated": False, "duration_ms": 0}
+        buf = bytearray()
+        async with semaphore:
+            start = time.perf_counter()
+            process = None
+            try:
+                process = await asyncio.wait_for(
+                    ssh_conn.create_process(command, encoding=None, stderr=asyncssh.STDOUT), timeout
+                )
+                remaining = max(timeout - (time.perf_counter() - start), 0.1)
+                result["truncated"] = await asyncio.wait_for(_read_capped(process, buf, self.output_limit), remaining)
+                if result["truncated"]:
+                    # 截断后直接关闭通道，退出码没有读到
+                    result["status"] = "truncated"
+                else:
+                    await asyncio.wait_for(process.wait_closed(), 1.0)
+                    result["exit_status"] = process.exit_status
+                    if process.exit_status:
+                        result["status"] = "error"
+            except asyncio.TimeoutError:
+                result["status"] = "timeout"
+                self.timeouts += 1
+            except (asyncssh.Error, OSError) as e:
+                result["status"] = "error"
+                result["output"] = str(e)
+            finally:
+                if process is not None:
+                    process.close()
+                result["duration_ms"] = int((time.perf_counter() - start) * 1000)
+        if buf:
+            result["output"] = redact(buf.decode(encoding, errors="replace"))
+        return result
+
+    async def run(
+        self,
+        ssh_conn: asyncssh.SSHClientConnection,
+        commands: List[str],
+        encoding: str = "utf-8",
+        timeout: float = 0
+    ) -> dict:
+        """
+        返回 {"results": [...], "wall_ms", "sum_ms", "context"}；results 与 commands 顺序一致，
+        status 为 ok / error / timeout / truncated / rejected；context 是给下一轮对话用的文本
+        """
+        # 0、负数、NaN 都按默认超时
+        timeout = min(timeout, self.timeout) if timeout > 0 else self.timeout
+        commands = [c.strip() for c in commands if c and c.strip()][:self.max_commands]
+        semaphore = asyncio.Semaphore(self.parallel)
+        start = time.perf_counter()
+
+        async def probe(command: str) -> dict:
+            if self.allow_list.normalize(command) is None:
+                self.rejected += 1
+                return {
+                    "command": command, "status": "rejected", "exit_status": None,
+                    "output": "不在只读命令白名单内，未执行", "truncated": False, "duration_ms": 0
+                }
+            return await self._run_one(ssh_conn, semaphore, command, encoding, timeout)
+
+        results = await asyncio.gather(*(probe(c) for c in commands))
+        wall = time.perf_counter() - start
+        total = sum(r["duration_ms"] for r in results) / 1000
+        self.batches += 1
+        self.commands += len(results)
+        self.wall_seconds += wall
+        self.sum_seconds += total
+        return {
+            "results": results,
+            "wall_ms": int(wall * 1000),
+            "sum_ms": int(total * 1000),
+            "context": format_probe_results(results),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "parallel": self.parallel,
+            "batches": self.batches,
+            "commands": self.commands,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wall_ms": round(self.wall_seconds * 1000 / self.batches, 1) if self.batches else 0.0,
+            # 串行执行同样的命令所需时间 / 实际耗时
+            "speedup": round(self.sum_seconds / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+        }
+
+
+def format_probe_results(results: List[dict]) -> str:
+    sections = []
+    for r in results:
+        if r["status"] == "ok":
+            head = f"$ {r['command']}  (exit 0, {r['duration_ms']} ms)"
+        elif r["status"] == "error" and r["exit_status"] is not None:
+            head = f"$ {r['command']}  (exit {r['exit_status']}, {r['duration_ms']} ms)"
+        else:
+            head = f"$ {r['command']}  ({r['status']}, {r['duration_ms']} ms)"
+        body = r["output"].rstrip()
+        if r["truncated"]:
+            body += "\n[输出已截断]"
+        sections.append(f"{head}\n{body}" if body else head)
+    return "\n\n".join(sections)
+
+
+probe_runner = ProbeRunner(
+    allow_list=command_cache.allow_list,
+    parallel=settings.TERMINAL_PROBE_PARALLEL,
+    timeout=settings.TERMINAL_PROBE_TIMEOUT,
+    output_limit=settings.TERMINAL_PROBE_OUTPUT_LIMIT,
+    max_commands=settings.TERMINAL_PROBE_MAX_COMMANDS,
+)
@@ -0,0 +1,180 @@
+"""
+SSH 建连的地址解析与并行连接
+- 解析结果按 TTL 缓存，避免每次 connect 都重新解析 DNS
+- 多个地址按 Happy Eyeballs（RFC 8305）方式交错发起 TCP 连接：IPv6/IPv4 交替，
+  每隔 stagger 秒或上一个尝试失败时立即启动下一个，第一个成功的 socket 交给 asyncssh，
+  最坏延迟取决于最快可达的地址，而不是各地址超时之和
+getaddrinfo 不返回记录的 TTL，缓存时间取 SSH_DNS_CACHE_TTL；全部地址连接失败时丢弃缓存重新解析。
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _is_ip_literal(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def interleave_families(infos: List[tuple]) -> List[tuple]:
+    """按地址族交替排列，首个地址族保持 getaddrinfo 给出的优先顺序"""
+    if not infos:
+        return []
+    first_family = infos[0][0]
+    primary = [i for i in infos if i[0] == first_family]
+    secondary = [i for i in infos if i[0] != first_family]
+    result = []
+    for idx in range(max(len(primary), len(secondary))):
+        if idx < len(primary):
+            result.append(primary[idx])
+        if idx < len(secondary):
+            result.append(secondary[idx])
+    return result
+
+
+class AddressCache:
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[tuple]]] = {}
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.races = 0
+        self.race_fallbacks = 0
+        self.race_failures = 0
+
+    async def resolve(self, host: str, port: int) -> List[tuple]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        # 同一主机并发解析只发起一次
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            infos = interleave_families(list(dict.fromkeys(infos)))
+            if self.ttl > 0 and not _is_ip_literal(host):
+                self._entries[key] = (time.monotonic() + self.ttl, infos)
+            future.set_result(infos)
+            return infos
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def invalidate(self, host: str, port: int):
+        self._entries.pop((host, port), None)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "cached_hosts": sum(1 for exp, _ in self._entries.values() if exp > now),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "races": self.races,
+            # 首选地址未能胜出、由后续地址完成连接的次数
+            "race_fallbacks": self.race_fallbacks,
+            "race_failures": self.race_failures,
+        }
+
+
+address_cache = AddressCache(ttl=settings.SSH_DNS_CACHE_TTL)
+
+
+async def _attempt(loop: asyncio.AbstractEventLoop, info: tuple) -> socket.socket:
+    family, type_, proto, _, addr = info
+    sock = socket.socket(family, type_, proto)
+    try:
+        sock.setblocking(False)
+        await loop.sock_connect(sock, addr)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+
+async def connect_fastest(
+    host: str,
+    port: int,
+    stagger: Optional[float] = None,
+    cache: AddressCache = address_cache
+) -> socket.socket:
+    """解析（走缓存）后交错竞速连接所有地址，返回第一个连上的 socket"""
+    stagger = settings.SSH_CONNECT_ATTEMPT_DELAY if stagger is None else stagger
+    loop = asyncio.get_running_loop()
+    infos = await cache.resolve(host, port)
+    if not infos:
+        raise OSError(f"No address found for {host}")
+    cache.races += 1
+
+    pending: Dict[asyncio.Task, int] = {}
+    errors: List[Exception] = []
+    winner: Optional[socket.socket] = None
+    winner_index = -1
+    next_index = 0
+    try:
+        while winner is None and (pending or next_index < len(infos)):
+            if next_index < len(infos):
+                task = asyncio.create_task(_attempt(loop, infos[next_index]))
+                pending[task] = next_index
+                next_index += 1
+                # 还有地址未启动时最多等 stagger 秒，任一尝试结束（成功或失败）就提前醒来
+                timeout = stagger if next_index < len(infos) else None
+            else:
+                timeout = None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                if task.exception() is None:
+                    if winner is None:
+                        winner, winner_index = task.result(), index
+                    else:
+                        task.result().close()
+                else:
+                    errors.append(task.exception())
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            results = await asyncio.gather(*pending, return_exceptions=True)
+            for result in results:
+                if isinstance(result, socket.socket):
+                    result.close()
+
+    if winner is None:
+        cache.race_failures += 1
+        cache.invalidate(host, port)
+        if len(errors) == 1:
+            raise errors[0]
+        raise OSError(f"All {len(infos)} addresses of {host}:{port} failed: " + "; ".join(str(e) for e in errors))
+
+    if winner_index > 0:
+        cache.race_fallbacks += 1
+        logger.info(f"Connected to {host}:{port} via address #{winner_index} ({len(errors)} attempts failed)")
+    return winner
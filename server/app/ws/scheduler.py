@@ -0,0 +1,132 @@
+"""
+终端输出公平调度（Deficit Round Robin）
+所有会话共用一个事件循环，持续大量输出的会话会连续 send 占住循环。
+小块输出（按键回显等）直接放行；大块输出需向调度器申请发送额度，
+调度器每轮给每个排队会话补 quantum 字节，额度够了才放行一块，
+轮与轮之间让出事件循环。另可按角色限制单会话吞吐（令牌桶）。
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTUM = 64 * 1024
+# 不超过该大小的输出块视为交互输出，不参与排队
+INTERACTIVE_CHUNK_SIZE = 1024
+
+
+class SessionShare:
+    """单个会话在调度器中的状态"""
+
+    __slots__ = ('client_id', 'rate_limit', 'deficit', 'waiters', 'tokens', 'last_refill', 'bytes_sent')
+
+    def __init__(self, client_id: str, rate_limit: int = 0):
+        self.client_id = client_id
+        self.rate_limit = rate_limit
+        self.deficit = 0
+        self.waiters: deque = deque()
+        self.tokens = float(rate_limit)
+        self.last_refill = 0.0
+        self.bytes_sent = 0
+
+
+class FairShareScheduler:
+    def __init__(self, quantum: int = DEFAULT_QUANTUM, interactive_size: int = INTERACTIVE_CHUNK_SIZE):
+        self.quantum = quantum
+        self.interactive_size = interactive_size
+        self._sessions: Dict[str, SessionShare] = {}
+        self._active: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, client_id: str, rate_limit: int = 0) -> SessionShare:
+        share = SessionShare(client_id, rate_limit)
+        self._sessions[client_id] = share
+        return share
+
+    def unregister(self, client_id: str, share: Optional[SessionShare] = None):
+        if share is not None and self._sessions.get(client_id) is not share:
+            return
+        share = self._sessions.pop(client_id, None)
+        if not share:
+            return
+        while share.waiters:
+            fut, _ = share.waiters.popleft()
+            if not fut.done():
+                fut.cancel()
+        try:
+            self._active.remove(share)
+        except ValueError:
+            pass
+
+    async def acquire(self, share: SessionShare, nbytes: int):
+        """发送 nbytes 之前调用；交互小块立即返回，大块按 DRR 排队"""
+        if share.rate_limit:
+            await self._throttle(share, nbytes)
+        share.bytes_sent += nbytes
+        if nbytes <= self.interactive_size:
+            return
+
+        self._ensure_running()
+        fut = asyncio.get_running_loop().create_future()
+        if not share.waiters:
+            self._active.append(share)
+        share.waiters.append((fut, nbytes))
+        self._wakeup.set()
+        await fut
+
+    async def _throttle(self, share: SessionShare, nbytes: int):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if share.last_refill:
+            share.tokens = min(
+                share.tokens + (now - share.last_refill) * share.rate_limit,
+                float(share.rate_limit)
+            )
+        share.last_refill = now
+        share.tokens -= nbytes
+        if share.tokens < 0:
+            await asyncio.sleep(-share.tokens / share.rate_limit)
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = terminal_tasks.spawn(self._run(), "output_scheduler")
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._active:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                for _ in range(len(self._active)):
+                    share = self._active.popleft()
+                    share.deficit += self.quantum
+                    while share.waiters and share.waiters[0][1] <= share.deficit:
+                        fut, nbytes = share.waiters.popleft()
+                        share.deficit -= nbytes
+                        if not fut.done():
+                            fut.set_result(None)
+                    if share.waiters:
+                        self._active.append(share)
+                    else:
+                        share.deficit = 0
+
+                # 一轮结束，让放行的会话去发送，也让交互输出插队
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Output scheduler error: {e}", exc_info=True)
+
+
+output_scheduler = FairShareScheduler()
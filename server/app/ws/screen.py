@@ -0,0 +1,451 @@
+"""
+服务端虚拟终端屏幕模型（VT100/xterm 子集）
+由 read_ssh_output 增量喂入输出，维护当前屏幕网格、光标位置和备用屏幕状态，
+供 AI 上下文和交互检测使用。只保留当前屏幕，不保存回滚缓冲。
+每行存为定长字符串，空行共享同一个对象，空闲会话的屏幕几乎不占内存。
+"""
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+from typing import List, Tuple
+
+# 一次匹配一个控制序列：CSI / OSC / 字符集指定 / 其他 ESC / 单个 C0 控制符
+_SEQ_RE = re.compile(
+    r'\x1b\[([\x30-\x3f]*)[\x20-\x2f]*([\x40-\x7e])'
+    r'|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)'
+    r'|\x1b[()*+][\x20-\x7e]'
+    r'|\x1b[\x20-\x2f]*[\x30-\x7e]'
+    r'|[\x00-\x1f\x7f]'
+)
+# 颜色属性不影响纯文本渲染，先整体剔除以减少逐序列分派
+_SGR_RE = re.compile(r'\x1b\[[0-9;:]*m')
+# 输出块末尾未结束的转义序列
+_INCOMPLETE_RE = re.compile(
+    r'\x1b(?:\[[\x30-\x3f]*[\x20-\x2f]*|\][^\x07\x1b]*|[()*+]|[\x20-\x2f]*)\Z'
+)
+# 分包时挂起的不完整转义序列最大长度，超过则丢弃
+MAX_PENDING_SEQUENCE = 4096
+ALT_SCREEN_MODES = ('1049', '1047', '47')
+# 宽字符第二格的占位符，渲染时去掉
+WIDE_FILLER = '\x00'
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7f]+')
+
+
+@lru_cache(maxsize=4096)
+def _char_width(ch: str) -> int:
+    if unicodedata.combining(ch):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+
+class TerminalScreen:
+    """单个会话的屏幕状态，feed() 可按任意分块调用"""
+
+    __slots__ = (
+        'cols', 'rows', 'x', 'y', 'alternate_screen', 'cursor_visible',
+        '_buffer', '_main_buffer', '_saved_cursor', '_main_saved_cursor',
+        '_top', '_bottom', '_wrap_pending', '_pending', '_blank',
+    )
+
+    def __init__(self, cols: int = 120, rows: int = 30):
+        self.cols = max(cols, 1)
+        self.rows = max(rows, 1)
+        self.x = 0
+        self.y = 0
+        self.alternate_screen = False
+        self.cursor_visible = True
+        self._blank = ' ' * self.cols
+        self._buffer = self._blank_screen()
+        self._main_buffer = None
+        self._saved_cursor = (0, 0)
+        self._main_saved_cursor = (0, 0)
+        self._top = 0
+        self._bottom = self.rows - 1
+        self._wrap_pending = False
+        self._pending = ''
+
+    # ---------- 公共接口 ----------
+
+    def feed(self, data: str):
+        """增量处理一段终端输出（不完整的转义序列留待下一块）"""
+        if self._pending:
+            data = self._pending + data
+            self._pending = ''
+        esc = data.rfind('\x1b')
+        if esc != -1 and len(data) - esc < MAX_PENDING_SEQUENCE \
+                and _INCOMPLETE_RE.match(data, esc):
+            self._pending = data[esc:]
+            data = data[:esc]
+        if '\x1b[' in data:
+            data = _SGR_RE.sub('', data)
+
+        pos = 0
+        for m in _SEQ_RE.finditer(data):
+            start = m.start()
+            if start > pos:
+                self._draw(data[pos:start])
+            pos = m.end()
+            seq = m.group()
+            if len(seq) == 1:
+                self._control(seq)
+            elif seq[1] == '[':
+                self._dispatch_csi(m.group(1), m.group(2))
+            elif seq[1] != ']':
+                self._escape(seq)
+        if pos < len(data):
+            self._draw(data[pos:])
+
+    def resize(self, cols: int, rows: int):
+        cols, rows = max(cols, 1), max(rows, 1)
+        blank = ' ' * cols
+        for buf in (self._buffer, self._main_buffer):
+            if buf is None:
+                continue
+            for i, row in enumerate(buf):
+                buf[i] = blank if row == self._blank else row.ljust(cols)[:cols]
+            if len(buf) > rows and buf is self._buffer:
+                # 缩小时优先保留光标所在的底部内容
+                drop = min(len(buf) - rows, max(self.y + 1 - rows, 0))
+                del buf[:drop]
+                self.y -= drop
+            del buf[rows:]
+            while len(buf) < rows:
+                buf.append(blank)
+        self._blank = blank
+        self.cols, self.rows = cols, rows
+        self.x = min(self.x, cols - 1)
+        self.y = min(self.y, rows - 1)
+        self._top, self._bottom = 0, rows - 1
+        self._wrap_pending = False
+
+    @property
+    def cursor(self) -> Tuple[int, int]:
+        return self.x, self.y
+
+    def display(self) -> List[str]:
+        """逐行返回屏幕文本（去掉行尾空白）"""
+        return [
+            (row.replace(WIDE_FILLER, '') if WIDE_FILLER in row else row).rstrip()
+            for row in self._buffer
+        ]
+
+    def render(self) -> str:
+        """整屏纯文本，去掉底部空行"""
+        lines = self.display()
+        while lines and not lines[-1]:
+            lines.pop()
+        return '\n'.join(lines)
+
+    def snapshot(self) -> dict:
+        return {
+            "content": self.render(),
+            "cursor": [self.x, self.y],
+            "cols": self.cols,
+            "rows": self.rows,
+            "alternate_screen": self.alternate_screen,
+        }
+
+    def memory_usage(self) -> int:
+        """屏幕占用的字节数估算，共享的空行只计一次"""
+        rows = {}
+        size = sys.getsizeof(self)
+        for buf in (self._buffer, self._main_buffer):
+            if buf is None:
+                continue
+            size += sys.getsizeof(buf)
+            for row in buf:
+                rows[id(row)] = row
+        return size + sum(sys.getsizeof(r) for r in rows.values()) + sys.getsizeof(self._pending)
+
+    # ---------- 字符输出 ----------
+
+    def _blank_screen(self) -> List[str]:
+        return [self._blank] * self.rows
+
+    def _draw(self, text: str):
+        if text.isascii():
+            self._draw_ascii(text)
+            return
+        pos = 0
+        for m in _NON_ASCII_RE.finditer(text):
+            if m.start() > pos:
+                self._draw_ascii(text[pos:m.start()])
+            self._draw_wide(m.group())
+            pos = m.end()
+        if pos < len(text):
+            self._draw_ascii(text[pos:])
+
+    def _draw_ascii(self, text: str):
+        cols = self.cols
+        while text:
+            if self._wrap_pending:
+                self._wrap_pending = False
+                self.x = 0
+                self._linefeed()
+            x = self.x
+            chunk = text[:cols - x]
+            text = text[len(chunk):]
+            row = self._buffer[self.y]
+            x_end = x + len(chunk)
+            self._buffer[self.y] = row[:x] + chunk + row[x_end:]
+            x = x_end
+            if x >= cols:
+                self.x = cols - 1
+                self._wrap_pending = True
+            else:
+                self.x = x
+
+    def _draw_wide(self, text: str):
+        cols = self.cols
+        for ch in text:
+            width = _char_width(ch)
+            if width == 0:
+                continue
+            if width > cols:
+                width = 1
+            if self._wrap_pending or self.x + width > cols:
+                self._wrap_pending = False
+                self.x = 0
+                self._linefeed()
+            row = self._buffer[self.y]
+            x = self.x
+            # 宽字符占两格，第二格放占位符
+            cell = ch + WIDE_FILLER if width == 2 else ch
+            self._buffer[self.y] = row[:x] + cell + row[x + width:]
+            x += width
+            if x >= cols:
+                self.x = cols - 1
+                self._wrap_pending = True
+            else:
+                self.x = x
+
+    def _control(self, ch: str):
+        if ch == '\r':
+            self.x = 0
+            self._wrap_pending = False
+        elif ch in '\n\x0b\x0c':
+            self._linefeed()
+        elif ch == '\b':
+            if self._wrap_pending:
+                self._wrap_pending = False
+            elif self.x > 0:
+                self.x -= 1
+        elif ch == '\t':
+            self.x = min((self.x // 8 + 1) * 8, self.cols - 1)
+
+    def _linefeed(self):
+        self._wrap_pending = False
+        if self.y == self._bottom:
+            self._scroll_region_up(1)
+        elif self.y < self.rows - 1:
+            self.y += 1
+
+    def _reverse_index(self):
+        if self.y == self._top:
+            self._scroll_region_down(1)
+        elif self.y > 0:
+            self.y -= 1
+
+    def _scroll_region_up(self, n: int):
+        buf = self._buffer
+        for _ in range(min(n, self._bottom - self._top + 1)):
+            del buf[self._top]
+            buf.insert(self._bottom, self._blank)
+
+    def _scroll_region_down(self, n: int):
+        buf = self._buffer
+        for _ in range(min(n, self._bottom - self._top + 1)):
+            del buf[self._bottom]
+            buf.insert(self._top, self._blank)
+
+    # ---------- ESC / CSI ----------
+
+    def _escape(self, seq: str):
+        final = seq[-1]
+        if len(seq) != 2:
+            return
+        if final == '7':
+            self._saved_cursor = (self.x, self.y)
+        elif final == '8':
+            self._restore_cursor(None)
+        elif final == 'D':
+            self._linefeed()
+        elif final == 'E':
+            self.x = 0
+            self._linefeed()
+        elif final == 'M':
+            self._reverse_index()
+        elif final == 'c':
+            self.__init__(self.cols, self.rows)
+
+    def _dispatch_csi(self, params: str, final: str):
+        if params[:1] == '?':
+            if final in 'hl':
+                self._set_private_mode(params[1:].split(';'), final == 'h')
+            return
+        if final == 'm':
+            return
+        if params:
+            try:
+                args = [int(p) if p else 0 for p in params.split(';')]
+            except ValueError:
+                return
+        else:
+            args = []
+        handler = _CSI_HANDLERS.get(final)
+        if handler:
+            self._wrap_pending = False
+            handler(self, args)
+
+    def _set_private_mode(self, modes: List[str], enable: bool):
+        for mode in modes:
+            if mode in ALT_SCREEN_MODES:
+                if enable and not self.alternate_screen:
+                    if mode == '1049':
+                        self._main_saved_cursor = (self.x, self.y)
+                    self._main_buffer = self._buffer
+                    self._buffer = self._blank_screen()
+                    self.alternate_screen = True
+                elif not enable and self.alternate_screen:
+                    self._buffer = self._main_buffer
+                    self._main_buffer = None
+                    self.alternate_screen = False
+                    if mode == '1049':
+                        self.x, self.y = self._main_saved_cursor
+                        self.x = min(self.x, self.cols - 1)
+                        self.y = min(self.y, self.rows - 1)
+                self._wrap_pending = False
+            elif mode == '25':
+                self.cursor_visible = enable
+
+    @staticmethod
+    def _arg(args: List[int], i: int = 0, default: int = 1) -> int:
+        if len(args) > i and args[i]:
+            return args[i]
+        return default
+
+    def _cursor_up(self, args):
+        self.y = max(self.y - self._arg(args), self._top if self.y >= self._top else 0)
+
+    def _cursor_down(self, args):
+        self.y = min(self.y + self._arg(args), self._bottom if self.y <= self._bottom else self.rows - 1)
+
+    def _cursor_forward(self, args):
+        self.x = min(self.x + self._arg(args), self.cols - 1)
+
+    def _cursor_back(self, args):
+        self.x = max(self.x - self._arg(args), 0)
+
+    def _cursor_next_line(self, args):
+        self._cursor_down(args)
+        self.x = 0
+
+    def _cursor_prev_line(self, args):
+        self._cursor_up(args)
+        self.x = 0
+
+    def _cursor_column(self, args):
+        self.x = min(self._arg(args) - 1, self.cols - 1)
+
+    def _cursor_row(self, args):
+        self.y = min(self._arg(args) - 1, self.rows - 1)
+
+    def _cursor_position(self, args):
+        self.y = min(self._arg(args, 0) - 1, self.rows - 1)
+        self.x = min(self._arg(args, 1) - 1, self.cols - 1)
+
+    def _erase_display(self, args):
+        mode = args[0] if args else 0
+        buf = self._buffer
+        if mode == 0:
+            self._erase_line([0])
+            for r in range(self.y + 1, self.rows):
+                buf[r] = self._blank
+        elif mode == 1:
+            self._erase_line([1])
+            for r in range(self.y):
+                buf[r] = self._blank
+        elif mode in (2, 3):
+            self._buffer[:] = self._blank_screen()
+
+    def _erase_line(self, args):
+        mode = args[0] if args else 0
+        row, x = self._buffer[self.y], self.x
+        if mode == 2 or (mode == 0 and x == 0):
+            self._buffer[self.y] = self._blank
+        elif mode == 0:
+            self._buffer[self.y] = row[:x] + self._blank[x:]
+        elif mode == 1:
+            self._buffer[self.y] = self._blank[:x + 1] + row[x + 1:]
+
+    def _insert_lines(self, args):
+        if self._top <= self.y <= self._bottom:
+            buf = self._buffer
+            for _ in range(min(self._arg(args), self._bottom - self.y + 1)):
+                del buf[self._bottom]
+                buf.insert(self.y, self._blank)
+            self.x = 0
+
+    def _delete_lines(self, args):
+        if self._top <= self.y <= self._bottom:
+            buf = self._buffer
+            for _ in range(min(self._arg(args), self._bottom - self.y + 1)):
+                del buf[self.y]
+                buf.insert(self._bottom, self._blank)
+            self.x = 0
+
+    def _delete_chars(self, args):
+        row, x = self._buffer[self.y], self.x
+        n = min(self._arg(args), self.cols - x)
+        self._buffer[self.y] = row[:x] + row[x + n:] + ' ' * n
+
+    def _insert_chars(self, args):
+        row, x = self._buffer[self.y], self.x
+        n = min(self._arg(args), self.cols - x)
+        self._buffer[self.y] = (row[:x] + ' ' * n + row[x:])[:self.cols]
+
+    def _erase_chars(self, args):
+        row, x = self._buffer[self.y], self.x
+        n = min(self._arg(args), self.cols - x)
+        self._buffer[self.y] = row[:x] + ' ' * n + row[x + n:]
+
+    def _scroll_up(self, args):
+        self._scroll_region_up(self._arg(args))
+
+    def _scroll_down(self, args):
+        self._scroll_region_down(self._arg(args))
+
+    def _set_margins(self, args):
+        top = self._arg(args, 0) - 1
+        bottom = self._arg(args, 1, self.rows) - 1
+        bottom = min(bottom, self.rows - 1)
+        if top < bottom:
+            self._top, self._bottom = top, bottom
+            self.x, self.y = 0, 0
+
+    def _save_cursor(self, args):
+        self._saved_cursor = (self.x, self.y)
+
+    def _restore_cursor(self, args):
+        x, y = self._saved_cursor
+        self.x = min(x, self.cols - 1)
+        self.y = min(y, self.rows - 1)
+        self._wrap_pending = False
+
+
+# CSI 终结字符 -> 处理方法（类级共享，避免每个会话一份绑定方法表）
+_CSI_HANDLERS = {
+    'A': TerminalScreen._cursor_up, 'B': TerminalScreen._cursor_down,
+    'C': TerminalScreen._cursor_forward, 'D': TerminalScreen._cursor_back,
+    'E': TerminalScreen._cursor_next_line, 'F': TerminalScreen._cursor_prev_line,
+    'G': TerminalScreen._cursor_column, '`': TerminalScreen._cursor_column,
+    'd': TerminalScreen._cursor_row, 'H': TerminalScreen._cursor_position,
+    'f': TerminalScreen._cursor_position, 'J': TerminalScreen._erase_display,
+    'K': TerminalScreen._erase_line, 'L': TerminalScreen._insert_lines,
+    'M': TerminalScreen._delete_lines, 'P': TerminalScreen._delete_chars,
+    '@': TerminalScreen._insert_chars, 'X': TerminalScreen._erase_chars,
+    'S': TerminalScreen._scroll_up, 'T': TerminalScreen._scroll_down,
+    'r': TerminalScreen._set_margins, 's': TerminalScreen._save_cursor,
+    'u': TerminalScreen._restore_cursor,
+}
@@ -0,0 +1,146 @@
+"""
+终端会话状态
+替代原先 conn_info 里的自由字典：固定字段（__slots__）、单调时钟浮点时间戳、
+有界命令记录，不持有 ORM 对象和数据库会话，便于上万并发会话的内存预算。
+"""
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from app.services.redaction import redact
+
+# 命令记录只保留最近的条数（会话结束时写入 SessionLog 的也是最近 100 条）
+MAX_COMMANDS_LOG = 100
+
+
+class TerminalSession:
+    __slots__ = (
+        'client_id', 'user_id', 'connection_id', 'host', 'username',
+        'ssh_conn', 'ssh_process', 'output_task', 'websocket', 'session_log_id',
+        'encoding', 'binary', 'prompt_pattern', 'screen',
+        'commands_log', 'watching_command', 'command_output_buffer',
+        'last_output_time', 'last_input_time', 'last_ws_activity', 'watch_start_time',
+        'interactive_state', 'interactive_notified', 'output_analysis',
+        'viewers', 'triggers', 'timing', 'command_waiter', 'echo_pending', 'input_line', 'created_at', '_wall_offset',
+    )
+
+    def __init__(
+        self,
+        client_id: str,
+        user_id: str,
+        connection_id: str,
+        host: str,
+        username: str,
+        ssh_conn=None,
+        ssh_process=None,
+        session_log_id: Optional[str] = None,
+        encoding: str = "utf-8",
+        binary: bool = False,
+        prompt_pattern=None,
+        screen=None,
+    ):
+        self.client_id = client_id
+        self.user_id = user_id
+        self.connection_id = connection_id
+        self.host = host
+        self.username = username
+        self.ssh_conn = ssh_conn
+        self.ssh_process = ssh_process
+        self.output_task = None
+        # 所有者的 WebSocket，空闲回收时用来通知并关闭
+        self.websocket = None
+        self.session_log_id = session_log_id
+        self.encoding = encoding
+        self.binary = binary
+        self.prompt_pattern = prompt_pattern
+        self.screen = screen
+        # (单调时钟时间, 命令)
+        self.commands_log: deque = deque(maxlen=MAX_COMMANDS_LOG)
+        self.watching_command = False
+        self.command_output_buffer = ""
+        self.last_output_time = 0.0
+        self.watch_start_time = 0.0
+        self.interactive_state: Optional[str] = None
+        self.interactive_notified = False
+        self.output_analysis = None
+        # 共享观看者（ViewerGroup），首次共享时创建
+        self.viewers = None
+        # 触发规则扫描器（TriggerScanner），连接建立后设置
+        self.triggers = None
+        # 正在计时的命令（PendingCommand），command_finished 时写入耗时记录
+        self.timing = None
+        # 服务端 agent 等待的命令结果（Future[(输出, 检测方式)]），command_finished 时完成
+        self.command_waiter = None
+        # 等待回显的带 seq 输入 (seq, 写入 stdin 的单调时钟时间)
+        self.echo_pending = None
+        # 逐键输入拼出的当前行（命令缓存失效判断用），出现无法还原的编辑时为 None
+        self.input_line: Optional[str] = ""
+        self.created_at = time.monotonic()
+        # 空闲回收依据：最近一次终端输入 / 所有者 WebSocket 上的任意消息（含心跳）
+        self.last_input_time = self.created_at
+        self.last_ws_activity = self.created_at
+        # 单调时钟 -> 墙上时间的偏移，只在需要展示/持久化时换算
+        self._wall_offset = time.time() - self.created_at
+
+    def log_command(self, command: str):
+        # 命令行可能带口令（mysql -p、--token=...），写入会话日志前脱敏
+        self.commands_log.append((time.monotonic(), redact(command)))
+
+    def commands_for_log(self) -> list:
+        """转换为 SessionLog.commands_executed 的 JSON 结构"""
+        return [
+            {
+                "command": cmd,
+                "timestamp": datetime.fromtimestamp(ts + self._wall_offset).isoformat()
+            }
+            for ts, cmd in self.commands_log
+        ]
+
+    def resolve_command(self, output: str, detection: str):
+        waiter = self.command_waiter
+        self.command_waiter = None
+        if waiter is not None and not waiter.done():
+            waiter.set_result((output, detection))
+
+    def reset_watch(self):
+        # 等待中的命令被新的监视打断
+        self.resolve_command(self.command_output_buffer, "interrupted")
+        self.watching_command = False
+        self.command_output_buffer = ""
+        self.interactive_state = None
+        self.interactive_notified = False
+        self.output_analysis = None
+        self.timing = None
+
+    def memory_usage(self) -> dict:
+        """估算本会话状态占用的字节数（不含 SSH 连接本身）"""
+        getsizeof = sys.getsizeof
+        commands = getsizeof(self.commands_log) + sum(
+            getsizeof(entry) + getsizeof(entry[0]) + getsizeof(entry[1])
+            for entry in self.commands_log
+        )
+        screen = 0
+        if self.screen is not None:
+            screen = self.screen.memory_usage()
+        analysis = 0
+        if self.output_analysis is not None:
+            analysis = getsizeof(self.output_analysis[1].get("clean", ""))
+        state = getsizeof(self) + sum(
+            getsizeof(getattr(self, name)) for name in (
+                'client_id', 'user_id', 'connection_id', 'host', 'username',
+                'session_log_id', 'encoding',
+            )
+        )
+        buffers = getsizeof(self.command_output_buffer)
+        if self.triggers is not None:
+            buffers += getsizeof(self.triggers.carry)
+        return {
+            "state": state,
+            "buffers": buffers,
+            "commands_log": commands,
+            "screen": screen,
+            "analysis": analysis,
+            "total": state + buffers + commands + screen + analysis,
+        }
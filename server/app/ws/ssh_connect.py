@@ -0,0 +1,139 @@
+"""
+SSH 连接建立
+从 Connection 记录提取建连参数（与 ORM 对象解耦，可在后台任务中使用），并打开 asyncssh 连接。
+终端 connect 与预热池共用这一条路径。配置了跳板机时参数中带 "jump"（跳板机自身的参数，可再嵌套），
+目标连接经共享的跳板机连接建立隧道。
+"""
+import asyncio
+import hashlib
+import os
+import stat
+import tempfile
+from typing import Optional
+
+import asyncssh
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.connection import Connection
+from app.ws.bastion import BastionPool
+from app.ws.resolver import connect_fastest
+from app.ws.transport_profiles import DEFAULT_PROFILE, transport_options
+
+CONNECT_TIMEOUT = 15
+PRIVATE_KEY_METHODS = ("private_key", "privatekey")
+# 跳板机链最大层数
+MAX_JUMP_DEPTH = 4
+
+
+def ssh_connect_params(conn: Connection) -> dict:
+    """提取建连所需字段的快照"""
+    return {
+        "host": conn.host,
+        "port": conn.port or 22,
+        "username": conn.username,
+        "auth_method": conn.auth_method,
+        "password": conn.password,
+        "private_key": conn.private_key,
+        "passphrase": conn.passphrase,
+        "transport_profile": conn.transport_profile or DEFAULT_PROFILE,
+    }
+
+
+async def load_connect_params(db: AsyncSession, conn: Connection) -> dict:
+    """提取建连参数并沿 jump_host_id 加载跳板机链；跳板机缺失、成环或过深时抛出 ValueError"""
+    params = ssh_connect_params(conn)
+    current = params
+    seen = {conn.id}
+    jump_id = conn.jump_host_id
+    while jump_id:
+        if jump_id in seen:
+            raise ValueError("跳板机配置存在循环")
+        if len(seen) > MAX_JUMP_DEPTH:
+            raise ValueError(f"跳板机链超过 {MAX_JUMP_DEPTH} 层")
+        seen.add(jump_id)
+        result = await db.execute(
+            select(Connection)
+            .where(Connection.id == jump_id)
+            .where(Connection.user_id == conn.user_id)
+        )
+        jump = result.scalars().one_or_none()
+        if not jump:
+            raise ValueError("跳板机连接不存在")
+        current["jump"] = ssh_connect_params(jump)
+        current = current["jump"]
+        jump_id = jump.jump_host_id
+    return params
+
+
+def params_fingerprint(params: dict) -> str:
+    """建连参数指纹：连接配置被修改后，预热的连接不再复用"""
+    digest = hashlib.sha256()
+    for key in sorted(params):
+        digest.update(f"{key}={params[key]!r};".encode("utf-8", errors="replace"))
+    return digest.hexdigest()
+
+
+async def open_ssh_connection(params: dict, timeout: Optional[float] = CONNECT_TIMEOUT) -> asyncssh.SSHClientConnection:
+    """
+    按参数快照建立已认证的 SSH 连接；私钥为空时抛出 ValueError
+    TCP 连接由 connect_fastest 在各解析地址间竞速完成，超时覆盖竞速和 SSH 握手全程
+    """
+    ssh_options = {
+        "host": params["host"],
+        "port": params["port"],
+        "username": params["username"],
+        "known_hosts": None,
+        **transport_options(params.get("transport_profile")),
+    }
+
+    key_file = None
+    try:
+        if params["auth_method"] in PRIVATE_KEY_METHODS:
+            if not params["private_key"]:
+                raise ValueError("Private key empty")
+            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.key') as f:
+                f.write(params["private_key"])
+                key_file = f.name
+            os.chmod(key_file, stat.S_IRUSR)
+            ssh_options["client_keys"] = [key_file]
+            if params["passphrase"]:
+                ssh_options["passphrase"] = params["passphrase"]
+        else:
+            ssh_options["password"] = params["password"]
+
+        async def _connect():
+            if params.get("jump"):
+                # 隧道内由跳板机负责解析和连接目标主机
+                key, tunnel = await bastion_pool.acquire(params["jump"])
+                try:
+                    ssh_conn = await asyncssh.connect(tunnel=tunnel, **ssh_options)
+                except BaseException:
+                    bastion_pool.release(key)
+                    raise
+                bastion_pool.hold_until_closed(key, ssh_conn)
+                return ssh_conn
+
+            sock = await connect_fastest(params["host"], params["port"])
+            try:
+                return await asyncssh.connect(sock=sock, **ssh_options)
+            except BaseException:
+                sock.close()
+                raise
+
+        return await asyncio.wait_for(_connect(), timeout=timeout)
+    finally:
+        if key_file:
+            try:
+                os.unlink(key_file)
+            except Exception:
+                pass
+
+
+bastion_pool = BastionPool(
+    opener=open_ssh_connection,
+    key_func=params_fingerprint,
+    idle_ttl=settings.SSH_BASTION_IDLE_TTL,
+)
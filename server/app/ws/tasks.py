@@ -0,0 +1,155 @@
+"""
+终端子系统的后台任务登记与空闲会话回收
+- TaskRegistry：终端相关的 asyncio 任务都经 spawn 创建，按名称和所属会话（client_id）计数，
+  任务结束自动注销并取走异常；会话清理时按 owner 一次取消，已结束会话名下仍有任务即为泄漏。
+- SessionReaper：WebSocket 异常断开时 read_ssh_output/monitor 可能一直挂到 SSH 侧察觉，
+  定时扫描 active_connections，超过时限没有任何 WebSocket 消息（含心跳 ping），
+  或长时间既无输入也无输出的会话直接关闭回收。
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Coroutine, Dict, Iterable, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TaskRegistry:
+    def __init__(self):
+        # task -> (名称, 所属会话 client_id)
+        self._tasks: Dict[asyncio.Task, Tuple[str, Optional[str]]] = {}
+        self.spawned = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def spawn(self, coro: Coroutine, name: str, owner: Optional[str] = None) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks[task] = (name, owner)
+        self.spawned += 1
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task):
+        name, owner = self._tasks.pop(task, ("?", None))
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        error = task.exception()
+        if error is not None:
+            self.failed += 1
+            logger.warning(f"Terminal task {name} ({owner or '-'}) failed: {error!r}")
+
+    def owned(self, owner: str) -> list:
+        return [task for task, (_, task_owner) in self._tasks.items() if task_owner == owner]
+
+    async def cancel_owner(self, owner: str, timeout: float = 5.0):
+        """取消会话名下的全部任务并等待其退出"""
+        tasks = [task for task in self.owned(owner) if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def counts(self, owners: Optional[Iterable[str]] = None) -> dict:
+        """owners 为当前存活的会话；不在其中却仍有任务的 owner 计入 orphaned"""
+        by_name = Counter(name for name, _ in self._tasks.values())
+        by_owner: Dict[str, Counter] = {}
+        for name, owner in self._tasks.values():
+            if owner is not None:
+                by_owner.setdefault(owner, Counter())[name] += 1
+        result = {
+            "total": len(self._tasks),
+            "by_name": dict(by_name),
+            "by_session": {owner: dict(c) for owner, c in by_owner.items()},
+            "spawned": self.spawned,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+        if owners is not None:
+            alive = set(owners)
+            result["orphaned"] = {owner: sum(c.values()) for owner, c in by_owner.items() if owner not in alive}
+        return result
+
+
+class SessionReaper:
+    def __init__(self, interval: float, ws_timeout: float, idle_timeout: float):
+        self.interval = interval
+        self.ws_timeout = ws_timeout
+        self.idle_timeout = idle_timeout
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self.sweeps = 0
+        self.reaped: Counter = Counter()
+
+    def idle_reason(self, session, now: float) -> Optional[str]:
+        if self.ws_timeout > 0 and now - session.last_ws_activity >= self.ws_timeout:
+            return "ws_timeout"
+        if self.idle_timeout > 0:
+            last_io = max(session.last_input_time, session.last_output_time, session.created_at)
+            if now - last_io >= self.idle_timeout:
+                return "idle_timeout"
+        return None
+
+    def ensure_running(
+        self,
+        sessions: Callable[[], list],
+        close: Callable[[str, str], Awaitable[None]]
+    ):
+        """首个会话建立时调用；sessions 返回当前会话列表，close(client_id, reason) 回收一个会话"""
+        if self.interval <= 0 or (self.ws_timeout <= 0 and self.idle_timeout <= 0):
+            return
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._task = terminal_tasks.spawn(self._run(sessions, close), "session_reaper")
+
+    async def _run(self, sessions, close):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.sweep(sessions(), close)
+        except asyncio.CancelledError:
+            pass
+
+    async def sweep(self, sessions: list, close) -> int:
+        self.sweeps += 1
+        now = time.monotonic()
+        reaped = 0
+        for session in sessions:
+            reason = self.idle_reason(session, now)
+            if reason is None:
+                continue
+            logger.info(f"[{session.client_id}] Reaping idle session ({reason}) on {session.host}")
+            try:
+                await close(session.client_id, reason)
+            except Exception as e:
+                logger.warning(f"[{session.client_id}] Reap failed: {e}")
+                continue
+            self.reaped[reason] += 1
+            reaped += 1
+        return reaped
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "ws_timeout": self.ws_timeout,
+            "idle_timeout": self.idle_timeout,
+            "sweeps": self.sweeps,
+            "reaped": dict(self.reaped),
+        }
+
+
+terminal_tasks = TaskRegistry()
+session_reaper = SessionReaper(
+    interval=settings.TERMINAL_REAP_INTERVAL,
+    ws_timeout=settings.TERMINAL_REAP_WS_TIMEOUT,
+    idle_timeout=settings.TERMINAL_REAP_IDLE_TIMEOUT,
+)
@@ -4,6 +4,7 @@ WebSocket 终端处理模块（v7 - 基于 v4 备份修复）
 改进：增加心跳、安全发送、详细状态提示、连接池清理
 """
 import asyncio
+import codecs
 import json
 import re
 import uuid
@@ -12,33 +13,69 @@ from typing import Optional
 from datetime import datetime
 from collections import OrderedDict
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import asyncssh
 
-from app.database import get_db
+from app.database import AsyncSessionLocal, get_db
 from app.models.user import User
 from app.models.connection import Connection
 from app.models.session_log import SessionLog
 from app.config import settings
+from app.routes.auth import get_current_active_user
+from app.ws.screen import TerminalScreen
+from app.ws.scheduler import output_scheduler
+from app.ws.textproc import text_pool
+from app.ws.session import TerminalSession
+from app.ws.viewers import Viewer, ViewerGroup
+from app.ws.ssh_connect import bastion_pool, load_connect_params, open_ssh_connection
+from app.ws.warm_pool import warm_pool
+from app.ws.resolver import address_cache
+from app.ws.completion import completion_cache
+from app.ws.log_tail import LineFilter, LogTail, TailSource
+from app.ws.triggers import trigger_registry
+from app.ws.command_timing import PendingCommand, command_timings
+from app.ws.host_facts import host_facts
+from app.ws.command_cache import command_cache
+from app.ws.probes import probe_runner
+from app.ws.agent import agent_runner
+from app.ws.echo_latency import echo_latency
+from app.ws.tasks import session_reaper, terminal_tasks
+from app.ws.broker import BrokerConnection, ssh_broker
+from app.services.redaction import redact, redactor
+from app.schemas.terminal import TerminalShareRequest, TerminalShareResponse, LogTailRequest
 from jose import jwt, JWTError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-MAX_CONNECTIONS = 100
+MAX_CONNECTIONS = settings.TERMINAL_MAX_SESSIONS
 MAX_OUTPUT_BUFFER = 50000
+# 自适应读块：交互回显用小块，持续大量输出时逐步放大
+MIN_READ_SIZE = 4096
+MAX_READ_SIZE = 256 * 1024
+DEFAULT_ENCODING = "utf-8"
+SUPPORTED_ENCODINGS = ("utf-8", "gbk", "gb18030", "latin-1")
+SESSION_ENDED_MESSAGE = {"type": "disconnected", "content": "共享会话已结束"}
+# 监视中的命令最长运行时间，超过后 monitor 强制结束（total_timeout）
+COMMAND_TOTAL_TIMEOUT = 300.0
+# resize 消息的行列数上限，屏幕模型按行列分配缓冲区
+MAX_TERMINAL_SIZE = 1000
+# 空闲回收时关闭所有者 WebSocket 的关闭码
+REAPED_CLOSE_CODE = 4408
+REAP_REASONS = {"idle_timeout": "终端长时间无输入输出", "ws_timeout": "长时间未收到客户端心跳"}
 
 
 class ConnectionPool:
     def __init__(self, max_size: int = MAX_CONNECTIONS):
-        self._pool: OrderedDict[str, dict] = OrderedDict()
+        self._pool: OrderedDict[str, TerminalSession] = OrderedDict()
         self._lock = asyncio.Lock()
         self._max_size = max_size
 
-    async def add(self, client_id: str, info: dict):
+    async def add(self, client_id: str, info: TerminalSession):
         async with self._lock:
             if len(self._pool) >= self._max_size:
                 oldest_id, oldest = self._pool.popitem(last=False)
@@ -46,30 +83,36 @@ class ConnectionPool:
                 logger.warning(f"Pool full, removed: {oldest_id}")
             self._pool[client_id] = info
 
-    async def remove(self, client_id: str) -> Optional[dict]:
+    async def remove(self, client_id: str) -> Optional[TerminalSession]:
         async with self._lock:
             return self._pool.pop(client_id, None)
 
-    def get(self, client_id: str) -> Optional[dict]:
+    def get(self, client_id: str) -> Optional[TerminalSession]:
         return self._pool.get(client_id)
 
     def __contains__(self, client_id: str) -> bool:
         return client_id in self._pool
 
-    async def _cleanup_single(self, cid: str, info: dict):
+    def __len__(self) -> int:
+        return len(self._pool)
+
+    def values(self):
+        return list(self._pool.values())
+
+    async def _cleanup_single(self, cid: str, info: TerminalSession):
         try:
-            for tn in ("output_task",):
-                t = info.get(tn)
-                if t and not t.done():
-                    t.cancel()
-            if info.get("ssh_process"):
+            for t in terminal_tasks.owned(cid):
+                t.cancel()
+            if info.viewers is not None:
+                await info.viewers.close_all(SESSION_ENDED_MESSAGE)
+            if info.ssh_process:
                 try:
-                    info["ssh_process"].close()
+                    info.ssh_process.close()
                 except Exception:
                     pass
-            if info.get("ssh_conn"):
+            if info.ssh_conn:
                 try:
-                    info["ssh_conn"].close()
+                    info.ssh_conn.close()
                 except Exception:
                     pass
         except Exception as e:
@@ -115,7 +158,8 @@ CONFIRM_PATTERNS = [
 def detect_interactive_state(clean_text: str) -> Optional[str]:
     if not clean_text.strip():
         return None
-    lines = clean_text.strip().split('\n')
+    # 只需要最后几行，rsplit 避免对整个缓冲区分行
+    lines = clean_text.strip().rsplit('\n', 3)
     last_lines = '\n'.join(lines[-3:])
     last_line = lines[-1].strip() if lines else ''
     for p in PAGER_PATTERNS:
@@ -148,6 +192,14 @@ def get_interactive_hint(interactive_type: str) -> dict:
                 {'label': '中断 (Ctrl+C)', 'data': '\x03'},
             ]
         },
+        'fullscreen': {
+            'message': '命令进入了全屏界面（如 top/vim/less），需要退出后才能继续',
+            'actions': [
+                {'label': '退出 (q)', 'data': 'q'},
+                {'label': '退出 vim (:q!)', 'data': '\x1b:q!\r'},
+                {'label': '中断 (Ctrl+C)', 'data': '\x03'},
+            ]
+        },
         'confirm': {
             'message': '程序正在等待确认输入',
             'actions': [
@@ -171,15 +223,35 @@ def build_prompt_pattern(username: str) -> re.Pattern:
     return re.compile(combined, re.MULTILINE)
 
 
+ANSI_RE = re.compile(
+    r'\x1b\[[0-9;]*[a-zA-Z]'
+    r'|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)'
+    r'|\x1b[()][AB012]'
+    r'|\x1b[>=<]'
+    r'|\r'
+)
+
+
 def strip_ansi(text: str) -> str:
-    ansi_re = re.compile(
-        r'\x1b\[[0-9;]*[a-zA-Z]'
-        r'|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)'
-        r'|\x1b[()][AB012]'
-        r'|\x1b[>=<]'
-        r'|\r'
-    )
-    return ansi_re.sub('', text)
+    return ANSI_RE.sub('', text)
+
+
+def analyze_output_buffer(buf: str, prompt_pattern: Optional[re.Pattern]) -> dict:
+    """
+    monitor 的文本处理部分：清洗缓冲区并做提示符/交互检测
+    纯函数，大缓冲区由 text_pool 放到执行器中运行
+    """
+    clean_buf = strip_ansi(buf)
+    prompt_found = False
+    if prompt_pattern is not None:
+        last_text = '\n'.join(clean_buf.strip().rsplit('\n', 5)[-5:])
+        prompt_found = bool(prompt_pattern.search(last_text))
+    return {
+        # 提示符/交互检测用原文，推给前端（随后进入对话记录和 LLM）的文本先脱敏
+        "clean": redact(clean_buf),
+        "prompt": prompt_found,
+        "interactive": detect_interactive_state(clean_buf),
+    }
 
 
 async def get_current_user_from_token(token: str, db: AsyncSession) -> Optional[User]:
@@ -201,33 +273,124 @@ async def send_ws_safe(websocket: WebSocket, data: dict):
         logger.debug(f"WS send failed: {e}")
 
 
-async def cleanup_connection(client_id: str, db: AsyncSession):
+async def send_ws_text_safe(websocket: WebSocket, data: str):
+    try:
+        await websocket.send_text(data)
+    except Exception as e:
+        logger.debug(f"WS send failed: {e}")
+
+
+async def send_ws_bytes_safe(websocket: WebSocket, data: bytes):
+    try:
+        await websocket.send_bytes(data)
+    except Exception as e:
+        logger.debug(f"WS send failed: {e}")
+
+
+def write_session_input(ci: TerminalSession, data_content: str) -> bool:
+    """写入终端输入（会话所有者与可写观看者共用）"""
+    try:
+        ci.ssh_process.stdin.write(data_content.encode(ci.encoding, errors="replace"))
+    except Exception as e:
+        logger.warning(f"[{ci.client_id}] SSH write failed: {e}")
+        return False
+    ci.last_input_time = time.monotonic()
+
+    if ci.watching_command:
+        ci.interactive_notified = False
+        ci.interactive_state = None
+        ci.last_output_time = time.monotonic()
+
+    command_cache.observe_input(ci, data_content)
+    if '\r' in data_content or '\n' in data_content:
+        cmd = data_content.strip().replace('\r', '').replace('\n', '')
+        if cmd:
+            ci.log_command(cmd)
+            # 监视开启后的第一次回车开始计时；命令运行中的回车（回答提示等）不重新计时
+            if ci.watching_command and ci.timing is None:
+                ci.timing = PendingCommand(cmd)
+    return True
+
+
+async def forward_probe_results(websocket: WebSocket, ci: TerminalSession, commands: list, request_id, timeout: float):
+    """在后台执行，避免阻塞同一 WebSocket 上的终端输入"""
+    try:
+        batch = await probe_runner.run(ci.ssh_conn, commands, ci.encoding, timeout)
+    except Exception as e:
+        logger.warning(f"[{ci.client_id}] Probe batch failed: {e}")
+        await send_ws_safe(websocket, {"type": "probe_results", "id": request_id, "error": str(e)})
+        return
+    await send_ws_safe(websocket, {"type": "probe_results", "id": request_id, **batch})
+
+
+async def execute_session_command(ci: TerminalSession, command: str, use_cache: bool = False) -> tuple:
+    """
+    服务端 agent 用：在终端里执行命令并等待 command_finished，返回 (输出, 检测方式)。
+    终端输出照常推给客户端，用户能看到命令执行过程
+    """
+    if use_cache:
+        hit = command_cache.lookup(ci, command)
+        if hit is not None:
+            return hit[1], "cache"
+    ci.reset_watch()
+    ci.watching_command = True
+    ci.last_output_time = ci.watch_start_time = time.monotonic()
+    waiter = asyncio.get_running_loop().create_future()
+    ci.command_waiter = waiter
+    if not write_session_input(ci, command + "\r"):
+        ci.reset_watch()
+        return "", "write_failed"
+    try:
+        # 正常情况下 monitor 最迟在 COMMAND_TOTAL_TIMEOUT 时唤醒；会话已断开等情况下兜底
+        return await asyncio.wait_for(waiter, COMMAND_TOTAL_TIMEOUT + 5)
+    except asyncio.TimeoutError:
+        logger.warning(f"[{ci.client_id}] Agent command not finished by monitor, giving up: {command[:80]}")
+        output = redact(strip_ansi(ci.command_output_buffer))
+        if ci.command_waiter is waiter:
+            ci.reset_watch()
+        return output, "total_timeout"
+
+
+async def cleanup_connection(client_id: str, db: AsyncSession, detach: bool = False):
+    """detach：WebSocket 异常断开或服务重启时，broker 模式下保留 SSH 会话等待 resume"""
     info = await active_connections.remove(client_id)
     if not info:
         return
+    await agent_runner.stop(client_id)
 
-    task = info.get("output_task")
+    task = info.output_task
     if task and not task.done():
         task.cancel()
         try:
             await task
         except (asyncio.CancelledError, Exception):
             pass
+    # 会话名下的其余任务（探测、日志跟踪等）
+    await terminal_tasks.cancel_owner(client_id)
+
+    if info.viewers is not None:
+        await info.viewers.close_all(SESSION_ENDED_MESSAGE)
+    trigger_registry.release(info.user_id, {s.user_id for s in active_connections.values()})
+    echo_latency.release(client_id)
+    host_facts.detach(info.connection_id, info.ssh_conn)
+
+    conn = info.ssh_conn
+    if detach and isinstance(conn, BrokerConnection):
+        conn.detach()
+    else:
+        try:
+            proc = info.ssh_process
+            if proc:
+                proc.close()
+        except Exception:
+            pass
+        try:
+            if conn:
+                conn.close()
+        except Exception:
+            pass
 
-    try:
-        proc = info.get("ssh_process")
-        if proc:
-            proc.close()
-    except Exception:
-        pass
-    try:
-        conn = info.get("ssh_conn")
-        if conn:
-            conn.close()
-    except Exception:
-        pass
-
-    session_log_id = info.get("session_log_id")
+    session_log_id = info.session_log_id
     if session_log_id:
         try:
             result = await db.execute(
@@ -236,8 +399,7 @@ async def cleanup_connection(client_id: str, db: AsyncSession):
             sl = result.scalars().one_or_none()
             if sl:
                 sl.end_time = datetime.now()
-                cmds = info.get("commands_log", [])
-                sl.commands_executed = json.dumps(cmds[-100:])
+                sl.commands_executed = json.dumps(info.commands_for_log())
                 await db.commit()
         except Exception as e:
             logger.warning(f"Session log update failed: {e}")
@@ -247,19 +409,69 @@ async def cleanup_connection(client_id: str, db: AsyncSession):
                 pass
 
 
+async def reap_session(client_id: str, reason: str):
+    """
+    空闲回收：先告知所有者原因并以 REAPED_CLOSE_CODE 关闭其 WebSocket（否则客户端还在发心跳时
+    handler 会继续运行，之后的输入被静默丢弃），再关闭 SSH 并走正常清理（会话日志照常收尾）
+    """
+    ci = active_connections.get(client_id)
+    websocket = ci.websocket if ci else None
+    if websocket is not None:
+        await send_ws_safe(websocket, {
+            "type": "disconnected",
+            "content": f"会话已被回收：{REAP_REASONS.get(reason, reason)}",
+            "reason": reason,
+        })
+        try:
+            await websocket.close(code=REAPED_CLOSE_CODE, reason=reason)
+        except Exception:
+            pass
+    async with AsyncSessionLocal() as db:
+        await cleanup_connection(client_id, db)
+
+
+async def _get_user_connection(db: AsyncSession, connection_id: Optional[str], user_id: str) -> Optional[Connection]:
+    result = await db.execute(
+        select(Connection)
+        .where(Connection.id == connection_id)
+        .where(Connection.user_id == user_id)
+    )
+    return result.scalars().one_or_none()
+
+
+async def open_terminal_process(ssh_conn: asyncssh.SSHClientConnection):
+    # encoding=None：字节模式，由 read_ssh_output 按连接编码增量解码
+    return await ssh_conn.create_process(
+        term_type='xterm-256color', term_size=(120, 30),
+        encoding=None
+    )
+
+
 # ==================== 核心：SSH输出读取 + 内嵌监控 ====================
 
-async def read_ssh_output(websocket: WebSocket, ssh_process, client_id: str):
+async def read_ssh_output(
+    websocket: WebSocket,
+    ssh_process,
+    client_id: str,
+    encoding: str = DEFAULT_ENCODING,
+    binary: bool = False,
+    rate_limit: int = 0
+):
     """
     读取 SSH 输出 + 内嵌 monitor 子任务（与备份版相同架构）
+    通道以字节模式打开：每个会话一个增量解码器，多字节字符跨块也不会乱码；
+    binary=True 的客户端直接收原始字节帧，不经过解码/JSON 编码
+    大块输出先经 output_scheduler 排队，避免单个会话刷屏拖慢其他会话
     """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    share = output_scheduler.register(client_id, rate_limit) if settings.TERMINAL_FAIR_SCHEDULING else None
 
     async def monitor():
         """后台监控：prompt检测 + 交互检测 + 超时"""
         PROMPT_IDLE = 2.0
         INTERACTIVE_IDLE = 3.0
         FORCE_IDLE = 30.0
-        FORCE_TOTAL = 300.0
+        FORCE_TOTAL = COMMAND_TOTAL_TIMEOUT
 
         logger.info(f"[{client_id}] monitor started")
 
@@ -268,60 +480,92 @@ async def read_ssh_output(websocket: WebSocket, ssh_process, client_id: str):
                 await asyncio.sleep(0.8)
 
                 ci = active_connections.get(client_id)
-                if not ci or not ci.get("watching_command"):
+                if not ci or not ci.watching_command:
                     continue
 
-                last_time = ci.get("last_output_time", 0)
+                last_time = ci.last_output_time
                 if last_time == 0:
                     continue
 
-                elapsed_idle = time.time() - last_time
-                elapsed_total = time.time() - ci.get("watch_start_time", time.time())
-                buf = ci.get("command_output_buffer", "")
+                now = time.monotonic()
+                elapsed_idle = now - last_time
+                elapsed_total = now - (ci.watch_start_time or now)
+                buf = ci.command_output_buffer
 
                 if not buf.strip():
                     if elapsed_idle >= FORCE_IDLE:
-                        logger.info(f"[{client_id}] Command finished - empty_timeout | watching_command={ci.get('watching_command')} | output_len=0")
-                        ci["watching_command"] = False
+                        logger.info(f"[{client_id}] Command finished - empty_timeout | watching_command={ci.watching_command} | output_len=0")
+                        ci.watching_command = False
+                        command_timings.finish(ci, "empty_timeout")
+                        ci.resolve_command("", "empty_timeout")
                         await send_ws_safe(websocket, {
                             "type": "command_finished",
                             "output": "",
                             "detection": "empty_timeout"
                         })
-                        ci["command_output_buffer"] = ""
+                        ci.command_output_buffer = ""
                     continue
 
-                clean_buf = strip_ansi(buf)
-                prompt_pattern = ci.get("prompt_pattern")
+                # 缓冲区没变就复用上次的分析结果；大缓冲区的分析放到执行器中
+                cached = ci.output_analysis
+                if cached and cached[0] is buf:
+                    analysis = cached[1]
+                else:
+                    analysis = await text_pool.run(
+                        analyze_output_buffer, len(buf), buf, ci.prompt_pattern
+                    )
+                    ci = active_connections.get(client_id)
+                    if not ci or not ci.watching_command:
+                        continue
+                    if ci.command_output_buffer is not buf:
+                        # 分析期间有新输出，下个 tick 再判断；但持续输出时每个 tick 都会走到这里，
+                        # 超过总时长就直接同步分析当前缓冲区，不让强制超时被一直跳过
+                        elapsed_total = time.monotonic() - (ci.watch_start_time or now)
+                        if elapsed_total < FORCE_TOTAL:
+                            continue
+                        buf = ci.command_output_buffer
+                        analysis = analyze_output_buffer(buf, ci.prompt_pattern)
+                    ci.output_analysis = (buf, analysis)
+
+                clean_buf = analysis["clean"]
+                prompt_pattern = ci.prompt_pattern
+                screen = ci.screen
+                fullscreen = screen is not None and screen.alternate_screen
 
                 # -------- 1. prompt 检测 --------
-                if elapsed_idle >= PROMPT_IDLE and prompt_pattern:
-                    last_lines = clean_buf.strip().split('\n')[-5:]
-                    last_text = '\n'.join(last_lines)
-
-                    if prompt_pattern.search(last_text):
-                        if not detect_interactive_state(clean_buf):
-                            logger.info(f"[{client_id}] Command finished - prompt | watching_command={ci.get('watching_command')} | output_len={len(clean_buf)} | idle={elapsed_idle:.1f}s")
-                            ci["watching_command"] = False
-                            ci["interactive_state"] = None
-                            ci["interactive_notified"] = False
+                # 全屏程序的画面里可能出现形似提示符的文本，不能据此判定结束
+                if elapsed_idle >= PROMPT_IDLE and prompt_pattern and not fullscreen:
+                    if analysis["prompt"]:
+                        if not analysis["interactive"]:
+                            logger.info(f"[{client_id}] Command finished - prompt | watching_command={ci.watching_command} | output_len={len(clean_buf)} | idle={elapsed_idle:.1f}s")
+                            ci.watching_command = False
+                            ci.interactive_state = None
+                            ci.interactive_notified = False
+                            command_cache.store(ci, clean_buf)
+                            command_timings.finish(ci, "prompt")
+                            ci.resolve_command(clean_buf, "prompt")
 
                             await send_ws_safe(websocket, {
                                 "type": "command_finished",
                                 "output": clean_buf,
                                 "detection": "prompt"
                             })
-                            ci["command_output_buffer"] = ""
+                            ci.command_output_buffer = ""
                             continue
 
                 # -------- 2. 交互式检测 --------
                 if elapsed_idle >= INTERACTIVE_IDLE:
-                    itype = detect_interactive_state(clean_buf)
+                    if fullscreen:
+                        screen_text = screen.render()
+                        itype = detect_interactive_state(screen_text) or 'fullscreen'
+                        clean_buf = redact(screen_text)
+                    else:
+                        itype = analysis["interactive"]
                     if itype:
-                        prev = ci.get("interactive_state")
-                        ci["interactive_state"] = itype
-                        if not ci.get("interactive_notified") or prev != itype:
-                            ci["interactive_notified"] = True
+                        prev = ci.interactive_state
+                        ci.interactive_state = itype
+                        if not ci.interactive_notified or prev != itype:
+                            ci.interactive_notified = True
                             logger.info(f"[{client_id}] Interactive: {itype}")
                             await send_ws_safe(websocket, {
                                 "type": "interactive_detected",
@@ -334,16 +578,18 @@ async def read_ssh_output(websocket: WebSocket, ssh_process, client_id: str):
                 # -------- 3. 强制超时 --------
                 if elapsed_idle >= FORCE_IDLE or elapsed_total >= FORCE_TOTAL:
                     reason = "idle_timeout" if elapsed_idle >= FORCE_IDLE else "total_timeout"
-                    logger.info(f"[{client_id}] Command finished - {reason} | watching_command={ci.get('watching_command')} | output_len={len(clean_buf)} | idle={elapsed_idle:.1f}s | total={elapsed_total:.1f}s")
-                    ci["watching_command"] = False
-                    ci["interactive_state"] = None
-                    ci["interactive_notified"] = False
+                    logger.info(f"[{client_id}] Command finished - {reason} | watching_command={ci.watching_command} | output_len={len(clean_buf)} | idle={elapsed_idle:.1f}s | total={elapsed_total:.1f}s")
+                    ci.watching_command = False
+                    ci.interactive_state = None
+                    ci.interactive_notified = False
+                    command_timings.finish(ci, reason)
+                    ci.resolve_command(clean_buf, reason)
                     await send_ws_safe(websocket, {
                         "type": "command_finished",
                         "output": clean_buf,
                         "detection": reason
                     })
-                    ci["command_output_buffer"] = ""
+                    ci.command_output_buffer = ""
 
         except asyncio.CancelledError:
             pass
@@ -351,56 +597,464 @@ async def read_ssh_output(websocket: WebSocket, ssh_process, client_id: str):
             logger.error(f"[{client_id}] monitor error: {e}", exc_info=True)
 
     # ★ 启动 monitor 子任务
-    monitor_task = asyncio.create_task(monitor())
+    monitor_task = terminal_tasks.spawn(monitor(), "monitor", client_id)
 
     # ★ 主循环：读取 SSH 输出
+    # read(n) 有数据即返回，不需要超时轮询；取消由 cleanup 时 cancel 任务完成
+    read_size = MIN_READ_SIZE
     try:
         while True:
             try:
-                data = await asyncio.wait_for(
-                    ssh_process.stdout.read(4096),
-                    timeout=0.5
-                )
-            except asyncio.TimeoutError:
-                continue
+                raw = await ssh_process.stdout.read(read_size)
             except asyncio.CancelledError:
                 raise
             except Exception as e:
                 logger.debug(f"[{client_id}] SSH read error: {e}")
                 break
 
-            if not data:
+            if not raw:
                 logger.info(f"[{client_id}] SSH stdout EOF")
                 break
 
-            # 1. 转发到前端
-            await send_ws_safe(websocket, {"type": "output", "data": data})
+            # 读满说明通道在持续输出，放大读块；回落到回显量级则收缩
+            if len(raw) >= read_size:
+                read_size = min(read_size * 2, MAX_READ_SIZE)
+            elif read_size > MIN_READ_SIZE and len(raw) < read_size // 4:
+                read_size = max(read_size // 2, MIN_READ_SIZE)
 
-            # 2. ★★★ 更新监视缓冲区 ★★★
+            data = decoder.decode(raw)
             ci = active_connections.get(client_id)
+            # 带 seq 的按键之后的第一块输出：记录回显延迟，转发后回 echo
+            echo = echo_latency.on_output(ci) if ci and ci.echo_pending is not None else None
+
+            # 1. 转发到前端；有观看者时文本帧只编码一次，所有者与观看者共用
+            if share is not None:
+                await output_scheduler.acquire(share, len(raw))
+            viewers = ci.viewers if ci else None
+            message = {"type": "output", "data": data} if data else None
+            if viewers:
+                frame = json.dumps(message) if message else None
+                if binary:
+                    await send_ws_bytes_safe(websocket, raw)
+                elif frame:
+                    await send_ws_text_safe(websocket, frame)
+                viewers.broadcast(message, raw, frame)
+            elif binary:
+                await send_ws_bytes_safe(websocket, raw)
+            elif message:
+                await send_ws_safe(websocket, message)
+            if echo is not None:
+                echo_latency.on_forwarded(ci, echo[1])
+                await send_ws_safe(websocket, {"type": "echo", "seq": echo[0], "server_ms": round(echo[2], 2)})
+            if not data:
+                continue
+
+            # 2. ★★★ 更新监视缓冲区 ★★★
             if ci:
-                ci["last_output_time"] = time.time()
-                if ci.get("watching_command"):
-                    buf = ci.get("command_output_buffer", "") + data
+                ci.last_output_time = time.monotonic()
+                if ci.screen is not None:
+                    ci.screen.feed(data)
+                if ci.watching_command:
+                    buf = ci.command_output_buffer + data
                     if len(buf) > MAX_OUTPUT_BUFFER:
                         buf = buf[-MAX_OUTPUT_BUFFER:]
-                    ci["command_output_buffer"] = buf
+                    ci.command_output_buffer = buf
+                if ci.timing is not None:
+                    ci.timing.on_output(len(raw))
+
+                # 3. 触发规则：每块扫描一次，命中推送 trigger 事件并交给通知钩子
+                if ci.triggers is not None:
+                    events = ci.triggers.feed(data)
+                    if events:
+                        for event in events:
+                            await send_ws_safe(websocket, event)
+                            if ci.viewers:
+                                ci.viewers.broadcast(event)
+                        trigger_registry.notify(
+                            {"client_id": client_id, "user_id": ci.user_id, "host": ci.host, "username": ci.username},
+                            events
+                        )
 
     except asyncio.CancelledError:
         pass
     except Exception as e:
         logger.warning(f"[{client_id}] read_ssh_output error: {e}")
     finally:
+        output_scheduler.unregister(client_id, share)
         monitor_task.cancel()
         try:
             await monitor_task
         except (asyncio.CancelledError, Exception):
             pass
         logger.info(f"[{client_id}] read_ssh_output ended")
-        await send_ws_safe(websocket, {
+        disconnected = {
             "type": "disconnected",
             "content": "SSH连接已断开"
+        }
+        ci = active_connections.get(client_id)
+        if ci and ci.viewers:
+            ci.viewers.broadcast(disconnected)
+        await send_ws_safe(websocket, disconnected)
+
+
+# ==================== 统计 ====================
+
+@router.get("/terminal/stats/text-processing")
+async def get_text_processing_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """monitor 文本处理的循环内耗时与卸载到执行器节省的循环时间（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return text_pool.stats()
+
+
+@router.get("/terminal/stats/memory")
+async def get_session_memory_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """各终端会话状态的内存估算（不含 SSH 连接本身，管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    sessions = []
+    total = 0
+    for info in active_connections.values():
+        usage = info.memory_usage()
+        total += usage["total"]
+        sessions.append({
+            "client_id": info.client_id,
+            "user_id": info.user_id,
+            "host": info.host,
+            "memory": usage,
+            "tasks": len(terminal_tasks.owned(info.client_id))
         })
+    return {
+        "session_count": len(sessions),
+        "max_sessions": MAX_CONNECTIONS,
+        "total_bytes": total,
+        "avg_bytes": total // len(sessions) if sessions else 0,
+        "sessions": sessions
+    }
+
+
+@router.get("/terminal/stats/tasks")
+async def get_task_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """终端子系统后台任务数（按名称/会话，orphaned 为已结束会话名下残留的任务）与空闲回收统计（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return {
+        "sessions": len(active_connections),
+        "tasks": terminal_tasks.counts(info.client_id for info in active_connections.values()),
+        "reaper": session_reaper.stats(),
+    }
+
+
+@router.get("/terminal/stats/broker")
+async def get_broker_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """SSH broker 工作进程的会话数、分离会话与各 socket 流量（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return await ssh_broker.stats()
+
+
+@router.get("/terminal/stats/warm-pool")
+async def get_warm_pool_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """SSH 预热池命中率与节省的建连时间（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return warm_pool.stats()
+
+
+@router.get("/terminal/stats/dns")
+async def get_dns_cache_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """SSH 建连的解析缓存命中率与多地址竞速情况（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return address_cache.stats()
+
+
+@router.get("/terminal/stats/bastions")
+async def get_bastion_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """共享跳板机连接的引用计数与复用情况（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return bastion_pool.stats()
+
+
+@router.get("/terminal/stats/completion")
+async def get_completion_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """补全缓存命中率、远端拉取耗时与查树耗时（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return completion_cache.stats()
+
+
+@router.get("/terminal/stats/triggers")
+async def get_trigger_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """触发规则集规模、编译耗时、扫描吞吐与事件数（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return trigger_registry.stats()
+
+
+@router.get("/terminal/stats/redaction")
+async def get_redaction_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """脱敏检测器、扫描吞吐与各检测器命中次数（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return redactor.stats()
+
+
+@router.get("/terminal/stats/command-timing")
+async def get_command_timing_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """命令耗时记录的采集、批量写库与丢弃计数（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return command_timings.stats()
+
+
+@router.get("/terminal/stats/host-facts")
+async def get_host_facts_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """主机环境信息缓存命中率与采集耗时（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return host_facts.stats()
+
+
+@router.get("/terminal/stats/command-cache")
+async def get_command_cache_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """只读命令结果缓存的命中率与失效次数（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return command_cache.stats()
+
+
+@router.get("/terminal/stats/echo-latency")
+async def get_echo_latency_stats(
+    host: Optional[str] = None,
+    client_id: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    按键回显延迟直方图（管理员）：server_echo 为 SSH 链路 + 远端主机，forward 为本服务转发，
+    client_e2e 为客户端上报的端到端延迟，loop_lag 为事件循环调度延迟
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return echo_latency.stats(host, client_id)
+
+
+@router.get("/terminal/stats/agent")
+async def get_agent_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """服务端 agent 循环统计（仅管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return agent_runner.stats()
+
+
+@router.get("/terminal/stats/probes")
+async def get_probe_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """并行探测批次、拒绝/超时数与相对串行执行的加速比（管理员）"""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    return probe_runner.stats()
+
+
+# ==================== 连接预热 ====================
+
+@router.post("/terminal/connections/{connection_id}/preconnect")
+async def preconnect_ssh(
+    connection_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """后台提前完成 SSH 握手和认证，随后打开终端时直接复用"""
+    conn = await _get_user_connection(db, connection_id, current_user.id)
+    if not conn:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Connection not found")
+    try:
+        params = await load_connect_params(db, conn)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # broker 模式下预热连接留在 API 进程里无法交给 broker，不做预热
+    state = "disabled" if ssh_broker.enabled else warm_pool.preconnect(current_user.id, conn.id, params)
+    return {"connection_id": conn.id, "state": state, "ttl": warm_pool.ttl}
+
+
+# ==================== 屏幕快照 ====================
+
+@router.get("/terminal/{client_id}/screen")
+async def get_terminal_screen(
+    client_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """获取会话当前屏幕的纯文本渲染及备用屏幕状态"""
+    ci = active_connections.get(client_id)
+    if not ci or ci.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    if ci.screen is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="屏幕模拟未启用")
+    return ci.screen.snapshot()
+
+
+# ==================== 补全 ====================
+
+@router.get("/terminal/{client_id}/complete")
+async def complete_terminal_line(
+    client_id: str,
+    line: str = Query(..., max_length=4096),
+    cwd: str = Query("~", max_length=1024),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_active_user)
+):
+    """补全命令行最后一个词（命令 / 选项 / 路径），候选来自按主机缓存的 compgen 结果"""
+    ci = active_connections.get(client_id)
+    if not ci or ci.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    try:
+        return await completion_cache.complete(
+            ci.connection_id, ci.ssh_conn, line, cwd=cwd, encoding=ci.encoding, limit=limit
+        )
+    except (asyncssh.Error, OSError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"补全失败: {e}")
+
+
+# ==================== 日志跟踪 ====================
+
+async def build_log_tail(db: AsyncSession, user: User, tail_request: LogTailRequest) -> LogTail:
+    """校验正则和连接归属，组装 LogTail；参数有误时抛出 ValueError"""
+    try:
+        line_filter = LineFilter(tail_request.include, tail_request.exclude)
+    except re.error as e:
+        raise ValueError(f"过滤正则无效: {e}")
+
+    sources = []
+    for item in tail_request.sources:
+        conn = await _get_user_connection(db, item.connection_id, user.id)
+        if not conn:
+            raise ValueError(f"Connection not found: {item.connection_id}")
+        encoding = conn.encoding if conn.encoding in SUPPORTED_ENCODINGS else DEFAULT_ENCODING
+        sources.append(TailSource(conn.name or conn.host, await load_connect_params(db, conn), encoding, item.files))
+
+    return LogTail(
+        sources, line_filter,
+        max_lines_per_second=tail_request.max_lines_per_second,
+        backlog_lines=tail_request.backlog_lines,
+        queue_size=settings.TERMINAL_TAIL_QUEUE_SIZE
+    )
+
+
+@router.post("/terminal/tail")
+async def stream_log_tail(
+    tail_request: LogTailRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """跟踪多台主机上的多个日志文件，SSE 推送过滤后的行"""
+    try:
+        tail = await build_log_tail(db, current_user, tail_request)
+        await tail.start()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except (asyncssh.Error, OSError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"连接失败: {e}")
+
+    async def stream_response():
+        try:
+            async for batch in tail.batches():
+                yield f"data: {json.dumps(batch)}\n\n"
+        finally:
+            await tail.stop()
+
+    return StreamingResponse(stream_response(), media_type="text/event-stream")
+
+
+async def forward_log_tail(websocket: WebSocket, tail: LogTail):
+    try:
+        async for batch in tail.batches():
+            await send_ws_safe(websocket, batch)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await tail.stop()
+
+
+# ==================== 会话共享 ====================
+
+def _get_owned_session(client_id: str, user: User) -> TerminalSession:
+    ci = active_connections.get(client_id)
+    if not ci or ci.user_id != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    return ci
+
+
+@router.post("/terminal/{client_id}/share", response_model=TerminalShareResponse)
+async def share_terminal_session(
+    client_id: str,
+    share_request: TerminalShareRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """生成共享令牌，观看者在自己的终端 WebSocket 上发送 join 消息加入"""
+    ci = _get_owned_session(client_id, current_user)
+    if ci.viewers is None:
+        ci.viewers = ViewerGroup()
+    ttl = share_request.ttl_seconds or settings.TERMINAL_SHARE_TOKEN_TTL
+    token = ci.viewers.create_token(share_request.access, ttl)
+    logger.info(f"[{client_id}] Share token created ({share_request.access}, {ttl}s)")
+    return TerminalShareResponse(
+        session_id=client_id, share_token=token,
+        access=share_request.access, expires_in=ttl
+    )
+
+
+@router.get("/terminal/{client_id}/viewers")
+async def get_terminal_viewers(
+    client_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """共享会话的观看者列表及各自的队列积压、丢帧情况"""
+    ci = _get_owned_session(client_id, current_user)
+    if ci.viewers is None:
+        return ViewerGroup().stats()
+    return ci.viewers.stats()
+
+
+@router.delete("/terminal/{client_id}/share")
+async def stop_sharing_terminal_session(
+    client_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """撤销所有共享令牌并断开全部观看者"""
+    ci = _get_owned_session(client_id, current_user)
+    if ci.viewers is not None:
+        await ci.viewers.close_all({"type": "disconnected", "content": "会话所有者已停止共享"})
+    return {"message": "已停止共享"}
 
 
 # ==================== WebSocket 主处理 ====================
@@ -420,6 +1074,12 @@ async def terminal_websocket(
 
     await websocket.accept()
     logger.info(f"[{client_id}] WebSocket accepted for {user.username}")
+    # 作为观看者加入的共享会话：(会话 client_id, Viewer)
+    viewing: Optional[tuple] = None
+    # 本 WebSocket 上的日志跟踪
+    tail_task: Optional[asyncio.Task] = None
+    # 异常断开（1006）或服务重启（1012）时 broker 保留会话，客户端可带 resume_token 接回
+    detach = False
 
     try:
         while True:
@@ -432,6 +1092,9 @@ async def terminal_websocket(
 
             msg_type = data.get("type")
             logger.debug(f"[{client_id}] ws msg: {msg_type}")
+            ci = active_connections.get(client_id)
+            if ci:
+                ci.last_ws_activity = time.monotonic()
 
             # ===== ping =====
             if msg_type == "ping":
@@ -449,13 +1112,7 @@ async def terminal_websocket(
                     "type": "status", "content": "正在查询连接配置..."
                 })
 
-                result = await db.execute(
-                    select(Connection)
-                    .where(Connection.id == connection_id)
-                    .where(Connection.user_id == user.id)
-                )
-                conn = result.scalars().one_or_none()
-
+                conn = await _get_user_connection(db, connection_id, user.id)
                 if not conn:
                     await send_ws_safe(websocket, {"type": "error", "content": "Connection not found"})
                     continue
@@ -466,50 +1123,45 @@ async def terminal_websocket(
                 })
 
                 try:
-                    ssh_options = {
-                        "host": conn.host,
-                        "port": conn.port or 22,
-                        "username": conn.username,
-                        "known_hosts": None,
-                    }
-
-                    key_file = None
-                    try:
-                        if conn.auth_method == "password":
-                            ssh_options["password"] = conn.password
-                        elif conn.auth_method == "private_key":
-                            import tempfile, os, stat
-                            if not conn.private_key:
-                                await send_ws_safe(websocket, {"type": "error", "content": "Private key empty"})
-                                continue
-                            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.key') as f:
-                                f.write(conn.private_key)
-                                key_file = f.name
-                            os.chmod(key_file, stat.S_IRUSR)
-                            ssh_options["client_keys"] = [key_file]
-                            if conn.passphrase:
-                                ssh_options["passphrase"] = conn.passphrase
+                    params = await load_connect_params(db, conn)
+                    ssh_process = None
+                    ssh_conn = None
+                    resume_token = None
+                    if ssh_broker.enabled:
+                        # SSH 连接由 broker 进程持有；带 resume_token 时先尝试接回 API 重启前的会话
+                        resume_token = data.get("resume_token") or uuid.uuid4().hex
+                        broker_key = f"{user.id}:{conn.id}:{resume_token}"
+                        attached = await ssh_broker.attach(broker_key) if data.get("resume_token") else None
+                        if attached is not None:
+                            ssh_conn, ssh_process = attached
+                            await send_ws_safe(websocket, {"type": "status", "content": "已恢复断开前的终端会话"})
                         else:
-                            ssh_options["password"] = conn.password
-
-                        await send_ws_safe(websocket, {"type": "status", "content": "正在建立SSH连接..."})
-
-                        ssh_conn = await asyncio.wait_for(
-                            asyncssh.connect(**ssh_options), timeout=15
-                        )
+                            await send_ws_safe(websocket, {"type": "status", "content": "正在建立SSH连接..."})
+                            ssh_conn = await ssh_broker.open_connection(broker_key, params)
+                            await send_ws_safe(websocket, {"type": "status", "content": "SSH已连接，正在创建终端会话..."})
+                            ssh_process = await open_terminal_process(ssh_conn)
+                    else:
+                        ssh_conn = await warm_pool.acquire(user.id, conn.id, params)
+                        if ssh_conn is not None:
+                            await send_ws_safe(websocket, {"type": "status", "content": "复用预热的SSH连接，正在创建终端会话..."})
+                            try:
+                                ssh_process = await open_terminal_process(ssh_conn)
+                            except (asyncssh.Error, OSError) as e:
+                                # 停放期间被服务端断开，改为重新建连
+                                logger.info(f"[{client_id}] Warm connection unusable, reconnecting: {e}")
+                                ssh_conn.close()
 
-                        await send_ws_safe(websocket, {"type": "status", "content": "SSH已连接，正在创建终端会话..."})
+                        if ssh_process is None:
+                            if params.get("jump"):
+                                content = f"正在经跳板机 {params['jump']['host']} 建立SSH连接..."
+                            else:
+                                content = "正在建立SSH连接..."
+                            await send_ws_safe(websocket, {"type": "status", "content": content})
+                            ssh_conn = await open_ssh_connection(params)
 
-                        ssh_process = await ssh_conn.create_process(
-                            term_type='xterm-256color', term_size=(120, 30)
-                        )
+                            await send_ws_safe(websocket, {"type": "status", "content": "SSH已连接，正在创建终端会话..."})
 
-                    finally:
-                        if key_file:
-                            try:
-                                os.unlink(key_file)
-                            except Exception:
-                                pass
+                            ssh_process = await open_terminal_process(ssh_conn)
 
                     # 会话日志
                     session_log_id = None
@@ -533,37 +1185,47 @@ async def terminal_websocket(
                         logger.warning(f"Session log failed: {e}")
 
                     prompt_pattern = build_prompt_pattern(conn.username)
+                    encoding = conn.encoding if conn.encoding in SUPPORTED_ENCODINGS else DEFAULT_ENCODING
+                    binary = bool(data.get("binary"))
+
+                    session = TerminalSession(
+                        client_id, user.id, conn.id, conn.host, conn.username,
+                        ssh_conn=ssh_conn,
+                        ssh_process=ssh_process,
+                        session_log_id=session_log_id,
+                        encoding=encoding,
+                        binary=binary,
+                        prompt_pattern=prompt_pattern,
+                        screen=TerminalScreen(120, 30) if settings.TERMINAL_SCREEN_EMULATION else None,
+                    )
 
-                    conn_info = {
-                        "ssh_conn": ssh_conn,
-                        "ssh_process": ssh_process,
-                        "connection": conn,
-                        "session_log_id": session_log_id,
-                        "db": db,
-                        "commands_log": [],
-                        "prompt_pattern": prompt_pattern,
-                        "watching_command": False,
-                        "command_output_buffer": "",
-                        "last_output_time": 0.0,
-                        "watch_start_time": 0.0,
-                        "interactive_state": None,
-                        "interactive_notified": False,
-                    }
-
-                    await active_connections.add(client_id, conn_info)
+                    session.websocket = websocket
+                    session.triggers = await trigger_registry.scanner_for(db, user.id)
+                    await active_connections.add(client_id, session)
+                    host_facts.attach(conn.id, ssh_conn, encoding)
 
                     # ★ 只启动一个 task（内含 monitor）
-                    output_task = asyncio.create_task(
-                        read_ssh_output(websocket, ssh_process, client_id)
+                    output_task = terminal_tasks.spawn(
+                        read_ssh_output(
+                            websocket, ssh_process, client_id, encoding, binary,
+                            settings.TERMINAL_OUTPUT_RATE_LIMITS.get(user.role, 0)
+                        ),
+                        "read_output", client_id
                     )
-                    conn_info["output_task"] = output_task
+                    session.output_task = output_task
+                    session_reaper.ensure_running(active_connections.values, reap_session)
 
                     await send_ws_safe(websocket, {
                         "type": "connected",
-                        "content": f"Connected to {conn.host} as {conn.username}"
+                        "content": f"Connected to {conn.host} as {conn.username}",
+                        "encoding": encoding,
+                        "binary": binary,
+                        "resume_token": resume_token
                     })
                     logger.info(f"[{client_id}] Connected to {conn.host}")
 
+                except ValueError as e:
+                    await send_ws_safe(websocket, {"type": "error", "content": str(e)})
                 except asyncio.TimeoutError:
                     await send_ws_safe(websocket, {"type": "error", "content": f"连接超时: {conn.host}"})
                 except asyncssh.PermissionDenied:
@@ -574,71 +1236,231 @@ async def terminal_websocket(
                     logger.exception(f"[{client_id}] Connection error")
                     await send_ws_safe(websocket, {"type": "error", "content": f"连接失败: {e}"})
 
+            # ===== preconnect：悬停/选中连接时提前握手 =====
+            elif msg_type == "preconnect":
+                conn = await _get_user_connection(db, data.get("connection_id"), user.id)
+                if conn:
+                    try:
+                        params = await load_connect_params(db, conn)
+                    except ValueError as e:
+                        await send_ws_safe(websocket, {"type": "error", "content": str(e)})
+                        continue
+                    state = "disabled" if ssh_broker.enabled else warm_pool.preconnect(user.id, conn.id, params)
+                    await send_ws_safe(websocket, {"type": "preconnect", "connection_id": conn.id, "state": state})
+
+            # ===== tail_start / tail_stop：日志跟踪 =====
+            elif msg_type == "tail_start":
+                if tail_task and not tail_task.done():
+                    tail_task.cancel()
+                try:
+                    tail_request = LogTailRequest(**{k: v for k, v in data.items() if k != "type"})
+                    tail = await build_log_tail(db, user, tail_request)
+                    await send_ws_safe(websocket, {"type": "status", "content": "正在打开日志跟踪..."})
+                    await tail.start()
+                except ValueError as e:
+                    await send_ws_safe(websocket, {"type": "error", "content": str(e)})
+                    continue
+                except (asyncssh.Error, OSError, asyncio.TimeoutError) as e:
+                    await send_ws_safe(websocket, {"type": "error", "content": f"日志跟踪连接失败: {e}"})
+                    continue
+                tail_task = terminal_tasks.spawn(forward_log_tail(websocket, tail), "log_tail", client_id)
+                await send_ws_safe(websocket, {"type": "tail_started"})
+
+            elif msg_type == "tail_stop":
+                if tail_task and not tail_task.done():
+                    tail_task.cancel()
+                tail_task = None
+
+            # ===== join：以观看者身份加入共享会话 =====
+            elif msg_type == "join":
+                session_id = data.get("session_id", "")
+                target = active_connections.get(session_id)
+                access = target.viewers.redeem(data.get("share_token", "")) if target and target.viewers is not None else None
+                if not access:
+                    await send_ws_safe(websocket, {"type": "error", "content": "共享令牌无效或已过期"})
+                    continue
+                if len(target.viewers.viewers) >= settings.TERMINAL_MAX_VIEWERS:
+                    await send_ws_safe(websocket, {"type": "error", "content": "观看者数量已达上限"})
+                    continue
+                if viewing:
+                    old_target = active_connections.get(viewing[0])
+                    if old_target and old_target.viewers is not None:
+                        await old_target.viewers.remove(viewing[1].viewer_id)
+
+                screen = target.screen
+                viewer = Viewer(
+                    client_id, user.id, user.username, websocket, access,
+                    binary=bool(data.get("binary")),
+                    snapshot=screen.snapshot if screen is not None else None,
+                    queue_size=settings.TERMINAL_VIEWER_QUEUE_SIZE
+                )
+                # 先发加入确认和当前屏幕，再开始接收实时输出
+                await send_ws_safe(websocket, {
+                    "type": "joined",
+                    "session_id": session_id,
+                    "access": access,
+                    "host": target.host,
+                    "username": target.username,
+                    "encoding": target.encoding,
+                    "screen": screen.snapshot() if screen is not None else None
+                })
+                target.viewers.add(viewer)
+                viewing = (session_id, viewer)
+                logger.info(f"[{session_id}] Viewer {user.username} joined ({access})")
+
+            # ===== leave =====
+            elif msg_type == "leave":
+                if viewing:
+                    target = active_connections.get(viewing[0])
+                    if target and target.viewers is not None:
+                        await target.viewers.remove(viewing[1].viewer_id)
+                    viewing = None
+                    await send_ws_safe(websocket, {"type": "left"})
+
             # ===== data/input =====
             elif msg_type in ("data", "input"):
                 ci = active_connections.get(client_id)
                 if ci:
-                    proc = ci["ssh_process"]
-                    data_content = data.get("data", "")
-                    try:
-                        proc.stdin.write(data_content)
-                    except Exception as e:
-                        logger.warning(f"[{client_id}] SSH write failed: {e}")
-                        continue
-
-                    if ci.get("watching_command"):
-                        ci["interactive_notified"] = False
-                        ci["interactive_state"] = None
-                        ci["last_output_time"] = time.time()
-
-                    if '\r' in data_content or '\n' in data_content:
-                        cmd = data_content.strip().replace('\r', '').replace('\n', '')
-                        if cmd:
-                            ci["commands_log"].append({
-                                "command": cmd,
-                                "timestamp": datetime.now().isoformat()
-                            })
+                    if write_session_input(ci, data.get("data", "")) and data.get("seq") is not None:
+                        echo_latency.on_input(ci, data["seq"])
+                elif viewing:
+                    target = active_connections.get(viewing[0])
+                    if not target or viewing[1].viewer_id not in target.viewers.viewers:
+                        viewing = None
+                        await send_ws_safe(websocket, {"type": "error", "content": "共享会话已结束"})
+                    elif not viewing[1].can_write:
+                        await send_ws_safe(websocket, {"type": "error", "content": "只读观看者不能输入"})
+                    else:
+                        write_session_input(target, data.get("data", ""))
+
+            # ===== latency_report =====
+            # 客户端测得的端到端回显延迟（按键 → 画面出现回显，毫秒）
+            elif msg_type == "latency_report":
+                ci = active_connections.get(client_id)
+                samples = data.get("samples")
+                if ci and isinstance(samples, list):
+                    echo_latency.on_report(ci, samples)
 
             # ===== watch_command =====
             elif msg_type == "watch_command":
                 ci = active_connections.get(client_id)
                 if ci:
                     logger.info(f"[{client_id}] watch_command ON")
-                    ci["watching_command"] = True
-                    ci["command_output_buffer"] = ""
-                    ci["last_output_time"] = time.time()
-                    ci["watch_start_time"] = time.time()
-                    ci["interactive_state"] = None
-                    ci["interactive_notified"] = False
+                    ci.reset_watch()
+                    ci.watching_command = True
+                    ci.last_output_time = ci.watch_start_time = time.monotonic()
+
+            # ===== run_command =====
+            # 等价于 watch_command + 输入命令；cache=true 时白名单内的只读命令先查缓存，
+            # 命中直接回 command_finished（cached=true），不经过终端
+            elif msg_type == "run_command":
+                ci = active_connections.get(client_id)
+                command = str(data.get("command") or "").strip()
+                if ci and command:
+                    if data.get("cache"):
+                        hit = command_cache.lookup(ci, command)
+                        if hit is not None:
+                            age, output = hit
+                            await send_ws_safe(websocket, {
+                                "type": "command_finished",
+                                "output": output,
+                                "detection": "cache",
+                                "cached": True,
+                                "age": round(age, 1)
+                            })
+                            continue
+                    ci.reset_watch()
+                    ci.watching_command = True
+                    ci.last_output_time = ci.watch_start_time = time.monotonic()
+                    write_session_input(ci, command + "\r")
+
+            # ===== run_probes =====
+            # 一批只读命令在独立 exec 通道上并发执行，结果一次性返回（不经过终端）
+            elif msg_type == "run_probes":
+                ci = active_connections.get(client_id)
+                commands = data.get("commands")
+                if not ci or not isinstance(commands, list):
+                    await send_ws_safe(websocket, {"type": "error", "content": "run_probes 需要已连接的会话和 commands 列表"})
+                    continue
+                try:
+                    timeout = float(data.get("timeout") or 0)
+                    if not timeout >= 0:
+                        raise ValueError(timeout)
+                except (TypeError, ValueError, OverflowError):
+                    await send_ws_safe(websocket, {"type": "error", "content": "run_probes 的 timeout 必须是非负的秒数"})
+                    continue
+                terminal_tasks.spawn(forward_probe_results(
+                    websocket, ci, [str(c) for c in commands], data.get("id"),
+                    min(timeout, settings.TERMINAL_PROBE_TIMEOUT)
+                ), "probes", client_id)
+
+            # ===== agent =====
+            # 服务端 agent 循环：LLM → 审批 → 执行 → 输出 → LLM 都在后端完成，只推送进度事件
+            elif msg_type == "agent_start":
+                ci = active_connections.get(client_id)
+                prompt = str(data.get("prompt") or "").strip()
+                if not ci or not prompt:
+                    await send_ws_safe(websocket, {"type": "agent_error", "content": "agent_start 需要已连接的会话和 prompt"})
+                    continue
+                try:
+                    agent_runner.start(
+                        ci, lambda event, ws=websocket: send_ws_safe(ws, event), execute_session_command, prompt,
+                        chat_session_id=data.get("chat_session_id"),
+                        approval=data.get("approval") or "manual",
+                        max_steps=int(data.get("max_steps") or 0)
+                    )
+                except ValueError as e:
+                    await send_ws_safe(websocket, {"type": "agent_error", "content": str(e)})
+
+            elif msg_type == "agent_approve":
+                command = data.get("command")
+                if not agent_runner.approve(client_id, bool(data.get("approved")), str(command) if command else None):
+                    await send_ws_safe(websocket, {"type": "agent_error", "content": "没有等待批准的命令"})
+
+            elif msg_type == "agent_stop":
+                await agent_runner.stop(client_id)
 
             # ===== stop_watch =====
             elif msg_type == "stop_watch":
                 ci = active_connections.get(client_id)
                 if ci:
                     logger.info(f"[{client_id}] watch_command OFF")
-                    ci["watching_command"] = False
-                    ci["command_output_buffer"] = ""
-                    ci["interactive_state"] = None
-                    ci["interactive_notified"] = False
+                    ci.reset_watch()
 
             # ===== resize =====
             elif msg_type == "resize":
                 ci = active_connections.get(client_id)
                 if ci:
                     try:
-                        ci["ssh_process"].change_terminal_size(
-                            data.get("cols", 120), data.get("rows", 30)
-                        )
-                    except Exception:
-                        pass
+                        cols = min(max(int(data.get("cols", 120)), 1), MAX_TERMINAL_SIZE)
+                        rows = min(max(int(data.get("rows", 30)), 1), MAX_TERMINAL_SIZE)
+                        ci.ssh_process.change_terminal_size(cols, rows)
+                        if ci.screen is not None:
+                            ci.screen.resize(cols, rows)
+                    except Exception as e:
+                        logger.debug(f"[{client_id}] resize ignored: {e}")
+
+            # ===== screen =====
+            elif msg_type == "get_screen":
+                ci = active_connections.get(client_id)
+                if ci and ci.screen is not None:
+                    await send_ws_safe(websocket, {"type": "screen", **ci.screen.snapshot()})
+                else:
+                    await send_ws_safe(websocket, {"type": "error", "content": "屏幕模拟未启用"})
 
             # ===== disconnect =====
             elif msg_type == "disconnect":
                 break
 
-    except WebSocketDisconnect:
-        pass
+    except WebSocketDisconnect as e:
+        detach = e.code in (1006, 1012)
     except Exception as e:
         logger.error(f"[{client_id}] WS error: {e}")
     finally:
-        await cleanup_connection(client_id, db)
\ No newline at end of file
+        if tail_task and not tail_task.done():
+            tail_task.cancel()
+        if viewing:
+            target = active_connections.get(viewing[0])
+            if target and target.viewers is not None:
+                await target.viewers.remove(viewing[1].viewer_id)
+        await cleanup_connection(client_id, db, detach=detach)
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+终端大缓冲区文本处理卸载
+monitor 每个 tick 要对最多 50KB 的缓冲区做 strip_ansi、提示符和交互检测，
+大量会话同时结束命令时会把事件循环卡住几十毫秒。
+超过阈值的处理交给有界线程池/进程池执行，小缓冲区仍在循环内直接处理。
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(fn: Callable, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class TextProcessingPool:
+    def __init__(self, threshold: int, workers: int, kind: str = "thread"):
+        self.threshold = threshold
+        self.workers = workers
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.inline_calls = 0
+        self.inline_seconds = 0.0
+        self.max_inline_seconds = 0.0
+        self.offloaded_calls = 0
+        self.offloaded_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="term-text"
+                )
+        return self._executor
+
+    async def run(self, fn: Callable, size: int, *args):
+        """size 超过阈值时放到执行器中运行 fn(*args)，否则在事件循环内直接执行"""
+        if size < self.threshold or self.workers <= 0:
+            result, elapsed = _timed_call(fn, *args)
+            self.inline_calls += 1
+            self.inline_seconds += elapsed
+            self.max_inline_seconds = max(self.max_inline_seconds, elapsed)
+            return result
+
+        if self._semaphore is None:
+            # 限制排队中的任务数，避免大量会话同时堆积到执行器
+            self._semaphore = asyncio.Semaphore(self.workers * 4)
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            result, elapsed = await loop.run_in_executor(
+                self._get_executor(), _timed_call, fn, *args
+            )
+        self.offloaded_calls += 1
+        self.offloaded_seconds += elapsed
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "threshold": self.threshold,
+            "inline_calls": self.inline_calls,
+            "inline_loop_ms": round(self.inline_seconds * 1000, 2),
+            "max_inline_ms": round(self.max_inline_seconds * 1000, 2),
+            "offloaded_calls": self.offloaded_calls,
+            # 卸载到执行器的计算时间，即事件循环省下的时间
+            "loop_ms_saved": round(self.offloaded_seconds * 1000, 2),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+text_pool = TextProcessingPool(
+    threshold=settings.TERMINAL_TEXT_OFFLOAD_THRESHOLD,
+    workers=settings.TERMINAL_TEXT_WORKERS,
+    kind=settings.TERMINAL_TEXT_EXECUTOR,
+)
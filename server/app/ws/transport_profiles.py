@@ -0,0 +1,76 @@
+"""
+SSH 传输参数档案
+按链路类型预设 asyncssh.connect 的传输参数：压缩、应用层保活、算法偏好、通道窗口和最大包长。
+Connection.transport_profile 选择档案名，SSH_TRANSPORT_PROFILES 可追加或覆盖档案。
+- default：asyncssh 默认值
+- lan：低延迟内网，不压缩，优先 AES-GCM（有硬件加速），加大窗口
+- wan：公网/跨地域，zlib 压缩，30 秒保活防止 NAT 超时断开
+- high-latency：卫星/跨洲等高时延链路，大窗口覆盖带宽时延积，保活更宽松
+- nat：频繁被 NAT/防火墙回收空闲连接的环境，15 秒保活
+"""
+from typing import Dict
+
+from app.config import settings
+
+# 档案字段直接对应 asyncssh.connect 的关键字参数
+TRANSPORT_OPTION_KEYS = (
+    "compression_algs", "keepalive_interval", "keepalive_count_max",
+    "encryption_algs", "mac_algs", "kex_algs", "window", "max_pktsize",
+)
+
+DEFAULT_PROFILE = "default"
+
+# 优先计算量小的 curve25519，保留老服务器支持的算法作为回退
+KEX_PREFERENCE = [
+    "curve25519-sha256", "curve25519-sha256@libssh.org",
+    "ecdh-sha2-nistp256", "diffie-hellman-group14-sha256",
+]
+
+BUILTIN_PROFILES: Dict[str, dict] = {
+    "default": {},
+    "lan": {
+        "compression_algs": ["none"],
+        "encryption_algs": [
+            "aes128-gcm@openssh.com", "aes256-gcm@openssh.com",
+            "chacha20-poly1305@openssh.com", "aes128-ctr",
+        ],
+        "mac_algs": ["hmac-sha2-256-etm@openssh.com", "umac-128-etm@openssh.com", "hmac-sha2-256"],
+        "kex_algs": KEX_PREFERENCE,
+        "window": 8 * 1024 * 1024,
+        "max_pktsize": 64 * 1024,
+    },
+    "wan": {
+        "compression_algs": ["zlib@openssh.com", "zlib", "none"],
+        "keepalive_interval": 30,
+        "keepalive_count_max": 3,
+        "encryption_algs": [
+            "chacha20-poly1305@openssh.com", "aes128-gcm@openssh.com", "aes256-gcm@openssh.com",
+        ],
+        "kex_algs": KEX_PREFERENCE,
+        "window": 4 * 1024 * 1024,
+    },
+    "high-latency": {
+        "compression_algs": ["zlib@openssh.com", "zlib", "none"],
+        "keepalive_interval": 60,
+        "keepalive_count_max": 5,
+        "kex_algs": KEX_PREFERENCE,
+        "window": 16 * 1024 * 1024,
+        "max_pktsize": 64 * 1024,
+    },
+    "nat": {
+        "keepalive_interval": 15,
+        "keepalive_count_max": 4,
+    },
+}
+
+
+def available_profiles() -> Dict[str, dict]:
+    profiles = dict(BUILTIN_PROFILES)
+    profiles.update(settings.SSH_TRANSPORT_PROFILES)
+    return profiles
+
+
+def transport_options(profile: str) -> dict:
+    """档案名 -> asyncssh.connect 关键字参数；未知档案按 default 处理"""
+    options = available_profiles().get(profile or DEFAULT_PROFILE, {})
+    return {k: v for k, v in options.items() if k in TRANSPORT_OPTION_KEYS}
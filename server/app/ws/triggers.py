@@ -0,0 +1,527 @@
+"""
+终端输出触发规则
+用户和管理员定义的关键字/正则规则（如 `Out of memory`、`segfault`、`FATAL`）编译为一个规则集：
+- 所有关键字（以及能提取出必含关键字的正则的"门控词"）建成 Aho–Corasick 自动机，
+  同一个词表再生成一个前缀树形状的正则做 C 层预筛，只有预筛命中的行才进入自动机逐字符匹配；
+- 提取不出门控词的正则合并成一个残余正则，每块输出 finditer 一次。
+每个会话一个扫描器，携带上一块末尾未结束的行，跨块的匹配在其最后一个字符到达时报告且只报告一次。
+正则是变长的：结束在本块末尾的正则匹配可能被下一块延长（如 `ERROR:\\s+\\w+`），推迟到下一块再报告。
+"""
+import logging
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from app.config import settings
+from app.services.redaction import redact
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+MAX_PATTERN_LENGTH = 256
+# 门控词太短时几乎每行都命中，不如直接放进残余正则
+MIN_GATE_LENGTH = 3
+# 跨块携带的未结束行上限（字符），不小于最长关键字
+MAX_CARRY = 1024
+MAX_LINE_CONTEXT = 300
+SEVERITIES = ("info", "warning", "critical")
+# 终端输出中常见字符，由少见到常见排列；不在表中的字符（大写已折叠、中文等）视为最少见
+COMMON_CHARS = "zqjx~^|`kv<>bw[](){}\"'yg,;pf@%#*+m9876543hu2c0dl1r.:=-/_sniotae \t"
+# 含命名组或分组引用的正则合并后组号/组名会冲突，单独执行
+GROUP_REFERENCE_RE = re.compile(r'\(\?P[<=]|\\[1-9]|\\g<')
+# 开头的全局标志如 (?i)，放进合并正则的分组里就不在表达式开头了，同样单独执行
+GLOBAL_FLAGS_RE = re.compile(r'^\(\?[aiLmsux]+\)')
+
+
+class TriggerRule:
+    __slots__ = ('id', 'name', 'pattern', 'is_regex', 'case_sensitive', 'severity', 'regex')
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        pattern: str,
+        is_regex: bool = False,
+        case_sensitive: bool = False,
+        severity: str = "warning"
+    ):
+        self.id = id
+        self.name = name
+        self.pattern = pattern
+        self.is_regex = is_regex
+        self.case_sensitive = case_sensitive
+        self.severity = severity
+        self.regex: Optional[re.Pattern] = None
+        if is_regex:
+            flags = re.MULTILINE if case_sensitive else re.MULTILINE | re.IGNORECASE
+            self.regex = re.compile(pattern, flags)
+
+
+def validate_pattern(pattern: str, is_regex: bool) -> Optional[str]:
+    """返回错误描述，合法时返回 None"""
+    if not pattern:
+        return "规则内容不能为空"
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        return f"规则长度不能超过 {MAX_PATTERN_LENGTH}"
+    if '\n' in pattern or '\r' in pattern:
+        return "规则不能包含换行"
+    if is_regex:
+        try:
+            # 按规则集的实际编译方式校验（门控、合并或单独执行）
+            TriggerSet([TriggerRule("", "", pattern, is_regex=True)])
+        except re.error as e:
+            return f"正则表达式无效: {e}"
+    return None
+
+
+def _standalone(rule: TriggerRule) -> bool:
+    return bool(GROUP_REFERENCE_RE.search(rule.pattern) or GLOBAL_FLAGS_RE.match(rule.pattern))
+
+
+def _fold(text: str) -> str:
+    """小写化且保持长度不变（只有 U+0130 小写后会变成两个字符）"""
+    folded = text.lower()
+    if len(folded) != len(text):
+        folded = text.replace('İ', 'I').lower()
+    return folded
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """
+    提取正则中每次匹配都必然出现的最长连续字面量（小写），提取不到返回 None
+    只看顶层序列和捕获组内的连续 LITERAL，分支、可选重复里的内容不算
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+
+    best = ""
+
+    def walk(items):
+        nonlocal best
+        run: List[str] = []
+        for op, arg in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(arg))
+                continue
+            if len(run) > len(best):
+                best = ''.join(run)
+            run = []
+            if op is sre_parse.SUBPATTERN:
+                walk(arg[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+                walk(arg[2])
+        if len(run) > len(best):
+            best = ''.join(run)
+
+    walk(parsed)
+    best = _fold(best)
+    if len(best) < MIN_GATE_LENGTH or not best.strip():
+        return None
+    return best
+
+
+class AhoCorasick:
+    """
+    关键字自动机：goto 用每个状态一个字典，fail 链在构建时按 BFS 计算，
+    out[state] 为以该状态结尾的所有关键字编号（已沿 fail 链合并）
+    """
+    __slots__ = ('_goto', '_fail', '_out', 'words')
+
+    def __init__(self, words: List[str]):
+        self.words = words
+        goto: List[Dict[str, int]] = [{}]
+        out: List[tuple] = [()]
+        for index, word in enumerate(words):
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] = out[state] + (index,)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def search(self, text: str, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+        """返回 [(关键字编号, 结束位置), ...]，包含重叠匹配"""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        state = 0
+        for pos in range(start, len(text) if end is None else end):
+            ch = text[pos]
+            while True:
+                nxt = goto[state].get(ch)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if out[state]:
+                for index in out[state]:
+                    hits.append((index, pos + 1))
+        return hits
+
+
+def _anchor(word: str) -> str:
+    """
+    取词中最少见的字符起的后缀作为预筛串：词出现时该后缀必然出现，
+    而预筛正则只在首字符集合里的位置进入匹配，首字符越少见扫描越快
+    """
+    best, best_rank = 0, len(COMMON_CHARS)
+    # 后缀至少保留 MIN_GATE_LENGTH 个字符，太短的串在普通输出里到处命中
+    for i, ch in enumerate(word[:max(len(word) - MIN_GATE_LENGTH + 1, 1)]):
+        rank = COMMON_CHARS.find(ch)
+        if rank < 0:
+            return word[i:]
+        if rank < best_rank:
+            best, best_rank = i, rank
+    return word[best:]
+
+
+def _trie_regex(words: List[str]) -> Optional[re.Pattern]:
+    """
+    把预筛串写成前缀树形状的正则：同一层分支的首字符互不相同，
+    sre 的 BRANCH 对首字符不符的分支直接跳过，整段扫描停留在 C 层
+    """
+    if not words:
+        return None
+    root: dict = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = None
+
+    def emit(node: dict) -> str:
+        if '' in node:
+            # 已经是完整的串，更长的只需一个就能命中，预筛不必继续
+            return ''
+        branches = [re.escape(ch) + emit(child) for ch, child in node.items()]
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    return re.compile(emit(root))
+
+
+class TriggerSet:
+    """编译后的规则集，只读，可被多个会话共享"""
+
+    def __init__(self, rules: List[TriggerRule]):
+        self.rules = rules
+        words: List[str] = []
+        word_index: Dict[str, int] = {}
+        # 关键字编号 -> [(规则, 是否门控)]
+        self._word_rules: List[List[Tuple[TriggerRule, bool]]] = []
+        residual: List[TriggerRule] = []
+        for rule in rules:
+            if rule.is_regex:
+                word = required_literal(rule.pattern)
+                if word is None:
+                    residual.append(rule)
+                    continue
+                gated = True
+            else:
+                word = _fold(rule.pattern)
+                gated = False
+            index = word_index.get(word)
+            if index is None:
+                index = word_index[word] = len(words)
+                words.append(word)
+                self._word_rules.append([])
+            self._word_rules[index].append((rule, gated))
+
+        self.automaton = AhoCorasick(words)
+        self.prefilter = _trie_regex([_anchor(w) for w in words])
+        self.residual_rules = residual
+        # 不含分组引用/命名组/全局标志的残余正则合并成一个，各自的大小写标志用内联作用域保留
+        mergeable = [r for r in residual if not _standalone(r)]
+        self._merged_rules = mergeable
+        self._standalone_rules = [r for r in residual if _standalone(r)]
+        self.residual: Optional[re.Pattern] = None
+        if mergeable:
+            self.residual = re.compile('|'.join(
+                f"(?P<r{i}>{r.pattern})" if r.case_sensitive else f"(?P<r{i}>(?i:{r.pattern}))"
+                for i, r in enumerate(mergeable)
+            ), re.MULTILINE)
+        self.max_word = max((len(w) for w in words), default=0)
+
+    def scan(self, window: str, new_from: int) -> List[Tuple[TriggerRule, str, int, int]]:
+        """
+        扫描 window，只报告结束位置在 new_from 之后的匹配（之前的部分上一块已经报告过）；
+        正则匹配报告结束位置在 [new_from, len(window)) 内的：恰好结束在 new_from 的是上一块推迟的
+        返回 [(规则, 匹配文本, 起点, 终点), ...]
+        """
+        results = []
+        window_end = len(window)
+        if self.prefilter is not None:
+            folded = _fold(window)
+            last_line_end = -1
+            for m in self.prefilter.finditer(folded):
+                start = folded.rfind('\n', 0, m.start()) + 1
+                if start <= last_line_end:
+                    continue
+                end = folded.find('\n', m.start())
+                if end < 0:
+                    end = len(folded)
+                last_line_end = end
+                self._match_line(window, folded, start, end, new_from, results)
+
+        if self.residual is not None:
+            rules = self._merged_rules
+            for m in self.residual.finditer(window):
+                if new_from <= m.end() < window_end and m.end() > m.start():
+                    rule = rules[int(m.lastgroup[1:])]
+                    results.append((rule, m.group(), m.start(), m.end()))
+        for rule in self._standalone_rules:
+            for m in rule.regex.finditer(window):
+                if new_from <= m.end() < window_end and m.end() > m.start():
+                    results.append((rule, m.group(), m.start(), m.end()))
+        return results
+
+    def _match_line(self, window, folded, start, end, new_from, results):
+        word_rules = self._word_rules
+        words = self.automaton.words
+        regex_done = set()
+        for index, pos in self.automaton.search(folded, start, end):
+            for rule, gated in word_rules[index]:
+                if gated:
+                    if rule.id in regex_done:
+                        continue
+                    regex_done.add(rule.id)
+                    for m in rule.regex.finditer(window, start, end):
+                        if new_from <= m.end() < len(window) and m.end() > m.start():
+                            results.append((rule, m.group(), m.start(), m.end()))
+                    continue
+                if pos <= new_from:
+                    continue
+                begin = pos - len(words[index])
+                text = window[begin:pos]
+                if rule.case_sensitive and text != rule.pattern:
+                    continue
+                results.append((rule, text, begin, pos))
+
+
+class TriggerScanner:
+    """单个会话的扫描状态：上一块的未结束行、每条规则的冷却时间"""
+    __slots__ = ('registry', 'user_id', 'carry', 'last_fired', 'suppressed')
+
+    def __init__(self, registry: "TriggerRegistry", user_id: str):
+        self.registry = registry
+        self.user_id = user_id
+        self.carry = ""
+        self.last_fired: Dict[str, float] = {}
+        self.suppressed = 0
+
+    def feed(self, data: str) -> List[dict]:
+        """扫描一块输出，返回要推送的 trigger 事件"""
+        trigger_set = self.registry.current(self.user_id)
+        if trigger_set is None:
+            self.carry = ""
+            return []
+        carry = self.carry
+        window = carry + data
+        tail = window.rfind('\n') + 1
+        self.carry = window[max(tail, len(window) - MAX_CARRY):]
+
+        start = time.perf_counter()
+        hits = trigger_set.scan(window, len(carry))
+        self.registry.record_scan(len(data), time.perf_counter() - start)
+        if not hits:
+            return []
+
+        # 同一规则在一块里多次命中只报一次（带次数），并受冷却时间限制
+        grouped: Dict[str, list] = {}
+        for rule, text, begin, end in hits:
+            entry = grouped.get(rule.id)
+            if entry is None:
+                grouped[rule.id] = [rule, text, begin, end, 1]
+            else:
+                entry[4] += 1
+
+        now = time.monotonic()
+        cooldown = settings.TERMINAL_TRIGGER_COOLDOWN
+        events = []
+        for rule_id, (rule, text, begin, end, count) in grouped.items():
+            last = self.last_fired.get(rule_id)
+            if last is not None and now - last < cooldown:
+                self.suppressed += count
+                continue
+            self.last_fired[rule_id] = now
+            line_start = window.rfind('\n', 0, begin) + 1
+            line_end = window.find('\n', end)
+            line = window[line_start:line_end if line_end >= 0 else len(window)].rstrip('\r')
+            events.append({
+                "type": "trigger",
+                "rule_id": rule.id,
+                "name": rule.name,
+                "severity": rule.severity,
+                "match": text,
+                # 相对本块输出的位置，匹配跨块时 offset 为负
+                "offset": begin - len(carry),
+                "length": end - begin,
+                # 上下文行会经由通知钩子发到外部（webhook），先脱敏
+                "line": redact(line[:MAX_LINE_CONTEXT]),
+                "count": count,
+            })
+        return events
+
+
+TriggerHook = Callable[[dict, List[dict]], Awaitable[None]]
+
+
+class TriggerRegistry:
+    """
+    按用户缓存编译后的规则集（该用户的规则 + 全局规则）；规则变更时重新编译已加载的用户。
+    通知钩子在后台任务里调用，不阻塞输出读取循环。
+    """
+
+    def __init__(self):
+        self._sets: Dict[str, Optional[TriggerSet]] = {}
+        self._hooks: List[TriggerHook] = []
+        self._hook_tasks: set = set()
+        self.compiles = 0
+        self.compile_seconds = 0.0
+        self.scanned_chars = 0
+        self.scan_seconds = 0.0
+        self.events = 0
+
+    def current(self, user_id: str) -> Optional[TriggerSet]:
+        return self._sets.get(user_id)
+
+    async def _load_rules(self, db, user_id: str) -> List[TriggerRule]:
+        from sqlalchemy import select, or_
+        from app.models.trigger_rule import TriggerRule as TriggerRuleModel
+
+        result = await db.execute(
+            select(TriggerRuleModel).where(
+                TriggerRuleModel.enabled == True,  # noqa: E712
+                or_(TriggerRuleModel.user_id == user_id, TriggerRuleModel.user_id.is_(None))
+            )
+        )
+        rules = []
+        for row in result.scalars().all():
+            try:
+                rules.append(TriggerRule(
+                    row.id, row.name, row.pattern, bool(row.is_regex),
+                    bool(row.case_sensitive), row.severity or "warning"
+                ))
+            except re.error as e:
+                logger.warning(f"Skipping invalid trigger rule {row.id}: {e}")
+        return rules
+
+    async def load(self, db, user_id: str) -> Optional[TriggerSet]:
+        rules = await self._load_rules(db, user_id)
+        start = time.perf_counter()
+        try:
+            trigger_set = TriggerSet(rules) if rules else None
+        except re.error as e:
+            # 规则集编译失败不能影响终端连接，本用户暂不做触发扫描
+            logger.warning(f"Failed to compile trigger rules for user {user_id}: {e}")
+            trigger_set = None
+        self.compile_seconds += time.perf_counter() - start
+        self.compiles += 1
+        self._sets[user_id] = trigger_set
+        return trigger_set
+
+    async def scanner_for(self, db, user_id: str) -> TriggerScanner:
+        if user_id not in self._sets:
+            await self.load(db, user_id)
+        return TriggerScanner(self, user_id)
+
+    async def reload(self, db, user_id: Optional[str] = None):
+        """规则变更后调用；user_id 为 None（全局规则变更）时重编译所有已加载用户"""
+        user_ids = list(self._sets) if user_id is None else [user_id] if user_id in self._sets else []
+        for uid in user_ids:
+            await self.load(db, uid)
+
+    def release(self, user_id: str, active_user_ids):
+        """用户最后一个会话关闭后丢弃其规则集"""
+        if user_id not in active_user_ids:
+            self._sets.pop(user_id, None)
+
+    def record_scan(self, chars: int, seconds: float):
+        self.scanned_chars += chars
+        self.scan_seconds += seconds
+
+    def add_hook(self, hook: TriggerHook):
+        self._hooks.append(hook)
+
+    def notify(self, session: dict, events: List[dict]):
+        self.events += len(events)
+        for hook in self._hooks:
+            task = terminal_tasks.spawn(self._run_hook(hook, session, events), "trigger_hook")
+            self._hook_tasks.add(task)
+            task.add_done_callback(self._hook_tasks.discard)
+
+    async def _run_hook(self, hook: TriggerHook, session: dict, events: List[dict]):
+        try:
+            await hook(session, events)
+        except Exception as e:
+            logger.warning(f"Trigger hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+    def stats(self) -> dict:
+        loaded = [s for s in self._sets.values() if s is not None]
+        return {
+            "users_loaded": len(self._sets),
+            "rules": sum(len(s.rules) for s in loaded),
+            "automaton_states": sum(s.automaton.states for s in loaded),
+            "residual_regexes": sum(len(s.residual_rules) for s in loaded),
+            "compiles": self.compiles,
+            "avg_compile_ms": round(self.compile_seconds * 1000 / self.compiles, 2) if self.compiles else 0.0,
+            "scanned_mb": round(self.scanned_chars / 1e6, 2),
+            "scan_mb_per_second": round(self.scanned_chars / 1e6 / self.scan_seconds, 1) if self.scan_seconds else 0.0,
+            "events": self.events,
+            "hooks": len(self._hooks),
+        }
+
+
+async def log_trigger_hook(session: dict, events: List[dict]):
+    for event in events:
+        logger.info(
+            f"Trigger [{event['severity']}] {event['name']} on {session.get('host')} "
+            f"({session.get('client_id')}): {event['line']}"
+        )
+
+
+async def webhook_trigger_hook(session: dict, events: List[dict]):
+    import httpx
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        await client.post(settings.TERMINAL_TRIGGER_WEBHOOK_URL, json={"session": session, "events": events})
+
+
+trigger_registry = TriggerRegistry()
+trigger_registry.add_hook(log_trigger_hook)
+if settings.TERMINAL_TRIGGER_WEBHOOK_URL:
+    trigger_registry.add_hook(webhook_trigger_hook)
@@ -0,0 +1,211 @@
+"""
+终端会话共享：一个 SSH 输出流扇出给多个观看者
+输出每块只编码一次（JSON 文本帧 / 原始字节帧各至多一次），再放入每个观看者自己的有界队列，
+由各自的发送任务写 socket；慢观看者队列满时丢弃积压并在追上后补发一次屏幕快照，不会拖住其他人。
+"""
+import asyncio
+import json
+import logging
+import secrets
+import time
+from typing import Callable, Dict, Optional
+
+from fastapi import WebSocket
+
+from app.config import settings
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+ACCESS_READ_ONLY = "ro"
+ACCESS_READ_WRITE = "rw"
+
+
+class Viewer:
+    """单个观看者：有界发送队列 + 独立发送任务"""
+
+    __slots__ = (
+        'viewer_id', 'user_id', 'username', 'websocket', 'access', 'binary',
+        'queue', 'task', 'snapshot', 'needs_resync', 'frames_sent', 'frames_dropped', 'joined_at',
+    )
+
+    def __init__(
+        self,
+        viewer_id: str,
+        user_id: str,
+        username: str,
+        websocket: WebSocket,
+        access: str,
+        binary: bool = False,
+        snapshot: Optional[Callable[[], Optional[dict]]] = None,
+        queue_size: int = 256,
+    ):
+        self.viewer_id = viewer_id
+        self.user_id = user_id
+        self.username = username
+        self.websocket = websocket
+        self.access = access
+        self.binary = binary
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 2))
+        self.task: Optional[asyncio.Task] = None
+        # 追帧用：返回当前屏幕快照（未启用屏幕模拟时为 None）
+        self.snapshot = snapshot
+        self.needs_resync = False
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.joined_at = time.time()
+
+    @property
+    def can_write(self) -> bool:
+        return self.access == ACCESS_READ_WRITE
+
+    def start(self):
+        self.task = terminal_tasks.spawn(self._pump(), "viewer_pump")
+
+    def offer(self, frame):
+        """非阻塞入队；队列满时清空积压，等发送任务追上后补发快照"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            dropped = self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.frames_dropped += dropped
+            self.needs_resync = True
+
+    def finish(self, frame=None):
+        """排入最后一帧和结束标记，发送任务发完后退出"""
+        if self.queue.qsize() + 2 > self.queue.maxsize:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        if frame is not None:
+            self.queue.put_nowait(frame)
+        self.queue.put_nowait(None)
+
+    async def _pump(self):
+        ws = self.websocket
+        try:
+            while True:
+                if self.needs_resync and self.queue.empty():
+                    self.needs_resync = False
+                    snap = self.snapshot() if self.snapshot else None
+                    await ws.send_text(json.dumps({"type": "resync", **(snap or {})}))
+                frame = await self.queue.get()
+                if frame is None:
+                    break
+                if isinstance(frame, bytes):
+                    await ws.send_bytes(frame)
+                else:
+                    await ws.send_text(frame)
+                self.frames_sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.debug(f"[viewer {self.viewer_id}] send failed: {e}")
+
+    async def close(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "viewer_id": self.viewer_id,
+            "user_id": self.user_id,
+            "username": self.username,
+            "access": self.access,
+            "binary": self.binary,
+            "queued": self.queue.qsize(),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "joined_at": self.joined_at,
+        }
+
+
+class ViewerGroup:
+    """挂在 TerminalSession 上的观看者集合与共享令牌"""
+
+    __slots__ = ('viewers', 'tokens', 'frames_encoded')
+
+    def __init__(self):
+        self.viewers: Dict[str, Viewer] = {}
+        # token -> (access, 过期的单调时钟时间)
+        self.tokens: Dict[str, tuple] = {}
+        self.frames_encoded = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.viewers)
+
+    def create_token(self, access: str, ttl: int) -> str:
+        now = time.monotonic()
+        self.tokens = {t: v for t, v in self.tokens.items() if v[1] > now}
+        token = secrets.token_urlsafe(24)
+        self.tokens[token] = (access, now + ttl)
+        return token
+
+    def redeem(self, token: str) -> Optional[str]:
+        """校验共享令牌，返回授予的访问级别"""
+        entry = self.tokens.get(token)
+        if not entry:
+            return None
+        access, expires = entry
+        if expires <= time.monotonic():
+            self.tokens.pop(token, None)
+            return None
+        return access
+
+    def add(self, viewer: Viewer):
+        self.viewers[viewer.viewer_id] = viewer
+        viewer.start()
+
+    async def remove(self, viewer_id: str):
+        viewer = self.viewers.pop(viewer_id, None)
+        if viewer:
+            await viewer.close()
+
+    def broadcast(
+        self,
+        text_message: Optional[dict] = None,
+        raw: Optional[bytes] = None,
+        text_frame: Optional[str] = None
+    ):
+        """编码一次，按观看者偏好分发文本帧或字节帧；text_frame 为调用方已编码好的文本帧"""
+        if text_frame is not None:
+            self.frames_encoded += 1
+        for viewer in self.viewers.values():
+            if viewer.binary and raw is not None:
+                viewer.offer(raw)
+                continue
+            if text_message is None and text_frame is None:
+                continue
+            if text_frame is None:
+                text_frame = json.dumps(text_message)
+                self.frames_encoded += 1
+            viewer.offer(text_frame)
+
+    async def close_all(self, message: Optional[dict] = None):
+        """会话结束：通知所有观看者并停止发送任务"""
+        frame = json.dumps(message) if message else None
+        viewers = list(self.viewers.values())
+        self.viewers.clear()
+        self.tokens.clear()
+        for viewer in viewers:
+            viewer.finish(frame)
+        tasks = [v.task for v in viewers if v.task]
+        if tasks:
+            # 给发送任务一点时间把结束消息发出去，慢观看者直接取消
+            await asyncio.wait(tasks, timeout=1)
+        for viewer in viewers:
+            await viewer.close()
+
+    def stats(self) -> dict:
+        return {
+            "viewer_count": len(self.viewers),
+            "max_viewers": settings.TERMINAL_MAX_VIEWERS,
+            "active_share_tokens": sum(1 for _, exp in self.tokens.values() if exp > time.monotonic()),
+            "frames_encoded": self.frames_encoded,
+            "viewers": [v.stats() for v in self.viewers.values()],
+        }
@@ -0,0 +1,159 @@
+"""
+SSH 连接预热池
+前端在悬停/选中连接时调用 preconnect，后台先完成 TCP + SSH 握手和认证，
+已认证的连接按 (用户, 连接) 短暂停放；随后的 connect 直接取用，省掉 1~3 秒建连等待。
+未被取用的连接到期关闭。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import asyncssh
+
+from app.config import settings
+from app.ws.ssh_connect import open_ssh_connection, params_fingerprint
+from app.ws.tasks import terminal_tasks
+
+logger = logging.getLogger(__name__)
+
+
+class WarmEntry:
+    __slots__ = ('fingerprint', 'task', 'started', 'finished', 'expire_handle')
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.started = time.monotonic()
+        self.finished = 0.0
+        self.expire_handle: Optional[asyncio.TimerHandle] = None
+
+
+class SSHWarmPool:
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str], WarmEntry] = {}
+        self.preconnects = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.failed = 0
+        self.seconds_saved = 0.0
+
+    def _close_entry(self, entry: WarmEntry):
+        if entry.expire_handle:
+            entry.expire_handle.cancel()
+        if not entry.task.done():
+            entry.task.cancel()
+        elif not entry.task.cancelled() and entry.task.exception() is None:
+            try:
+                entry.task.result().close()
+            except Exception:
+                pass
+
+    def _expire(self, key: Tuple[str, str], entry: WarmEntry):
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+            self.expired += 1
+            self._close_entry(entry)
+            logger.debug(f"Warm SSH connection expired: {key[1]}")
+
+    async def _warm(self, key: Tuple[str, str], entry: WarmEntry, params: dict) -> asyncssh.SSHClientConnection:
+        try:
+            ssh_conn = await open_ssh_connection(params)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            logger.info(f"Preconnect to {params['host']} failed: {e}")
+            raise
+        entry.finished = time.monotonic()
+        if self._entries.get(key) is entry:
+            # 从握手完成开始计 TTL
+            entry.expire_handle = asyncio.get_running_loop().call_later(self.ttl, self._expire, key, entry)
+        return ssh_conn
+
+    def preconnect(self, user_id: str, connection_id: str, params: dict) -> str:
+        """后台开始握手；返回 warming / ready / disabled"""
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return "disabled"
+        key = (user_id, connection_id)
+        fingerprint = params_fingerprint(params)
+        entry = self._entries.get(key)
+        if entry and entry.fingerprint == fingerprint:
+            return "ready" if entry.finished else "warming"
+        if entry:
+            del self._entries[key]
+            self._close_entry(entry)
+
+        while len(self._entries) >= self.max_entries:
+            old_key = next(iter(self._entries))
+            self._close_entry(self._entries.pop(old_key))
+            self.expired += 1
+
+        self.preconnects += 1
+        entry = WarmEntry(fingerprint, None)
+        entry.task = terminal_tasks.spawn(self._warm(key, entry, params), "warm_connect")
+        # 失败由 _warm 计数，这里只避免 "exception never retrieved" 警告
+        entry.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._entries[key] = entry
+        return "warming"
+
+    async def acquire(self, user_id: str, connection_id: str, params: dict) -> Optional[asyncssh.SSHClientConnection]:
+        """取走预热连接（握手进行中则等待其完成）；没有可用连接时返回 None"""
+        key = (user_id, connection_id)
+        entry = self._entries.pop(key, None)
+        if entry is None or entry.fingerprint != params_fingerprint(params):
+            if entry:
+                self._close_entry(entry)
+            self.misses += 1
+            return None
+        if entry.expire_handle:
+            entry.expire_handle.cancel()
+
+        wait_start = time.monotonic()
+        try:
+            ssh_conn = await entry.task
+        except (asyncio.CancelledError, Exception):
+            self.misses += 1
+            return None
+        if ssh_conn.is_closed():
+            self.misses += 1
+            return None
+
+        waited = time.monotonic() - wait_start
+        self.hits += 1
+        self.seconds_saved += max((entry.finished - entry.started) - waited, 0.0)
+        return ssh_conn
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "parked": sum(1 for e in self._entries.values() if e.finished),
+            "warming": sum(1 for e in self._entries.values() if not e.finished),
+            "preconnects": self.preconnects,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "failed": self.failed,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "seconds_saved": round(self.seconds_saved, 2),
+            "avg_seconds_saved_per_hit": round(self.seconds_saved / self.hits, 3) if self.hits else 0.0,
+        }
+
+    def shutdown(self):
+        entries = list(self._entries.values())
+        self._entries.clear()
+        for entry in entries:
+            self._close_entry(entry)
+
+
+warm_pool = SSHWarmPool(
+    ttl=settings.SSH_WARM_POOL_TTL,
+    max_entries=settings.SSH_WARM_POOL_SIZE,
+)
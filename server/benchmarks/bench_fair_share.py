@@ -0,0 +1,92 @@
+"""
+公平调度基准：一个会话持续刷屏时，安静会话的按键回显延迟
+对比 TERMINAL_FAIR_SCHEDULING 关闭/开启时安静会话回显延迟的 p50/p99。
+
+用法: python -m benchmarks.bench_fair_share [--quiet 20] [--seconds 5]
+"""
+import argparse
+import asyncio
+import time
+
+from app.config import settings
+from app.ws import terminal
+from benchmarks.bench_read_loop import FakeProcess, FakeWebSocket
+
+FLOOD_BLOCK = b"QUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFBQUFB\r\n" * 50000
+
+
+class EchoSocket(FakeWebSocket):
+    def __init__(self, pending: dict, latencies: list):
+        super().__init__()
+        self.pending = pending
+        self.latencies = latencies
+
+    async def send_json(self, data):
+        await super().send_json(data)
+        sent_at = self.pending.pop("t", None)
+        if sent_at is not None:
+            self.latencies.append(time.perf_counter() - sent_at)
+
+
+async def flood(process: FakeProcess, stop: asyncio.Event):
+    while not stop.is_set():
+        if len(process.stdout._buffer) < len(FLOOD_BLOCK):
+            process.stdout.feed_data(FLOOD_BLOCK)
+        await asyncio.sleep(0)
+    process.stdout.feed_eof()
+
+
+async def typist(process: FakeProcess, pending: dict, stop: asyncio.Event):
+    while not stop.is_set():
+        await asyncio.sleep(0.02)
+        pending["t"] = time.perf_counter()
+        process.stdout.feed_data(b"x")
+    process.stdout.feed_eof()
+
+
+async def run(quiet: int, seconds: float) -> dict:
+    stop = asyncio.Event()
+    latencies: list = []
+    noisy_proc, noisy_ws = FakeProcess(), FakeWebSocket()
+    tasks = [
+        asyncio.create_task(flood(noisy_proc, stop)),
+        asyncio.create_task(terminal.read_ssh_output(noisy_ws, noisy_proc, "noisy")),
+    ]
+    for i in range(quiet):
+        pending: dict = {}
+        proc = FakeProcess()
+        tasks.append(asyncio.create_task(typist(proc, pending, stop)))
+        tasks.append(asyncio.create_task(
+            terminal.read_ssh_output(EchoSocket(pending, latencies), proc, f"quiet-{i}")
+        ))
+
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies.sort()
+    return {
+        "echo p50 ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "echo p99 ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "echo samples": len(latencies),
+        "noisy MB/s": noisy_ws.bytes_sent / 1e6 / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quiet", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    terminal.logger.setLevel("WARNING")
+    for enabled in (False, True):
+        settings.TERMINAL_FAIR_SCHEDULING = enabled
+        stats = asyncio.run(run(args.quiet, args.seconds))
+        print(f"fair scheduling {'on' if enabled else 'off'}")
+        for key, value in stats.items():
+            print(f"  {key:<14} {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
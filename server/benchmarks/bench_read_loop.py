@@ -0,0 +1,120 @@
+"""
+SSH 读循环基准：旧版 wait_for(read(4096), 0.5) 与自适应读块对比
+用 asyncio.StreamReader 模拟 asyncssh 的 stdout（read(n) 语义相同：有数据即返回，最多 n 字节），
+用假 WebSocket 承担 send_json 的编码开销。
+同时跑一个探针任务测量事件循环延迟，反映读循环对其他会话的影响。
+
+用法: python -m benchmarks.bench_read_loop [--mb 50] [--sessions 4]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from app.ws import terminal
+
+PRODUCER_CHUNK = 32 * 1024
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.bytes_sent = 0
+        self.frames = 0
+
+    async def send_json(self, data):
+        self.bytes_sent += len(json.dumps(data))
+        self.frames += 1
+
+    async def send_bytes(self, data):
+        self.bytes_sent += len(data)
+        self.frames += 1
+
+
+class FakeProcess:
+    def __init__(self):
+        self.stdout = asyncio.StreamReader(limit=2 ** 30)
+
+
+async def produce(process: FakeProcess, total: int):
+    line = (b"2024-01-01 12:00:00 INFO worker[42]: processed request id=abcdef in 3ms\r\n")
+    block = line * (PRODUCER_CHUNK // len(line))
+    sent = 0
+    while sent < total:
+        process.stdout.feed_data(block)
+        sent += len(block)
+        await asyncio.sleep(0)
+    process.stdout.feed_eof()
+
+
+async def legacy_read_loop(websocket, ssh_process, client_id):
+    """改造前的读循环（仅用于对比）"""
+    while True:
+        try:
+            data = await asyncio.wait_for(ssh_process.stdout.read(4096), timeout=0.5)
+        except asyncio.TimeoutError:
+            continue
+        if not data:
+            break
+        await terminal.send_ws_safe(websocket, {"type": "output", "data": data.decode("utf-8", "replace")})
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def run(loop_fn, total: int, sessions: int) -> dict:
+    stop = asyncio.Event()
+    lags = []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    sockets = [FakeWebSocket() for _ in range(sessions)]
+    procs = [FakeProcess() for _ in range(sessions)]
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(produce(p, total) for p in procs),
+        *(loop_fn(ws, p, f"bench-{i}") for i, (ws, p) in enumerate(zip(sockets, procs))),
+    )
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    stop.set()
+    await probe_task
+
+    mb = total * sessions / 1e6
+    lags.sort()
+    return {
+        "MB/s per session": total / 1e6 / elapsed,
+        "CPU ms per MB": cpu * 1000 / mb,
+        "WS frames": sum(ws.frames for ws in sockets),
+        "loop lag p50 ms": statistics.median(lags) * 1000 if lags else 0.0,
+        "loop lag p99 ms": lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=50)
+    parser.add_argument("--sessions", type=int, default=4)
+    args = parser.parse_args()
+
+    logging_level = terminal.logger.level
+    terminal.logger.setLevel("WARNING")
+    total = int(args.mb * 1e6)
+    results = {
+        "legacy (wait_for 4 KiB)": asyncio.run(run(legacy_read_loop, total, args.sessions)),
+        "adaptive (plain read)": asyncio.run(run(terminal.read_ssh_output, total, args.sessions)),
+    }
+    terminal.logger.setLevel(logging_level)
+
+    for name, stats in results.items():
+        print(name)
+        for key, value in stats.items():
+            print(f"  {key:<18} {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+虚拟终端屏幕模型吞吐基准
+用法: python -m benchmarks.bench_screen [--mb 20] [--chunk 4096]
+"""
+import argparse
+import random
+import time
+
+from app.ws.screen import TerminalScreen
+
+
+def build_workloads(size: int) -> dict:
+    rnd = random.Random(42)
+    words = ["error", "nginx", "systemd", "/var/log", "0.0.0.0:80", "running", "中文日志"]
+
+    lines = []
+    total = 0
+    while total < size:
+        lines.append(" ".join(rnd.choice(words) for _ in range(rnd.randint(3, 15))) + "\r\n")
+        total += len(lines[-1])
+    plain = "".join(lines)
+
+    colored = []
+    total = 0
+    while total < size:
+        colored.append(f"\x1b[01;3{rnd.randint(1, 7)}m{rnd.choice(words)}\x1b[0m  " * 6 + "\r\n")
+        total += len(colored[-1])
+    colored = "".join(colored)
+
+    frames = []
+    total = 0
+    while total < size:
+        frame = ["\x1b[H\x1b[2J"]
+        for row in range(1, 30):
+            frame.append(f"\x1b[{row};1H{rnd.randint(1, 99999):>6} root  20  0 {rnd.random():.1f}  \x1b[K")
+        frames.append("".join(frame))
+        total += len(frames[-1])
+    fullscreen = "\x1b[?1049h" + "".join(frames)
+
+    return {"plain": plain[:size], "colored": colored[:size], "fullscreen": fullscreen[:size]}
+
+
+def run(data: str, chunk: int) -> float:
+    screen = TerminalScreen(120, 30)
+    chunks = [data[i:i + chunk] for i in range(0, len(data), chunk)]
+    start = time.perf_counter()
+    for c in chunks:
+        screen.feed(c)
+    elapsed = time.perf_counter() - start
+    return len(data.encode()) / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=20)
+    parser.add_argument("--chunk", type=int, default=4096)
+    args = parser.parse_args()
+
+    workloads = build_workloads(int(args.mb * 1e6))
+    for name, data in workloads.items():
+        print(f"{name:<12} {run(data, args.chunk):8.1f} MB/s  (chunk={args.chunk})")
+
+
+if __name__ == "__main__":
+    main()
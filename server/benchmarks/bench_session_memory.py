@@ -0,0 +1,112 @@
+"""
+终端会话内存基准：创建大量空闲会话，用 tracemalloc 统计每会话字节数
+- baseline conn_info：基线版本 terminal.py 里的会话字典（持有 ORM Connection 对象、命令记录字典；当时没有服务端屏幕）
+- TerminalSession：同样的状态改用 __slots__ 对象，不带屏幕，和基线一一对应
+- TerminalSession + screen：再加上服务端虚拟屏幕（新功能的开销，预算按这一项检查）
+SSH 连接/通道、WebSocket handler 持有的数据库会话（新旧版本都有）不在统计范围内。
+
+用法: python -m benchmarks.bench_session_memory [--sessions 10000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from app.models.connection import Connection
+from app.ws.screen import TerminalScreen
+from app.ws.session import TerminalSession
+from app.ws.terminal import build_prompt_pattern
+
+# 每个空闲会话（不含 SSH 连接）的内存预算
+SESSION_MEMORY_BUDGET = 16 * 1024
+
+PROMPT = "Last login: Mon Jan  1 12:00:00 2024 from 10.0.0.1\r\n\x1b[01;32mroot@web-01\x1b[00m:\x1b[01;34m~\x1b[00m# "
+COMMANDS = ["ls -la", "cd /var/log", "tail -n 50 syslog", "df -h", "free -m"]
+# re 的编译缓存让同一用户名的提示符正则在会话间共享，两边都用同一个对象
+PROMPT_PATTERN = build_prompt_pattern("root")
+
+
+def legacy_session(user_id: str, conn_id: str) -> dict:
+    """基线版本的 conn_info 字典（仅用于对比）：每个会话持有自己查询出的 Connection ORM 对象"""
+    conn = Connection(
+        id=conn_id, user_id=user_id, name="web-01", group_name="default", host="10.0.0.1", port=22,
+        protocol="ssh", auth_method="password", username="root", password="gAAAAABencrypted-password"
+    )
+    return {
+        "ssh_conn": None,
+        "ssh_process": None,
+        "connection": conn,
+        "session_log_id": str(uuid.uuid4()),
+        # handler 的数据库会话，新版本同样存在（只是不放进会话状态），不计入
+        "db": None,
+        "commands_log": [
+            {"command": cmd, "timestamp": datetime.now().isoformat()} for cmd in COMMANDS
+        ],
+        "prompt_pattern": PROMPT_PATTERN,
+        "watching_command": False,
+        "command_output_buffer": "",
+        "last_output_time": time.time(),
+        "watch_start_time": 0.0,
+        "interactive_state": None,
+        "interactive_notified": False,
+        "output_task": None,
+    }
+
+
+def new_session(user_id: str, conn_id: str, screen: bool = True) -> TerminalSession:
+    terminal_screen = None
+    if screen:
+        terminal_screen = TerminalScreen(120, 30)
+        terminal_screen.feed(PROMPT)
+    session = TerminalSession(
+        str(uuid.uuid4()), user_id, conn_id, "10.0.0.1", "root",
+        session_log_id=str(uuid.uuid4()), prompt_pattern=PROMPT_PATTERN, screen=terminal_screen
+    )
+    for cmd in COMMANDS:
+        session.log_command(cmd)
+    return session
+
+
+def measure(factory, count: int) -> dict:
+    user_id, conn_id = str(uuid.uuid4()), str(uuid.uuid4())
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    sessions = [factory(user_id, conn_id) for _ in range(count)]
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "bytes/session": current / count,
+        "peak MB": peak / 1e6,
+        "create us/session": elapsed * 1e6 / count,
+    }
+    if isinstance(sessions[0], TerminalSession):
+        result["estimate bytes"] = sessions[0].memory_usage()["total"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10000)
+    args = parser.parse_args()
+
+    results = {
+        "baseline conn_info": measure(legacy_session, args.sessions),
+        "TerminalSession": measure(lambda u, c: new_session(u, c, screen=False), args.sessions),
+        "TerminalSession + screen": measure(new_session, args.sessions),
+    }
+    for name, stats in results.items():
+        print(name)
+        for key, value in stats.items():
+            print(f"  {key:<18} {value:12.1f}")
+
+    per_session = results["TerminalSession + screen"]["bytes/session"]
+    verdict = "OK" if per_session <= SESSION_MEMORY_BUDGET else "OVER BUDGET"
+    print(f"budget {SESSION_MEMORY_BUDGET} bytes/session: {verdict}")
+
+
+if __name__ == "__main__":
+    main()
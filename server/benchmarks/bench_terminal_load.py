@@ -0,0 +1,555 @@
+"""
+终端负载基准：本地 SSH 服务端 + N 个模拟 WebSocket 客户端，整条链路离线跑在一台机器上
+- 本进程起一个 asyncssh 服务端，每个 PTY 会话是一个脚本化 shell：带颜色的提示符、逐字符回显、
+  bulk（大量日志输出）、pager（--More-- 分页）、confirm（[Y/n] 确认），命令行与真实 shell 的行为一致
+- 后端以 uvicorn 子进程启动（临时 SQLite 库，预先写入用户和连接），
+  客户端走 /api/ws/terminal：connect、逐键输入（带 seq）、watch_command、resize
+- 汇总：维持住的会话数、输出吞吐、回显延迟分位数（客户端往返 / 服务端 server_ms）、
+  结束与交互检测延迟（客户端看到提示符/分页提示 → 收到 command_finished/interactive_detected）、
+  后端进程每会话 RSS 与 CPU 占用
+后端子进程继承当前环境变量，可用来对比配置（如 TERMINAL_BROKER_SOCKETS、TERMINAL_SCREEN_EMULATION）。
+
+用法: python -m benchmarks.bench_terminal_load [--sessions 50] [--duration 30] [--ramp 20]
+                                              [--bulk-kb 256] [--think-ms 500] [--binary] [--seed 1]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import asyncssh
+import httpx
+import websockets
+
+USERNAME = "bench"
+PASSWORD = "bench"
+HOSTNAME = "loadhost"
+PROMPT = f"\x1b[01;32m{USERNAME}@{HOSTNAME}\x1b[00m:\x1b[01;34m~\x1b[00m$ "
+# 客户端据此判断提示符/分页/确认提示已出现（检测延迟的起点）
+PROMPT_MARKER = "\x1b[00m$ "
+PAGER_MARKER = "--More--"
+CONFIRM_MARKER = "[Y/n] "
+BANNER = "Last login: Mon Jan  1 12:00:00 2024 from 10.0.0.1\r\n"
+LOG_LINE = "2024-01-01 12:00:00 \x1b[32mINFO\x1b[0m worker[42]: processed request id=abcdef in 3ms\r\n"
+PAGE_LINES = 40
+PAGES = 3
+TYPED_COMMANDS = ["uptime", "whoami", "ls -la /var/log", "df -h", "free -m", "ps aux"]
+# 各步骤的权重
+STEPS = {"type": 5, "bulk": 2, "pager": 1, "confirm": 1, "resize": 1}
+ECHO_TIMEOUT = 5.0
+CONNECT_TIMEOUT = 30.0
+COMMAND_TIMEOUT = 60.0
+BULK_TIMEOUT = 180.0
+
+
+# ==================== 脚本化 shell ====================
+
+class BenchServer(asyncssh.SSHServer):
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return username == USERNAME and password == PASSWORD
+
+
+class ScriptedShell:
+    """无行编辑器的 PTY 会话：逐字符回显，回车执行一行"""
+
+    def __init__(self, process: asyncssh.SSHServerProcess):
+        self.process = process
+        self.pending = bytearray()
+
+    def write(self, text: str):
+        self.process.stdout.write(text.encode())
+
+    async def getc(self) -> bytes:
+        while not self.pending:
+            try:
+                data = await self.process.stdin.read(1024)
+            except asyncssh.TerminalSizeChanged:
+                continue
+            if not data:
+                raise EOFError
+            self.pending += data
+        c = bytes(self.pending[:1])
+        del self.pending[:1]
+        return c
+
+    async def readline(self) -> str:
+        line = bytearray()
+        while True:
+            c = await self.getc()
+            if c in (b"\r", b"\n"):
+                self.write("\r\n")
+                return line.decode(errors="replace")
+            if c == b"\x7f":
+                if line:
+                    line.pop()
+                    self.write("\b \b")
+            elif c == b"\x03":
+                self.write("^C\r\n")
+                return ""
+            else:
+                line += c
+                self.process.stdout.write(c)
+
+    async def run(self):
+        self.write(BANNER + PROMPT)
+        try:
+            while True:
+                line = (await self.readline()).strip()
+                if line:
+                    await self.execute(line)
+                self.write(PROMPT)
+        except (EOFError, asyncssh.Error, OSError):
+            pass
+        finally:
+            self.process.exit(0)
+
+    async def execute(self, line: str):
+        name, _, arg = line.partition(" ")
+        if name == "bulk":
+            remaining = int(arg or 65536)
+            block = LOG_LINE * (32768 // len(LOG_LINE) + 1)
+            while remaining > 0:
+                chunk = block[:remaining]
+                self.write(chunk)
+                remaining -= len(chunk)
+                await self.process.stdout.drain()
+        elif name == "pager":
+            for page in range(PAGES):
+                self.write("".join(f"line {page * PAGE_LINES + i + 1}: lorem ipsum dolor sit amet\r\n" for i in range(PAGE_LINES)))
+                if page == PAGES - 1:
+                    break
+                self.write(f"\x1b[7m{PAGER_MARKER}({(page + 1) * 100 // PAGES}%)\x1b[m")
+                key = await self.getc()
+                self.write("\r\x1b[K")
+                if key == b"q":
+                    break
+        elif name == "confirm":
+            self.write(f"After this operation, 12.3 MB of additional disk space will be used.\r\nDo you want to continue? {CONFIRM_MARKER}")
+            answer = (await self.readline()).strip().lower()
+            self.write("Done.\r\n" if answer in ("", "y", "yes") else "Abort.\r\n")
+        elif name == "sleep":
+            await asyncio.sleep(float(arg or 1))
+        else:
+            self.write(f"{line}: ok\r\n")
+
+
+async def handle_process(process: asyncssh.SSHServerProcess):
+    if process.command:
+        process.stdout.write(b"ok\n")
+        process.exit(0)
+        return
+    await ScriptedShell(process).run()
+
+
+# ==================== 后端子进程 ====================
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def read_cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def start_backend(workdir: str, db_url: str, sessions: int) -> tuple:
+    port = free_port()
+    # DEBUG 打开 SQL 回显，压测时默认关闭（环境变量里显式设置的为准）
+    env = {"DEBUG": "false", **os.environ, "DATABASE_URL": db_url, "TERMINAL_MAX_SESSIONS": str(sessions + 10)}
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(300):
+            if process.poll() is not None:
+                raise RuntimeError(f"backend exited, see {log.name}")
+            try:
+                await client.get("/docs")
+                return process, base_url
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"backend did not start, see {log.name}")
+
+
+async def seed_account(db_url: str, ssh_port: int) -> tuple:
+    """
+    直接写库创建管理员和指向本地 SSH 服务端的连接，签发令牌；返回 (token, connection_id)
+    不走注册/登录接口，省掉 bcrypt；管理员身份用于压测结束后读取统计接口。
+    配置在导入时读取，所以 app 模块在设置 DATABASE_URL 之后才导入。
+    """
+    os.environ["DATABASE_URL"] = db_url
+    os.environ.setdefault("DEBUG", "false")
+    from app.database import AsyncSessionLocal, engine, init_db
+    from app.models.connection import Connection
+    from app.models.user import User
+    from app.routes.auth import create_access_token
+
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        user = User(username=USERNAME, email=f"{USERNAME}@example.com", password="!", role="admin", is_active=True)
+        db.add(user)
+        await db.flush()
+        conn = Connection(
+            user_id=user.id, name="load", host="127.0.0.1", port=ssh_port,
+            username=USERNAME, password=PASSWORD, auth_method="password"
+        )
+        db.add(conn)
+        await db.commit()
+        connection_id = conn.id
+    await engine.dispose()
+    return create_access_token({"sub": USERNAME}), connection_id
+
+
+async def fetch_stats(base_url: str, token: str, name: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        r = await client.get(f"/api/ws/terminal/stats/{name}", headers={"Authorization": f"Bearer {token}"})
+        r.raise_for_status()
+        return r.json()
+
+
+# ==================== 模拟客户端 ====================
+
+class SessionLost(Exception):
+    pass
+
+
+class Results:
+    def __init__(self):
+        self.connect_ms = []
+        self.echo_client_ms = []
+        self.echo_server_ms = []
+        self.detect_ms = {"prompt": [], "pager": [], "confirm": []}
+        self.detections = Counter()
+        self.errors = Counter()
+        self.steps = Counter()
+        self.output_bytes = 0
+        self.attempted = 0
+        self.connected = 0
+        self.sustained = 0
+        self.active = 0
+        self.peak_active = 0
+
+
+class SyntheticClient:
+    def __init__(self, index: int, args, results: Results, all_attempted: asyncio.Event):
+        self.index = index
+        self.args = args
+        self.results = results
+        self.all_attempted = all_attempted
+        self.rng = random.Random(args.seed * 100003 + index)
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.echo_waiters = {}
+        self.seq = 0
+        self.marker = None
+        self.marker_at = None
+        self.tail = ""
+
+    # ---------- 接收 ----------
+
+    def _on_output(self, chunk, now: float):
+        self.results.output_bytes += len(chunk)
+        if self.marker is None:
+            return
+        text = chunk[-64:].decode("utf-8", "replace") if isinstance(chunk, bytes) else chunk[-64:]
+        self.tail = (self.tail + text)[-64:]
+        if self.marker_at is None and self.marker in self.tail:
+            self.marker_at = now
+
+    async def _reader(self, ws):
+        try:
+            async for message in ws:
+                now = time.perf_counter()
+                if isinstance(message, bytes):
+                    self._on_output(message, now)
+                    continue
+                data = json.loads(message)
+                kind = data.get("type")
+                if kind == "output":
+                    self._on_output(data.get("data", ""), now)
+                elif kind == "echo":
+                    waiter = self.echo_waiters.get(data.get("seq"))
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result((data.get("server_ms", 0.0), now))
+                elif kind in ("connected", "command_finished", "interactive_detected", "error", "disconnected"):
+                    data["_at"] = now
+                    self.events.put_nowait(data)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.events.put_nowait({"type": "closed", "_at": time.perf_counter()})
+
+    async def expect(self, kinds: set, timeout: float) -> dict:
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            event = await asyncio.wait_for(self.events.get(), remaining)
+            if event["type"] in kinds:
+                return event
+            if event["type"] in ("error", "disconnected", "closed"):
+                raise SessionLost(event.get("content") or event["type"])
+
+    # ---------- 动作 ----------
+
+    async def send(self, ws, message: dict):
+        await ws.send(json.dumps(message))
+
+    async def arm(self, ws, marker: str):
+        """开始监视命令：清空服务端监视缓冲区，记录下一次出现 marker 的时间"""
+        self.marker, self.marker_at, self.tail = marker, None, ""
+        await self.send(ws, {"type": "watch_command"})
+
+    async def finish(self, kinds: set, timeout: float, kind: str) -> dict:
+        event = await self.expect(kinds, timeout)
+        self.results.detections[event.get("detection") or event.get("interactive_type") or event["type"]] += 1
+        if self.marker_at is not None:
+            self.results.detect_ms[kind].append((event["_at"] - self.marker_at) * 1000)
+        self.marker = None
+        return event
+
+    async def type_text(self, ws, text: str):
+        samples = []
+        loop = asyncio.get_running_loop()
+        for ch in text:
+            self.seq += 1
+            waiter = loop.create_future()
+            self.echo_waiters[self.seq] = waiter
+            sent = time.perf_counter()
+            await self.send(ws, {"type": "data", "data": ch, "seq": self.seq})
+            try:
+                server_ms, at = await asyncio.wait_for(waiter, ECHO_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.results.errors["echo_timeout"] += 1
+                continue
+            finally:
+                self.echo_waiters.pop(self.seq, None)
+            client_ms = (at - sent) * 1000
+            self.results.echo_client_ms.append(client_ms)
+            self.results.echo_server_ms.append(server_ms)
+            samples.append(round(client_ms, 2))
+            await asyncio.sleep(self.rng.uniform(0.02, 0.12))
+        if samples:
+            await self.send(ws, {"type": "latency_report", "samples": samples})
+
+    async def step_type(self, ws):
+        await self.type_text(ws, self.rng.choice(TYPED_COMMANDS))
+        await self.arm(ws, PROMPT_MARKER)
+        await self.send(ws, {"type": "data", "data": "\r"})
+        await self.finish({"command_finished"}, COMMAND_TIMEOUT, "prompt")
+
+    async def step_bulk(self, ws):
+        await self.arm(ws, PROMPT_MARKER)
+        await self.send(ws, {"type": "data", "data": f"bulk {self.args.bulk_kb * 1024}\r"})
+        await self.finish({"command_finished"}, BULK_TIMEOUT, "prompt")
+
+    async def _answer(self, ws, command: str, marker: str, kind: str, answer: str):
+        await self.arm(ws, marker)
+        await self.send(ws, {"type": "data", "data": command + "\r"})
+        event = await self.finish({"interactive_detected", "command_finished"}, COMMAND_TIMEOUT, kind)
+        if event["type"] == "command_finished":
+            return
+        # 与 agent 的做法相同：重新开始监视再作答，提示符检测只看作答之后的输出
+        await self.arm(ws, PROMPT_MARKER)
+        await self.send(ws, {"type": "data", "data": answer})
+        await self.finish({"command_finished"}, COMMAND_TIMEOUT, "prompt")
+
+    async def step_pager(self, ws):
+        await self._answer(ws, "pager", PAGER_MARKER, "pager", "q")
+
+    async def step_confirm(self, ws):
+        await self._answer(ws, "confirm", CONFIRM_MARKER, "confirm", "y\r")
+
+    async def step_resize(self, ws):
+        await self.send(ws, {"type": "resize", "cols": self.rng.randint(80, 200), "rows": self.rng.randint(24, 60)})
+
+    # ---------- 会话 ----------
+
+    async def run(self, url: str, connection_id: str, ramp: asyncio.Semaphore, deadline: float):
+        results = self.results
+        ws = None
+        reader = None
+        try:
+            async with ramp:
+                results.attempted += 1
+                start = time.perf_counter()
+                try:
+                    ws = await websockets.connect(f"{url}load-{self.index}", max_size=None, ping_interval=None)
+                    reader = asyncio.create_task(self._reader(ws))
+                    await self.send(ws, {"type": "connect", "connection_id": connection_id, "binary": self.args.binary})
+                    await self.expect({"connected"}, CONNECT_TIMEOUT)
+                except (OSError, asyncio.TimeoutError, SessionLost, websockets.WebSocketException) as e:
+                    results.errors[f"connect: {type(e).__name__}"] += 1
+                    return
+                finally:
+                    if results.attempted == self.args.sessions:
+                        self.all_attempted.set()
+                results.connect_ms.append((time.perf_counter() - start) * 1000)
+                results.connected += 1
+                results.active += 1
+                results.peak_active = max(results.peak_active, results.active)
+
+            names, weights = list(STEPS), list(STEPS.values())
+            try:
+                while time.perf_counter() < deadline:
+                    step = self.rng.choices(names, weights)[0]
+                    await getattr(self, f"step_{step}")(ws)
+                    results.steps[step] += 1
+                    await asyncio.sleep(self.rng.uniform(0, self.args.think_ms / 1000))
+                results.sustained += 1
+            except SessionLost as e:
+                results.errors[f"lost: {e}"] += 1
+            except asyncio.TimeoutError:
+                results.errors["command_timeout"] += 1
+            except websockets.ConnectionClosed:
+                results.errors["lost: closed"] += 1
+            finally:
+                results.active -= 1
+        finally:
+            if ws is not None:
+                try:
+                    await self.send(ws, {"type": "disconnect"})
+                except websockets.ConnectionClosed:
+                    pass
+                await ws.close()
+            if reader is not None:
+                await reader
+
+
+# ==================== 汇总 ====================
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "n=0"
+    s = sorted(samples)
+
+    def pick(p):
+        return s[min(len(s) - 1, int(len(s) * p / 100))]
+
+    return f"n={len(s):<6} p50={pick(50):8.1f}  p90={pick(90):8.1f}  p99={pick(99):8.1f}  max={s[-1]:8.1f}"
+
+
+async def sample_rss(pid: int, peak: list, stop: asyncio.Event):
+    while not stop.is_set():
+        peak[0] = max(peak[0], read_rss(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_terminal_load_")
+    for name in ("asyncssh", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    key = asyncssh.generate_private_key("ssh-ed25519")
+    ssh_server = await asyncssh.create_server(
+        BenchServer, "127.0.0.1", 0, server_host_keys=[key],
+        process_factory=handle_process, encoding=None, line_editor=False
+    )
+    ssh_port = ssh_server.sockets[0].getsockname()[1]
+    db_url = f"sqlite+aiosqlite:///{workdir}/bench.db"
+    token, connection_id = await seed_account(db_url, ssh_port)
+    backend, base_url = await start_backend(workdir, db_url, args.sessions)
+    try:
+        url = base_url.replace("http://", "ws://") + f"/api/ws/terminal?token={token}&client_id="
+
+        rss_base = read_rss(backend.pid)
+        cpu_start = read_cpu_seconds(backend.pid)
+        results = Results()
+        all_attempted = asyncio.Event()
+        ramp = asyncio.Semaphore(args.ramp)
+        stop = asyncio.Event()
+        peak = [rss_base]
+        sampler = asyncio.create_task(sample_rss(backend.pid, peak, stop))
+
+        start = time.perf_counter()
+        deadline = start + args.duration
+        clients = [
+            asyncio.create_task(SyntheticClient(i, args, results, all_attempted).run(url, connection_id, ramp, deadline))
+            for i in range(args.sessions)
+        ]
+        await all_attempted.wait()
+        ramp_seconds = time.perf_counter() - start
+        rss_connected = read_rss(backend.pid)
+        await asyncio.gather(*clients)
+        elapsed = time.perf_counter() - start
+        cpu_seconds = read_cpu_seconds(backend.pid) - cpu_start
+        stop.set()
+        await sampler
+        # 会话全部断开后，后台任务应随之清零
+        await asyncio.sleep(1.0)
+        tasks = await fetch_stats(base_url, token, "tasks")
+        server_echo = (await fetch_stats(base_url, token, "echo-latency"))["overall"]
+    finally:
+        backend.terminate()
+        backend.wait()
+        ssh_server.close()
+
+    mb = results.output_bytes / 1e6
+    per_session = (rss_connected - rss_base) / results.connected if results.connected else 0
+    print(f"sessions        requested={args.sessions}  connected={results.connected}  sustained={results.sustained}  peak_active={results.peak_active}")
+    print(f"ramp            {ramp_seconds:.1f}s  connect ms {percentiles(results.connect_ms)}")
+    print(f"output          {mb:.1f} MB in {elapsed:.1f}s = {mb / elapsed:.2f} MB/s ({'binary' if args.binary else 'json'} frames)")
+    print(f"echo client ms  {percentiles(results.echo_client_ms)}")
+    print(f"echo server ms  {percentiles(results.echo_server_ms)}")
+    for kind, samples in results.detect_ms.items():
+        print(f"detect {kind:<8} {percentiles(samples)}")
+    print(f"detections      {dict(results.detections)}")
+    print(f"steps           {dict(results.steps)}")
+    print(f"backend RSS     base={rss_base / 1e6:.1f} MB  connected={rss_connected / 1e6:.1f} MB  peak={peak[0] / 1e6:.1f} MB  per_session={per_session / 1024:.1f} KiB")
+    print(f"backend CPU     {cpu_seconds:.1f}s = {cpu_seconds / elapsed:.2f} cores")
+    for kind in ("forward", "client_e2e", "loop_lag"):
+        h = server_echo.get(kind)
+        if h:
+            print(f"server {kind:<10} n={h['count']:<6} p50={h['p50_ms']:8.1f}  p90={h['p90_ms']:8.1f}  p99={h['p99_ms']:8.1f}  max={h['max_ms']:8.1f}")
+    # 剩下的应只有全局任务（调度器、采样、回收等），orphaned 非空说明会话任务泄漏
+    print(f"leftover tasks  sessions={tasks['sessions']}  by_name={tasks['tasks']['by_name']}  orphaned={tasks['tasks'].get('orphaned', {})}")
+    if results.errors:
+        print(f"errors          {dict(results.errors)}")
+    print(f"backend log     {os.path.join(workdir, 'server.log')}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of scripted activity per session")
+    parser.add_argument("--ramp", type=int, default=20, help="concurrent connects while ramping up")
+    parser.add_argument("--bulk-kb", type=int, default=256, help="output size of each bulk command")
+    parser.add_argument("--think-ms", type=float, default=500.0, help="max pause between steps")
+    parser.add_argument("--binary", action="store_true", help="receive output as binary frames")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+SSH 传输参数档案基准：各档案的握手耗时与大输出吞吐
+本地起一个 asyncssh 服务端（沙箱里通常没有 sshd），客户端走 open_ssh_connection 的真实建连路径。
+可选在中间插入一个模拟链路的 TCP 代理（单向时延 + 带宽上限），用来观察压缩和窗口大小在慢链路上的差别。
+
+用法: python -m benchmarks.bench_transport [--connects 10] [--mb 8] [--payload text|random]
+                                          [--delay-ms 0] [--kbps 0] [--profiles default,lan,wan]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import asyncssh
+
+from app.ws.ssh_connect import open_ssh_connection
+from app.ws.transport_profiles import available_profiles
+
+USERNAME = "bench"
+PASSWORD = "bench"
+LOG_LINE = b"2024-01-01 12:00:00 INFO worker[42]: processed request id=abcdef in 3ms\r\n"
+
+
+class BenchServer(asyncssh.SSHServer):
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return username == USERNAME and password == PASSWORD
+
+
+async def handle_process(process: asyncssh.SSHServerProcess):
+    """命令格式: <字节数> <text|random>"""
+    size, kind = process.command.split()
+    remaining = int(size)
+    block = (LOG_LINE * (32768 // len(LOG_LINE) + 1))[:32768] if kind == "text" else os.urandom(32768)
+    while remaining > 0:
+        chunk = block[:remaining]
+        process.stdout.write(chunk)
+        remaining -= len(chunk)
+        await process.stdout.drain()
+    process.exit(0)
+
+
+async def link_proxy(target_port: int, delay: float, bytes_per_sec: float) -> asyncio.AbstractServer:
+    """模拟链路：每个方向按到达时间 + 单向时延转发，并按带宽排队"""
+
+    async def pipe(reader, writer):
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def receive():
+            while True:
+                data = await reader.read(65536)
+                await queue.put((time.monotonic(), data))
+                if not data:
+                    return
+
+        async def deliver():
+            free_at = 0.0
+            while True:
+                arrived, data = await queue.get()
+                if not data:
+                    writer.close()
+                    return
+                now = time.monotonic()
+                start = max(arrived + delay, free_at, now)
+                if bytes_per_sec:
+                    free_at = start + len(data) / bytes_per_sec
+                    start = free_at
+                if start > now:
+                    await asyncio.sleep(start - now)
+                writer.write(data)
+                await writer.drain()
+
+        await asyncio.gather(receive(), deliver(), return_exceptions=True)
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        await asyncio.gather(
+            pipe(client_reader, server_writer),
+            pipe(server_reader, client_writer),
+            return_exceptions=True,
+        )
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def connect_params(port: int, profile: str) -> dict:
+    return {
+        "host": "127.0.0.1",
+        "port": port,
+        "username": USERNAME,
+        "auth_method": "password",
+        "password": PASSWORD,
+        "private_key": None,
+        "passphrase": None,
+        "transport_profile": profile,
+    }
+
+
+async def run_profile(port: int, profile: str, connects: int, size: int, payload: str) -> dict:
+    handshakes = []
+    for _ in range(connects):
+        start = time.perf_counter()
+        conn = await open_ssh_connection(connect_params(port, profile), timeout=60)
+        handshakes.append(time.perf_counter() - start)
+        conn.close()
+        await conn.wait_closed()
+
+    conn = await open_ssh_connection(connect_params(port, profile), timeout=60)
+    try:
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        process = await conn.create_process(f"{size} {payload}", encoding=None)
+        received = 0
+        while True:
+            data = await process.stdout.read(262144)
+            if not data:
+                break
+            received += len(data)
+        await process.wait()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+    finally:
+        conn.close()
+        await conn.wait_closed()
+
+    return {
+        "handshake p50 ms": statistics.median(handshakes) * 1000,
+        "handshake max ms": max(handshakes) * 1000,
+        "throughput MB/s": received / 1e6 / elapsed,
+        # 同一进程内含服务端开销，只用于档案间相对比较
+        "CPU ms per MB": cpu * 1000 / (received / 1e6),
+    }
+
+
+async def main_async(args) -> dict:
+    server_key = asyncssh.generate_private_key("ssh-ed25519")
+    server = await asyncssh.create_server(
+        BenchServer, "127.0.0.1", 0,
+        server_host_keys=[server_key],
+        process_factory=handle_process,
+        encoding=None,
+        compression_algs=["zlib@openssh.com", "zlib", "none"],
+    )
+    port = server.sockets[0].getsockname()[1]
+    proxy = None
+    if args.delay_ms or args.kbps:
+        proxy = await link_proxy(port, args.delay_ms / 2000, args.kbps * 1000 / 8)
+        port = proxy.sockets[0].getsockname()[1]
+
+    results = {}
+    try:
+        for profile in args.profiles.split(","):
+            results[profile] = await run_profile(port, profile, args.connects, int(args.mb * 1e6), args.payload)
+    finally:
+        if proxy:
+            proxy.close()
+        server.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connects", type=int, default=10)
+    parser.add_argument("--mb", type=float, default=8)
+    parser.add_argument("--payload", choices=("text", "random"), default="text")
+    parser.add_argument("--delay-ms", type=float, default=0, help="模拟往返时延（毫秒）")
+    parser.add_argument("--kbps", type=float, default=0, help="模拟带宽上限（kbit/s，0 为不限）")
+    parser.add_argument("--profiles", default=",".join(available_profiles()))
+    args = parser.parse_args()
+
+    asyncssh.set_log_level("WARNING")
+    results = asyncio.run(main_async(args))
+    for profile, stats in results.items():
+        print(profile)
+        for key, value in stats.items():
+            print(f"  {key:<18} {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
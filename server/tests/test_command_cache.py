@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from app.ws.command_cache import CommandAllowList, CommandResultCache
+from app.ws.command_timing import PendingCommand
+
+allow_list = CommandAllowList(["df", "cat", "systemctl status"])
+
+
+def test_allowed_command_is_normalized():
+    assert allow_list.normalize("df  -h") == "df -h"
+    assert allow_list.normalize("systemctl status nginx | cat") is not None
+
+
+def test_multi_line_input_is_refused():
+    assert allow_list.normalize("df -h\nreboot") is None
+    assert allow_list.normalize("cat a\nrm -rf /") is None
+    assert allow_list.normalize("df -h\r\nreboot") is None
+    assert allow_list.normalize("df -h\rreboot") is None
+
+
+def test_control_characters_are_refused():
+    assert allow_list.normalize("df\t-h") is None
+    assert allow_list.normalize("df -h\x00") is None
+    assert allow_list.normalize("df -h\x1b[A") is None
+
+
+def _cached_session():
+    cache = CommandResultCache(ttl=60, max_entries=16, allow_list=CommandAllowList(["systemctl status"]))
+    session = SimpleNamespace(connection_id="c1", host="h1", input_line="", timing=PendingCommand("systemctl status nginx"))
+    cache.store(session, "active (running)")
+    return cache, session
+
+
+def test_typed_mutating_command_invalidates_cache():
+    cache, session = _cached_session()
+    for key in "systemctl restart nginx":
+        cache.observe_input(session, key)
+    assert cache.lookup(session, "systemctl status nginx") is not None
+    cache.observe_input(session, "\r")
+    assert cache.lookup(session, "systemctl status nginx") is None
+
+
+def test_typed_allowed_command_keeps_cache():
+    cache, session = _cached_session()
+    for key in ["s", "y", "x", "\x7f", "stemctl status nginx", "\r"]:
+        cache.observe_input(session, key)
+    assert cache.lookup(session, "systemctl status nginx") is not None
+
+
+def test_unrecoverable_line_edit_invalidates_cache():
+    cache, session = _cached_session()
+    # 上箭头调出历史命令，服务端无法知道实际执行的是什么
+    cache.observe_input(session, "\x1b[A")
+    cache.observe_input(session, "\r")
+    assert cache.lookup(session, "systemctl status nginx") is None
@@ -0,0 +1,21 @@
+from app.ws.command_timing import command_family
+
+
+def test_prefix_options_with_arguments_are_skipped():
+    assert command_family("sudo -u postgres psql -c 'select 1'") == "psql"
+    assert command_family("sudo -g adm -u root tail -f /var/log/syslog") == "tail"
+    assert command_family("nice -n 10 tar czf backup.tgz /srv") == "tar"
+    assert command_family("env -u HOME LANG=C sort data.txt") == "sort"
+
+
+def test_tool_options_with_arguments_are_skipped():
+    assert command_family("git -C /repo status") == "git status"
+    assert command_family("git -c color.ui=never log -n 5") == "git log"
+    assert command_family("kubectl -n prod get pods") == "kubectl get"
+    assert command_family("sudo -u deploy git -C /srv/app pull") == "git pull"
+
+
+def test_plain_commands_are_unchanged():
+    assert command_family("FOO=1 /usr/bin/python3 manage.py migrate | tee log") == "python3"
+    assert command_family("sudo -E apt-get -y install nginx") == "apt-get install"
+    assert command_family("ls -la") == "ls"
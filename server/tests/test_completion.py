@@ -0,0 +1,27 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.ws.completion import CompletionCache
+
+
+class FakeConnection:
+    def __init__(self):
+        self.commands = []
+
+    async def run(self, command, **kwargs):
+        self.commands.append(command)
+        return SimpleNamespace(stdout="  -l  use a long listing format\n  --all  do not ignore entries\n")
+
+
+def test_option_completion_only_runs_allowed_commands():
+    cache = CompletionCache(ttl=60, max_entries=16, help_commands=["ls"])
+    conn = FakeConnection()
+
+    result = asyncio.run(cache.complete("h", conn, "./deploy.sh --"))
+    assert result["completions"] == []
+    assert conn.commands == []
+
+    result = asyncio.run(cache.complete("h", conn, "ls --"))
+    assert result["completions"] == ["--all"]
+    assert len(conn.commands) == 1
+    assert "command -p ls --help" in conn.commands[0]
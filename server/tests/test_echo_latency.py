@@ -0,0 +1,8 @@
+from types import SimpleNamespace
+
+from app.ws.echo_latency import echo_latency
+
+
+def test_report_ignores_values_that_are_not_finite_milliseconds():
+    session = SimpleNamespace(client_id="c1", host="h1", connection_id="conn1")
+    assert echo_latency.on_report(session, [10 ** 400, "1e999", float("nan"), -5, "x", None, "12.5", 40]) == 2
@@ -0,0 +1,19 @@
+from app.ws.log_tail import LineFilter
+
+BLOCK = "worker ERROR ignored\r\nERROR disk\r\nread timeout\r\nFATAL oom\r\nok\r\n"
+
+
+def test_anchors_match_each_line():
+    line_filter = LineFilter(["^ERROR", "timeout$"], [])
+    assert line_filter.filter_block(BLOCK) == ["ERROR disk", "read timeout"]
+
+
+def test_leading_global_flag_is_scoped_to_its_pattern():
+    line_filter = LineFilter(["(?i)fatal", "^ok$"], ["(?i)OOM$"])
+    assert line_filter.filter_block(BLOCK) == ["ok"]
+
+
+def test_without_include_lines_are_stripped_of_cr():
+    assert LineFilter([], ["error"]).filter_block(BLOCK) == [
+        "worker ERROR ignored", "ERROR disk", "read timeout", "FATAL oom", "ok"
+    ]
@@ -0,0 +1,50 @@
+import asyncio
+import math
+
+from app.ws.command_cache import CommandAllowList
+from app.ws.probes import ProbeRunner, format_probe_results
+
+
+class FakeStdout:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def read(self, n):
+        chunk, self.data = self.data[:n], self.data[n:]
+        return chunk
+
+
+class FakeProcess:
+    def __init__(self, data: bytes):
+        self.stdout = FakeStdout(data)
+        self.exit_status = 0
+
+    async def wait_closed(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    async def create_process(self, command, **kwargs):
+        return FakeProcess(b"x" * 100 if command == "df" else b"ok\n")
+
+
+def make_runner() -> ProbeRunner:
+    return ProbeRunner(CommandAllowList(["df", "uptime"]), parallel=2, timeout=5.0, output_limit=10, max_commands=8)
+
+
+def test_truncated_output_is_not_reported_as_exit_0():
+    batch = asyncio.run(make_runner().run(FakeConnection(), ["df", "uptime"]))
+    truncated, ok = batch["results"]
+    assert truncated["status"] == "truncated" and truncated["exit_status"] is None
+    assert ok["status"] == "ok" and ok["exit_status"] == 0
+    assert "df  (truncated" in batch["context"]
+    assert "exit 0" not in format_probe_results([truncated])
+
+
+def test_invalid_timeout_falls_back_to_default():
+    for timeout in (-1.0, math.nan, 0):
+        batch = asyncio.run(make_runner().run(FakeConnection(), ["uptime"], timeout=timeout))
+        assert batch["results"][0]["status"] == "ok"
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from app.services.redaction import Redactor, build_detectors
+
+redactor = Redactor(build_detectors())
+
+
+@pytest.mark.parametrize("line, secret", [
+    ("export MY_LONG_APPLICATION_DB_PASSWORD=hunter2secret", "hunter2secret"),
+    ("AZURE_STORAGE_ACCOUNT_KEY=someSecretVal", "someSecretVal"),
+    ("export SPRING_DATASOURCE_PASSWORD=Tr0ub4dor&3", "Tr0ub4dor&3"),
+])
+def test_assignment_behind_long_identifier_is_redacted(line, secret):
+    result = redactor.redact(line)
+    assert secret not in result
+    assert "[REDACTED:assignment]" in result
+
+
+def test_high_entropy_token_is_still_redacted():
+    assert redactor.redact("key Zx8kP2qLm9Vn4Rt7Yw1Bc6Hd3Jf5Gs0A end") == "key [REDACTED:high_entropy] end"
+
+
+def test_plain_text_is_untouched():
+    line = "ls -la /usr/lib/x86_64-linux-gnu/libssl.so.3 MY_LONG_APPLICATION_SETTING_NAME"
+    assert redactor.redact(line) == line
+
+
+def test_mysql_inline_password_is_redacted():
+    assert redactor.redact("mysql -u root -pS3cretPass") == "mysql -u root -p[REDACTED:mysql_password]"
+    assert redactor.redact("ssh -p2222 host && mkdir -p /srv") == "ssh -p2222 host && mkdir -p /srv"
+
+
+def test_repeated_jwt_prefix_is_linear():
+    start = time.perf_counter()
+    redactor.redact("eyJ" * 40000)
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,45 @@
+from app.ws.triggers import TriggerRule, TriggerScanner, TriggerSet, validate_pattern
+
+
+class _Registry:
+    def __init__(self, trigger_set):
+        self.trigger_set = trigger_set
+
+    def current(self, user_id):
+        return self.trigger_set
+
+    def record_scan(self, chars, seconds):
+        pass
+
+
+def test_leading_global_flag_is_accepted():
+    assert validate_pattern("(?i)[0-9]+%", True) is None
+    assert validate_pattern("(?s)disk.{0,5}full", True) is None
+
+
+def test_invalid_regex_is_rejected():
+    assert validate_pattern("[0-9", True) is not None
+    assert validate_pattern("abc(?i)", True) is not None
+
+
+def test_global_flag_rule_compiles_with_other_rules():
+    rules = [
+        TriggerRule("1", "percent", "(?i)[0-9]+%", is_regex=True),
+        TriggerRule("2", "digits", "[0-9]{4}", is_regex=True),
+        TriggerRule("3", "oom", "Out of memory"),
+    ]
+    trigger_set = TriggerSet(rules)
+    hits = {rule.id for rule, *_ in trigger_set.scan("usage 95%\nport 8080\nout of memory\n", 0)}
+    assert hits == {"1", "2", "3"}
+
+
+def test_regex_match_across_chunks_is_reported_once(monkeypatch):
+    monkeypatch.setattr("app.ws.triggers.settings.TERMINAL_TRIGGER_COOLDOWN", 0)
+    rules = [TriggerRule("1", "error", r"ERROR:\s+(\w+)", is_regex=True), TriggerRule("2", "oom", "out of memory")]
+    text = "ok\nERROR:   diskfull now\nline out of memory here\n"
+    for size in (1, 3, 7):
+        scanner = TriggerScanner(_Registry(TriggerSet(rules)), "u")
+        events = [e for i in range(0, len(text), size) for e in scanner.feed(text[i:i + size])]
+        assert [(e["rule_id"], e["match"], e["count"]) for e in events] == [
+            ("1", "ERROR:   diskfull", 1), ("2", "out of memory", 1)
+        ]